@@ -1,4 +1,5 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+import click
 from flask_cors import CORS
 from bson import ObjectId
 from collections import defaultdict
@@ -11,30 +12,63 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import os
 import json
+import base64
+import gzip
+import sys
 import numpy as np
 import pandas as pd
 import logging
 import re
 import random
-from services.nlp_processor import AdvancedEducationalNLP
+from services.nlp_processor import AdvancedEducationalNLP, QUIZ_CONTEXT_CHARS
 
 # Advanced ML imports
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.preprocessing import StandardScaler, LabelEncoder
+import sklearn
 import joblib
 import pickle
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 # spaCy imports
 import spacy
 from spacy.matcher import Matcher, PhraseMatcher
 import asyncio
 
+from services.structured_logging import configure_logging, logging_stats
+
+# Configure logging before the services and db modules log anything at import
+configure_logging()
+
+from services.response_cache import ResponseCache, build_response_cache
+from services.llm_client import llm_client
+from services.model_registry import spacy_pipeline, spacy_registry
+from services.model_store import ModelArtifactStore, feature_schema_hash, training_data_fingerprint
+from services.job_queue import BackgroundJobQueue
+from services.feature_store import FeatureStore, state_features
+from services.analytics_queries import PlatformAnalyticsQueries
+from services.daily_stats import DailyStatsRollup
+from services.student_analytics import StudentAnalyticsStore, attempt_percentage, learning_streak
+from services.course_catalog import CourseCatalog, recommendation_score
+from services.content_jobs import ContentJobStore, TERMINAL_STATUSES
+from services.question_bank import QuestionBank, bucket_key, question_id, topic_key
+from services.topic_normalizer import TopicNormalizer
+from services.index_specs import check_query_patterns
+from services.attempt_import import AttemptImporter
+
 from db import (
-    users_col, courses_col, quizzes_col, attempts_col, events_col, profiles_col, templates_col, ensure_indexes
+    users_col, courses_col, quizzes_col, attempts_col, events_col, profiles_col, templates_col, cache_col, jobs_col, feature_state_col, daily_stats_col, analytics_snapshots_col, content_jobs_col, question_bank_col, topic_keys_col, ensure_indexes, pool_stats,
+    ensure_indexes_in_background, COLLECTIONS
 )
 
+# Build any missing indexes without delaying startup
+if os.getenv("INDEX_RECONCILE_ON_STARTUP", "1").lower() in ("1", "true", "yes"):
+    ensure_indexes_in_background()
+
 # Configure API
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
@@ -73,27 +107,13 @@ CORS(
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev_secret")
 
-# Initialize logger
-logging.basicConfig(level=logging.INFO)
+# Initialize logger (handlers are set up by configure_logging)
 logger = logging.getLogger(__name__)
+# One line per request; sampled through LOG_SAMPLE_RATES (http.requests=0.1 by default)
+request_logger = logging.getLogger("http.requests")
 
-# Initialize spaCy with proper error handling
-def load_spacy_model():
-    """Load the best available spaCy model"""
-    models = ["en_core_web_lg", "en_core_web_md", "en_core_web_sm"]
-    
-    for model_name in models:
-        try:
-            nlp = spacy.load(model_name)
-            logger.info(f"✅ Loaded spaCy model: {model_name}")
-            return nlp, model_name
-        except OSError:
-            continue
-    
-    logger.error("❌ No spaCy model found. Install with: python -m spacy download en_core_web_sm")
-    return None, None
-
-nlp, spacy_model = load_spacy_model()
+# spaCy: the best available model (lg, md, then sm) is loaded through
+# spacy_pipeline on first use, never at import
 
 # ========================================
 # ADVANCED ML PREDICTION SYSTEM
@@ -101,28 +121,105 @@ nlp, spacy_model = load_spacy_model()
 class AdvancedMLPredictor:
     """Advanced ML system using Random Forest for skill prediction"""
     
-    def __init__(self):
-        self.skill_classifier = RandomForestClassifier(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
-            min_samples_leaf=2,
-            random_state=42
-        )
-        self.performance_regressor = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=8,
-            min_samples_split=5,
-            random_state=42
-        )
-        self.scaler = StandardScaler()
-        self.label_encoder = LabelEncoder()
-        self.is_trained = False
+    def __init__(self, artifact_dir=None):
         self.feature_names = [
             'avg_score', 'completion_rate', 'total_attempts', 'time_consistency',
             'improvement_trend', 'topic_diversity', 'difficulty_progression',
             'error_patterns', 'study_frequency', 'engagement_score'
         ]
+        # Live models are held in one bundle so a retrain swaps them atomically
+        self._bundle = self._build_estimators()
+        self.is_trained = False
+        self.artifact_version = None
+        self.artifact_store = ModelArtifactStore(artifact_dir or os.getenv("ML_ARTIFACT_DIR", "ml_artifacts"))
+        self._train_lock = threading.Lock()
+    
+    def _build_estimators(self):
+        """Create a fresh, untrained set of models"""
+        return {
+            'skill_classifier': RandomForestClassifier(
+                n_estimators=100,
+                max_depth=10,
+                min_samples_split=5,
+                min_samples_leaf=2,
+                random_state=42
+            ),
+            'performance_regressor': RandomForestRegressor(
+                n_estimators=100,
+                max_depth=8,
+                min_samples_split=5,
+                random_state=42
+            ),
+            'scaler': StandardScaler(),
+            'label_encoder': LabelEncoder()
+        }
+    
+    @property
+    def skill_classifier(self):
+        return self._bundle['skill_classifier']
+    
+    @property
+    def performance_regressor(self):
+        return self._bundle['performance_regressor']
+    
+    @property
+    def scaler(self):
+        return self._bundle['scaler']
+    
+    @property
+    def label_encoder(self):
+        return self._bundle['label_encoder']
+    
+    def schema_hash(self):
+        """Hash of feature layout, model hyperparameters and sklearn version"""
+        estimators = self._build_estimators()
+        return feature_schema_hash(
+            self.feature_names,
+            {
+                'skill_classifier': estimators['skill_classifier'].get_params(),
+                'performance_regressor': estimators['performance_regressor'].get_params()
+            },
+            sklearn.__version__
+        )
+    
+    def _activate(self, bundle, version):
+        """Swap in a trained bundle with a single reference assignment"""
+        self._bundle = bundle
+        self.artifact_version = version
+        self.is_trained = True
+    
+    def load_current_artifact(self):
+        """Load the artifact named by the store's CURRENT pointer, if compatible"""
+        version = self.artifact_store.current_version()
+        if not version or ModelArtifactStore.schema_of(version) != self.schema_hash()[:12]:
+            return False
+        try:
+            self._activate(self.artifact_store.load(version), version)
+            logger.info(f"✅ Loaded ML artifact {version}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load ML artifact {version}: {e}")
+            return False
+    
+    def load_or_train(self, training_data=None):
+        """Load the artifact for this schema and data, training only if it is missing"""
+        with self._train_lock:
+            if training_data is None:
+                training_data = self._generate_synthetic_training_data()
+            version = ModelArtifactStore.version_for(
+                self.schema_hash(), training_data_fingerprint(training_data)
+            )
+            if self.is_trained and self.artifact_version == version:
+                return version
+            if self.artifact_store.exists(version):
+                try:
+                    self._activate(self.artifact_store.load(version), version)
+                    logger.info(f"✅ Loaded ML artifact {version}")
+                    return version
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not load ML artifact {version}, retraining: {e}")
+            self.train_model(training_data)
+            return self.artifact_version
         
     def extract_advanced_features(self, attempts, profile=None):
         """Extract comprehensive features from student data"""
@@ -149,6 +246,13 @@ class AdvancedMLPredictor:
         
         return np.array([features[name] for name in self.feature_names]).reshape(1, -1)
     
+    def features_from_state(self, state):
+        """Build the feature row from a maintained feature state instead of raw attempts"""
+        features = state_features(state) if state else None
+        if features is None:
+            return np.array([0] * len(self.feature_names)).reshape(1, -1)
+        return np.array([features[name] for name in self.feature_names]).reshape(1, -1)
+    
     def _calculate_time_consistency(self, attempts):
         """Calculate consistency in study timing"""
         if len(attempts) < 2:
@@ -270,8 +374,8 @@ class AdvancedMLPredictor:
         
         return np.mean(engagement_factors)
     
-    def train_model(self, training_data=None):
-        """Train the Random Forest models"""
+    def train_model(self, training_data=None, persist=True):
+        """Train the Random Forest models and publish them as a new artifact"""
         if training_data is None:
             training_data = self._generate_synthetic_training_data()
         
@@ -279,43 +383,63 @@ class AdvancedMLPredictor:
         y_skill = [data['skill_level'] for data in training_data]
         y_performance = [data['performance_score'] for data in training_data]
         
+        # Train into a fresh bundle so live predictions keep using the old one
+        bundle = self._build_estimators()
+        
         # Encode skill levels
-        y_skill_encoded = self.label_encoder.fit_transform(y_skill)
+        y_skill_encoded = bundle['label_encoder'].fit_transform(y_skill)
         
         # Scale features
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = bundle['scaler'].fit_transform(X)
         
         # Train models
-        self.skill_classifier.fit(X_scaled, y_skill_encoded)
-        self.performance_regressor.fit(X_scaled, y_performance)
+        bundle['skill_classifier'].fit(X_scaled, y_skill_encoded)
+        bundle['performance_regressor'].fit(X_scaled, y_performance)
         
-        self.is_trained = True
-        logger.info("✅ Random Forest models trained successfully")
+        version = ModelArtifactStore.version_for(self.schema_hash(), training_data_fingerprint(training_data))
+        if persist:
+            try:
+                self.artifact_store.save(version, bundle)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not persist ML artifact {version}: {e}")
+        
+        self._activate(bundle, version)
+        logger.info(f"✅ Random Forest models trained successfully (artifact {version})")
         
         return {
-            'skill_accuracy': self.skill_classifier.score(X_scaled, y_skill_encoded),
-            'performance_r2': self.performance_regressor.score(X_scaled, y_performance)
+            'skill_accuracy': bundle['skill_classifier'].score(X_scaled, y_skill_encoded),
+            'performance_r2': bundle['performance_regressor'].score(X_scaled, y_performance),
+            'artifact_version': version
         }
     
     def predict_skill_level(self, attempts, profile=None):
         """Predict student skill level using Random Forest"""
+        return self.predict_from_features(self.extract_advanced_features(attempts, profile))
+    
+    def predict_skill_level_from_state(self, state):
+        """Predict skill level from a student's incremental feature state"""
+        return self.predict_from_features(self.features_from_state(state))
+    
+    def predict_from_features(self, features):
+        """Run the trained models on a single feature row"""
         if not self.is_trained:
-            self.train_model()
+            self.load_or_train()
         
-        features = self.extract_advanced_features(attempts, profile)
-        features_scaled = self.scaler.transform(features)
+        # Read the bundle once so a concurrent retrain cannot mix model versions
+        bundle = self._bundle
+        features_scaled = bundle['scaler'].transform(features)
         
         # Get prediction and confidence
-        skill_proba = self.skill_classifier.predict_proba(features_scaled)[0]
-        skill_prediction = self.skill_classifier.predict(features_scaled)[0]
-        performance_score = self.performance_regressor.predict(features_scaled)[0]
+        skill_proba = bundle['skill_classifier'].predict_proba(features_scaled)[0]
+        skill_prediction = bundle['skill_classifier'].predict(features_scaled)[0]
+        performance_score = bundle['performance_regressor'].predict(features_scaled)[0]
         
         # Convert back to label
-        skill_level = self.label_encoder.inverse_transform([skill_prediction])[0]
+        skill_level = bundle['label_encoder'].inverse_transform([skill_prediction])[0]
         confidence = np.max(skill_proba)
         
         # Feature importance for explainability
-        feature_importance = dict(zip(self.feature_names, self.skill_classifier.feature_importances_))
+        feature_importance = dict(zip(self.feature_names, bundle['skill_classifier'].feature_importances_))
         
         return {
             'predicted_level': skill_level,
@@ -324,13 +448,50 @@ class AdvancedMLPredictor:
             'feature_importance': feature_importance,
             'skill_probabilities': {
                 level: float(prob) for level, prob in zip(
-                    self.label_encoder.classes_, skill_proba
+                    bundle['label_encoder'].classes_, skill_proba
                 )
             }
         }
     
+    def predict_skill_levels_bulk(self, states):
+        """Predict many students at once from {student_id: feature_state}.
+
+        All rows go through the scaler and each forest in a single call; the
+        class is taken as the argmax of predict_proba, which is exactly what
+        RandomForestClassifier.predict does internally.
+        """
+        if not states:
+            return {}
+        if not self.is_trained:
+            self.load_or_train()
+        
+        bundle = self._bundle
+        student_ids = list(states)
+        features = np.vstack([self.features_from_state(states[sid]) for sid in student_ids])
+        features_scaled = bundle['scaler'].transform(features)
+        
+        skill_proba = bundle['skill_classifier'].predict_proba(features_scaled)
+        performance_scores = bundle['performance_regressor'].predict(features_scaled)
+        best = skill_proba.argmax(axis=1)
+        skill_levels = bundle['label_encoder'].inverse_transform(bundle['skill_classifier'].classes_[best])
+        level_names = list(bundle['label_encoder'].inverse_transform(bundle['skill_classifier'].classes_))
+        
+        results = {}
+        for row, sid in enumerate(student_ids):
+            results[sid] = {
+                'predicted_level': skill_levels[row],
+                'confidence': float(skill_proba[row, best[row]]),
+                'performance_score': float(performance_scores[row]),
+                'skill_probabilities': {
+                    level: float(prob) for level, prob in zip(level_names, skill_proba[row])
+                }
+            }
+        return results
+    
     def _generate_synthetic_training_data(self):
         """Generate synthetic training data for model initialization"""
+        # Fixed seed keeps the data fingerprint (and so the artifact version) stable
+        rng = np.random.RandomState(42)
         training_data = []
         
         # Generate samples for each skill level
@@ -338,48 +499,48 @@ class AdvancedMLPredictor:
             for i in range(100):  # 100 samples per level
                 if skill_level == 'beginner':
                     features = [
-                        np.random.normal(0.4, 0.15),  # avg_score
-                        np.random.normal(0.6, 0.2),   # completion_rate
-                        np.random.randint(1, 10),     # total_attempts
-                        np.random.uniform(0.3, 0.7),  # time_consistency
-                        np.random.normal(-0.1, 0.2),  # improvement_trend
-                        np.random.randint(1, 3),      # topic_diversity
-                        np.random.uniform(0.2, 0.5),  # difficulty_progression
-                        np.random.uniform(0.3, 0.6),  # error_patterns
-                        np.random.uniform(0.4, 0.7),  # study_frequency
-                        np.random.uniform(0.3, 0.6)   # engagement_score
+                        rng.normal(0.4, 0.15),  # avg_score
+                        rng.normal(0.6, 0.2),   # completion_rate
+                        rng.randint(1, 10),     # total_attempts
+                        rng.uniform(0.3, 0.7),  # time_consistency
+                        rng.normal(-0.1, 0.2),  # improvement_trend
+                        rng.randint(1, 3),      # topic_diversity
+                        rng.uniform(0.2, 0.5),  # difficulty_progression
+                        rng.uniform(0.3, 0.6),  # error_patterns
+                        rng.uniform(0.4, 0.7),  # study_frequency
+                        rng.uniform(0.3, 0.6)   # engagement_score
                     ]
-                    performance = np.random.normal(45, 10)
+                    performance = rng.normal(45, 10)
                 
                 elif skill_level == 'intermediate':
                     features = [
-                        np.random.normal(0.7, 0.1),   # avg_score
-                        np.random.normal(0.8, 0.1),   # completion_rate
-                        np.random.randint(8, 25),     # total_attempts
-                        np.random.uniform(0.5, 0.8),  # time_consistency
-                        np.random.normal(0.1, 0.15),  # improvement_trend
-                        np.random.randint(2, 5),      # topic_diversity
-                        np.random.uniform(0.5, 0.8),  # difficulty_progression
-                        np.random.uniform(0.6, 0.8),  # error_patterns
-                        np.random.uniform(0.6, 0.9),  # study_frequency
-                        np.random.uniform(0.6, 0.8)   # engagement_score
+                        rng.normal(0.7, 0.1),   # avg_score
+                        rng.normal(0.8, 0.1),   # completion_rate
+                        rng.randint(8, 25),     # total_attempts
+                        rng.uniform(0.5, 0.8),  # time_consistency
+                        rng.normal(0.1, 0.15),  # improvement_trend
+                        rng.randint(2, 5),      # topic_diversity
+                        rng.uniform(0.5, 0.8),  # difficulty_progression
+                        rng.uniform(0.6, 0.8),  # error_patterns
+                        rng.uniform(0.6, 0.9),  # study_frequency
+                        rng.uniform(0.6, 0.8)   # engagement_score
                     ]
-                    performance = np.random.normal(75, 8)
+                    performance = rng.normal(75, 8)
                 
                 else:  # pro
                     features = [
-                        np.random.normal(0.9, 0.05),  # avg_score
-                        np.random.normal(0.95, 0.05), # completion_rate
-                        np.random.randint(20, 50),    # total_attempts
-                        np.random.uniform(0.7, 0.95), # time_consistency
-                        np.random.normal(0.2, 0.1),   # improvement_trend
-                        np.random.randint(4, 8),      # topic_diversity
-                        np.random.uniform(0.8, 1.0),  # difficulty_progression
-                        np.random.uniform(0.8, 0.95), # error_patterns
-                        np.random.uniform(0.8, 1.0),  # study_frequency
-                        np.random.uniform(0.8, 0.95)  # engagement_score
+                        rng.normal(0.9, 0.05),  # avg_score
+                        rng.normal(0.95, 0.05), # completion_rate
+                        rng.randint(20, 50),    # total_attempts
+                        rng.uniform(0.7, 0.95), # time_consistency
+                        rng.normal(0.2, 0.1),   # improvement_trend
+                        rng.randint(4, 8),      # topic_diversity
+                        rng.uniform(0.8, 1.0),  # difficulty_progression
+                        rng.uniform(0.8, 0.95), # error_patterns
+                        rng.uniform(0.8, 1.0),  # study_frequency
+                        rng.uniform(0.8, 0.95)  # engagement_score
                     ]
-                    performance = np.random.normal(92, 5)
+                    performance = rng.normal(92, 5)
                 
                 # Ensure values are in valid ranges
                 features = [max(0, min(1, f)) if i < 7 else f for i, f in enumerate(features)]
@@ -393,8 +554,10 @@ class AdvancedMLPredictor:
         
         return training_data
     
-    def get_learning_recommendations(self, prediction_result, attempts):
+    def get_learning_recommendations(self, prediction_result, attempts=None, topic_count=None):
         """Generate personalized learning recommendations"""
+        if topic_count is None:
+            topic_count = len(set(a.get('topic') for a in attempts or []))
         skill_level = prediction_result['predicted_level']
         feature_importance = prediction_result['feature_importance']
         
@@ -431,13 +594,126 @@ class AdvancedMLPredictor:
         if feature_importance['time_consistency'] > 0.15:
             recommendations.append("Establish a regular study schedule for better learning outcomes")
         
-        if feature_importance['topic_diversity'] > 0.1 and len(set(a.get('topic') for a in attempts)) < 3:
+        if feature_importance['topic_diversity'] > 0.1 and topic_count < 3:
             recommendations.append("Explore different topics to broaden your knowledge base")
         
         return recommendations[:5]  # Return top 5 recommendations
 
-# Initialize ML Predictor
+# Initialize ML Predictor (load the published artifact; training happens lazily)
 ml_predictor = AdvancedMLPredictor()
+ml_predictor.load_current_artifact()
+
+# Per-student running feature state, updated on every quiz submit
+feature_store = FeatureStore(feature_state_col, attempts_col)
+
+# Per-day platform counters, updated on signup and quiz submit
+daily_stats = DailyStatsRollup(daily_stats_col)
+
+# Per-student dashboard snapshot served by /api/analytics/me
+analytics_store = StudentAnalyticsStore(analytics_snapshots_col, attempts_col)
+
+# ========================================
+# BACKGROUND JOBS
+# ========================================
+job_queue = BackgroundJobQueue(
+    outbox=jobs_col,
+    num_workers=int(os.getenv("JOB_WORKERS", 2)),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 3)),
+    lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", 300))
+)
+
+def apply_skill_prediction(user_id, prediction_result):
+    """Store a skill prediction on the student's profile"""
+    profiles_col.find_one_and_update(
+        {"studentId": user_id},
+        {
+            "$set": {
+                "profile.skillLevel": prediction_result['predicted_level'],
+                "performanceMetrics.averageScore": prediction_result['performance_score'],
+                "lastPrediction": {
+                    "predictedAt": datetime.now(timezone.utc).isoformat(),
+                    "confidence": prediction_result['confidence'],
+                    "model": "RandomForest"
+                }
+            }
+        }
+    )
+
+def refresh_skill_prediction(payload):
+    """Re-predict a student's skill level from their feature state"""
+    user_id = payload["user_id"]
+    state = feature_store.get(user_id)
+    if state["count"] < 3:
+        return
+
+    apply_skill_prediction(user_id, ml_predictor.predict_skill_level_from_state(state))
+
+job_queue.register("skill_refresh", refresh_skill_prediction)
+
+# Bulk attempt imports skip the per-submit updates; these catch up afterwards
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_RECOMPUTE_CHUNK = int(os.getenv("IMPORT_RECOMPUTE_CHUNK", 5000))
+
+def recompute_imported_students(payload):
+    """Rebuild feature state and snapshots for imported students, then re-predict them in one pass"""
+    user_ids = payload["user_ids"]
+    states = feature_store.rebuild_many(user_ids)
+    analytics_store.rebuild_many(user_ids)
+
+    eligible = {user_id: state for user_id, state in states.items() if state["count"] >= 3}
+    predictions = ml_predictor.predict_skill_levels_bulk(eligible)
+    for user_id, prediction in predictions.items():
+        apply_skill_prediction(user_id, prediction)
+    logger.info(f"✅ Recomputed {len(states)} imported students ({len(predictions)} predictions)")
+    return len(states)
+
+def backfill_imported_days(payload):
+    """Rebuild daily stats back to the oldest imported attempt, up to the day the import ran"""
+    until = datetime.fromisoformat(payload["until"]) if payload.get("until") else None
+    return daily_stats.backfill(users_col, attempts_col, days=payload.get("days"), until=until)
+
+job_queue.register("import_recompute", recompute_imported_students)
+job_queue.register("import_daily_stats", backfill_imported_days)
+
+def import_stats_cutoff():
+    """Start of the UTC day an import runs on; earlier days are backfilled, later ones incremented"""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def count_recent_imports(cutoff):
+    """on_inserted hook: $inc daily stats for imported attempts on or after cutoff.
+
+    The backfill never rewrites the current day (live submits are $inc-ing
+    it), so those attempts are folded in the same way a submit would be.
+    """
+    def on_inserted(attempts):
+        recent = [attempt for attempt in attempts if attempt["submitted_at"] >= cutoff]
+        if recent:
+            daily_stats.record_attempts(recent)
+    return on_inserted
+
+def import_backfill_days(report, cutoff):
+    """Whole days before cutoff that an import touched, or None if it only touched cutoff's day onwards"""
+    first = report["first_submitted_at"]
+    if first is None or first >= cutoff:
+        return None
+    return (cutoff - first).days + 1
+
+def top_up_question_bank(payload):
+    """Generate a batch of questions for an underfilled question bank bucket"""
+    if not can_bank_questions():
+        return
+    generated = generate_ai_quiz_questions(
+        payload["topic"], payload["category"], payload["language"],
+        payload["difficulty"], QUESTION_BANK_TOPUP_SIZE, payload["choices"]
+    )
+    added = question_bank.add(
+        generated, payload["topic"], payload["category"], payload["difficulty"],
+        payload["choices"], payload["language"], source=quiz_model_label(),
+        key=payload.get("topic_key")
+    )
+    logger.info(f"✅ Question bank top-up for {payload['topic']} ({payload['difficulty']}): {added} new questions")
+
+job_queue.register("question_bank_topup", top_up_question_bank)
 
 # ========================================
 # ADVANCED NLP CONTENT PROCESSOR
@@ -445,16 +721,39 @@ ml_predictor = AdvancedMLPredictor()
 class AdvancedNLPProcessor:
     """Advanced NLP processor using spaCy for content analysis and generation"""
     
-    def __init__(self, nlp_model=None):
-        self.nlp = nlp_model
-        self.matcher = Matcher(nlp_model.vocab) if nlp_model else None
-        self.phrase_matcher = PhraseMatcher(nlp_model.vocab) if nlp_model else None
-        self._setup_patterns()
-        
-    def _setup_patterns(self):
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self._matchers = None
+        self._matchers_lock = threading.Lock()
+    
+    @property
+    def nlp(self):
+        return self.pipeline.nlp
+    
+    @property
+    def matcher(self):
+        return self._ensure_matchers()[0]
+    
+    @property
+    def phrase_matcher(self):
+        return self._ensure_matchers()[1]
+    
+    def _ensure_matchers(self):
+        """Build the matchers the first time the pipeline is needed"""
+        if self._matchers is None:
+            with self._matchers_lock:
+                if self._matchers is None:
+                    nlp_model = self.nlp
+                    if nlp_model:
+                        matcher = Matcher(nlp_model.vocab)
+                        self._setup_patterns(matcher)
+                        self._matchers = (matcher, PhraseMatcher(nlp_model.vocab))
+                    else:
+                        self._matchers = (None, None)
+        return self._matchers
+    
+    def _setup_patterns(self, matcher):
         """Setup spaCy patterns for educational content analysis"""
-        if not self.nlp or not self.matcher:
-            return
         
         # Educational concept patterns
         concept_patterns = [
@@ -477,8 +776,8 @@ class AdvancedNLPProcessor:
         ]
         
         # Add patterns to matcher
-        self.matcher.add("EDUCATIONAL_CONCEPTS", concept_patterns)
-        self.matcher.add("PROCESS_STEPS", process_patterns)
+        matcher.add("EDUCATIONAL_CONCEPTS", concept_patterns)
+        matcher.add("PROCESS_STEPS", process_patterns)
     
     def analyze_content_structure(self, text):
         """Analyze educational content structure using spaCy"""
@@ -811,7 +1110,7 @@ For expert-level implementation, consider these technical aspects:
         return content
 
 # Initialize NLP Processor
-nlp_processor = AdvancedNLPProcessor(nlp)
+nlp_processor = AdvancedNLPProcessor(spacy_pipeline)
 
 # ========================================
 # AUTHENTICATION FUNCTIONS
@@ -945,6 +1244,11 @@ def signup():
     res = users_col.insert_one(user_doc)
     user_id = str(res.inserted_id)
     
+    try:
+        daily_stats.record_signup(user_doc["created_at"])
+    except Exception as e:
+        logger.warning(f"Could not update daily stats: {e}")
+    
     token = create_token(user_id, email, user_doc["role"])
     
     return {
@@ -1226,12 +1530,12 @@ def get_my_profile():
             # Use placement quiz result as primary skill level
             final_skill_level = saved_skill_level
             final_skill_confidence = saved_skill_confidence
-            print(f"🎯 Using placement quiz result: {final_skill_level}")
+            logger.debug("🎯 Using placement quiz result: %s", final_skill_level)
         else:
             # Use performance-based calculation for users who haven't done placement
             final_skill_level = performance_based_level
             final_skill_confidence = calculate_confidence(recent_scores) if 'recent_scores' in locals() and recent_scores else 0.5
-            print(f"📊 Using performance-based result: {final_skill_level}")
+            logger.debug("📊 Using performance-based result: %s", final_skill_level)
             
             # ✅ Update profile with performance-based skill level (only if no placement)
             try:
@@ -1327,14 +1631,7 @@ def get_student_profile(student_id):
         if current_user_id != student_id and request.user.get("role") not in ["teacher", "admin"]:
             return {"error": "Access denied"}, 403
         
-        profile = None
-        if hasattr(profiles_col, '_data'):
-            for doc in profiles_col._data:
-                if doc.get("studentId") == student_id:
-                    profile = doc
-                    break
-        else:
-            profile = profiles_col.find_one({"studentId": student_id})
+        profile = profiles_col.find_one({"studentId": student_id})
         
         if not profile:
             return {"error": "Profile not found. Create profile first using 'Create Student Profile' request."}, 404
@@ -1355,11 +1652,10 @@ def predict_student_level():
     try:
         user_id = request.user["uid"]
         
-        # Get student's performance data
-        student_attempts = list(attempts_col.find({"user_id": user_id}))
-        student_profile = profiles_col.find_one({"studentId": user_id})
+        # Get student's running feature state
+        feature_state = feature_store.get(user_id)
         
-        if not student_attempts:
+        if not feature_state["count"]:
             return {
                 "status": "success",
                 "predictedLevel": "beginner",
@@ -1369,7 +1665,7 @@ def predict_student_level():
             }
         
         # Use advanced ML prediction
-        prediction_result = ml_predictor.predict_skill_level(student_attempts, student_profile)
+        prediction_result = ml_predictor.predict_skill_level_from_state(feature_state)
         
         # Update student profile with prediction
         try:
@@ -1392,7 +1688,9 @@ def predict_student_level():
             logger.warning(f"Could not update profile: {e}")
         
         # Generate personalized recommendations
-        recommendations = ml_predictor.get_learning_recommendations(prediction_result, student_attempts)
+        recommendations = ml_predictor.get_learning_recommendations(
+            prediction_result, topic_count=len(feature_state["topics"])
+        )
         
         return {
             "status": "success",
@@ -1403,7 +1701,7 @@ def predict_student_level():
             "featureImportance": prediction_result['feature_importance'],
             "recommendations": recommendations,
             "model": "RandomForest",
-            "totalAttempts": len(student_attempts)
+            "totalAttempts": feature_state["count"]
         }
         
     except Exception as e:
@@ -1425,7 +1723,6 @@ def generate_placement_quiz():
     question_count = int(body.get("questionCount", 8))
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
         interests_text = ", ".join(interests) if interests else "general topics"
         
         prompt = f"""Create a placement assessment quiz for {department} field with focus on {interests_text}.
@@ -1451,8 +1748,7 @@ Return ONLY valid JSON:
   ]
 }}"""
         
-        response = model.generate_content(prompt)
-        ai_content = response.text.strip()
+        ai_content = llm_client.generate(prompt).strip()
         start = ai_content.find("{")
         end = ai_content.rfind("}")
         
@@ -1600,11 +1896,10 @@ def submit_placement_quiz():
             # Create new profile
             profiles_col.insert_one(profile_update)
             
-        print(f"✅ Profile updated: User {user_id} skill level set to {predicted_level}")
+        logger.info("✅ Profile updated", extra={"fields": {"user_id": user_id, "skill_level": predicted_level}})
         
     except Exception as e:
-        print(f"❌ Failed to update profile: {e}")
-        logger.error(f"Profile update failed: {e}")
+        logger.error(f"❌ Profile update failed: {e}")
     
     # Generate recommendations
     prediction_result = {
@@ -1633,66 +1928,52 @@ def submit_placement_quiz():
         "profileUpdated": True 
     }
 
-@app.route("/api/quiz/generate", methods=["POST"])
-@auth_required  
-def quiz_generate():
-    body = request.get_json(force=True)
-    print(f"🔍 Request body: {body}")
-    
-    # Validation
-    errors = validate_quiz_params(body)
-    if errors:
-        print(f"❌ Validation errors: {errors}")
-        return {"error": errors}, 400
+QUIZ_MODEL_NAME = 'gemini-2.5-flash'
+QUIZ_GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'top_p': 0.8,
+    'top_k': 40,
+    'max_output_tokens': 2048,
+}
+# Bump whenever build_quiz_prompt changes so stale cached quizzes are not served
+QUIZ_PROMPT_VERSION = 1
 
-    # Extract parameters
-    main_topic = body.get("mainTopic", "General Knowledge")
-    sub_topic = body.get("subTopic", "")
-    custom_topic = body.get("customTopic", "")
-    category = body.get("category", "Education")
-    
-    # Construct final topic
-    if custom_topic:
-        topic = custom_topic
-    elif sub_topic and main_topic:
-        topic = f"{main_topic} - {sub_topic}"
-    else:
-        topic = main_topic
+def quiz_model_label():
+    """Model recorded with generated quizzes; stand-in backends are namespaced"""
+    backend = llm_client.backend.name
+    return QUIZ_MODEL_NAME if backend == "gemini" else f"{backend}:{QUIZ_MODEL_NAME}"
 
-    questions = int(body.get("questions", 5))
-    choices = int(body.get("choices", 4))
-    language = body.get("language", "English")
+def can_bank_questions():
+    """Only questions from the real model go into the shared question bank"""
+    return llm_client.backend.name == "gemini"
 
-    # ✅ ALWAYS use profile skill level (ignore request difficulty)
-    user_id = request.user["uid"]
+quiz_cache = build_response_cache("quiz", collection=cache_col)
+
+# Canonical topic keys shared by the quiz/content caches and the question bank
+topic_normalizer = TopicNormalizer(
+    spacy_pipeline,
+    collection=topic_keys_col,
+    threshold=float(os.getenv("TOPIC_SIMILARITY_THRESHOLD", 0.88)),
+    min_overlap=float(os.getenv("TOPIC_MIN_OVERLAP", 0.5))
+)
+
+def canonical_topic(topic):
     try:
-        profile = profiles_col.find_one({"studentId": user_id})
-        if profile:
-            difficulty = profile.get('profile', {}).get('skillLevel', 'beginner')
-            print(f"✅ Using profile skill level: {difficulty}")
-        else:
-            difficulty = 'beginner'
-            print(f"⚠️ No profile found, using: beginner")
+        return topic_normalizer.canonical(topic)
     except Exception as e:
-        print(f"⚠️ Profile error: {e}")
-        difficulty = 'beginner'
-    
-    # Generate with AI
-    try:
-        print("🔄 Starting AI generation...")
-        
-        generationconfig = {
-        'temperature': 0.7,
-        'top_p': 0.8,
-        'top_k': 40,
-        'max_output_tokens': 2048,
-        }
-        model = genai.GenerativeModel('gemini-2.5-flash', generation_config=generationconfig) 
+        logger.warning(f"Topic normalization failed: {e}")
+        return topic_key(topic)
 
-        print(f"📝 Generating {questions} {difficulty} questions on: {topic}")
-        
-        # Enhanced prompt with JSON formatting instructions
-        prompt = f"""
+# Validated questions reused across students; buckets are refilled in the background
+question_bank = QuestionBank(
+    question_bank_col,
+    low_water=int(os.getenv("QUESTION_BANK_LOW_WATER", 0)) or None
+)
+QUESTION_BANK_TOPUP_SIZE = int(os.getenv("QUESTION_BANK_TOPUP_SIZE", 10))
+
+def build_quiz_prompt(topic, category, language, difficulty, questions, choices):
+    """Build the Gemini prompt for a practice quiz"""
+    prompt = f"""
 Create a multiple-choice quiz on the topic: "{topic}"
 
 Requirements:
@@ -1735,13 +2016,20 @@ IMPORTANT: Return ONLY valid JSON with no additional text, markdown, or formatti
   ]
 }}
 """
-        
-        print("🤖 Calling Gemini API...")
-        response = model.generate_content(prompt)
-        print(f"📥 AI Response received: {response.text[:100]}...")
-        
+    return prompt
+
+def generate_ai_quiz_questions(topic, category, language, difficulty, questions, choices):
+    """Generate and validate quiz questions with Gemini; raises on any failure"""
+    logger.debug("📝 Generating %d %s questions on: %s", questions, difficulty, topic)
+    prompt = build_quiz_prompt(topic, category, language, difficulty, questions, choices)
+
+    started = time()
+    response_text = llm_client.generate(prompt, model=QUIZ_MODEL_NAME, generation_config=QUIZ_GENERATION_CONFIG)
+    logger.debug("📥 AI response received: %d chars in %.2fs", len(response_text), time() - started)
+
+    try:
         # ✅ FIXED: Better JSON parsing with cleanup
-        ai_content = response.text.strip()
+        ai_content = response_text.strip()
         
         # Remove any markdown formatting if present
         if ai_content.startswith('``` json'):
@@ -1757,137 +2045,226 @@ IMPORTANT: Return ONLY valid JSON with no additional text, markdown, or formatti
             raise ValueError("No valid JSON found in AI response")
         
         json_content = ai_content[start:end]
-        print(f"🔍 Cleaned JSON content: {json_content[:200]}...")
         
         # Parse JSON
         ai_quiz = json.loads(json_content)
-        print(f"✅ Successfully parsed AI response")
 
         if "questions" not in ai_quiz or not isinstance(ai_quiz["questions"], list):
             raise ValueError("Invalid quiz structure: missing 'questions' array")
+    except Exception:
+        # The full response is only worth its cost when debugging prompts
+        logger.debug("🔍 Unparseable AI response: %s", response_text)
+        raise
 
-        # Validate questions
-        validated = []
-        for i, q in enumerate(ai_quiz.get("questions", [])):
-            try:
-                if (
-                    q.get("question") and 
-                    isinstance(q.get("choices"), list) and
-                    len(q["choices"]) == choices and
-                    q.get("answer") and 
-                    q["answer"] in q["choices"] and
-                    q.get("explanation")
-                ):
-                    # Clean up question data
-                    validated_q = {
-                        "question": str(q["question"]).strip(),
-                        "choices": [str(c).strip() for c in q["choices"]],
-                        "answer": str(q["answer"]).strip(),
-                        "explanation": str(q["explanation"]).strip()
-                    }
-                    validated.append(validated_q)
-                    print(f"✅ Question {i+1} validated")
-                else:
-                    print(f"❌ Question {i+1} failed validation: missing required fields")
-            except Exception as qe:
-                print(f"❌ Question {i+1} validation error: {qe}")
-                continue
+    # Validate questions
+    validated = []
+    for i, q in enumerate(ai_quiz.get("questions", [])):
+        try:
+            if (
+                q.get("question") and 
+                isinstance(q.get("choices"), list) and
+                len(q["choices"]) == choices and
+                q.get("answer") and 
+                q["answer"] in q["choices"] and
+                q.get("explanation")
+            ):
+                # Clean up question data
+                validated_q = {
+                    "question": str(q["question"]).strip(),
+                    "choices": [str(c).strip() for c in q["choices"]],
+                    "answer": str(q["answer"]).strip(),
+                    "explanation": str(q["explanation"]).strip()
+                }
+                validated.append(validated_q)
+            else:
+                logger.debug("❌ Question %d failed validation: missing required fields", i + 1)
+        except Exception as qe:
+            logger.debug("❌ Question %d validation error: %s", i + 1, qe)
+            continue
 
-        if len(validated) < questions:
-            raise ValueError(f"Insufficient valid questions: got {len(validated)}, need {questions}")
+    if len(validated) < questions:
+        raise ValueError(f"Insufficient valid questions: got {len(validated)}, need {questions}")
 
-        quiz = {
-            "topic": topic,
-            "category": category,
-            "difficulty": difficulty,
-            "questions": validated[:questions]
-        }
-        print(f"✅ SUCCESS: Using AI-generated quiz with {len(validated)} questions!")
-        
+    return validated[:questions]
+
+def generate_enhanced_fallback_questions(topic, category, questions, choices, difficulty):
+    """Template questions used when AI quiz generation fails"""
+    fallback = []
+    
+    # Topic-specific templates
+    if "machine learning" in topic.lower():
+        base_questions = [
+            f"What is the primary goal of machine learning?",
+            f"Which of the following is a supervised learning algorithm?",
+            f"What is overfitting in machine learning?",
+            f"Which metric is commonly used for classification problems?",
+            f"What is the difference between training and testing data?",
+            f"Which algorithm is best for linear relationships?",
+            f"What is feature engineering?",
+            f"Which of these is an unsupervised learning technique?",
+            f"What is cross-validation used for?",
+            f"Which activation function is commonly used in neural networks?"
+        ]
+        base_answers = [
+            ["To make predictions from data", "To store data", "To delete data", "To compress data"],
+            ["Linear Regression", "K-means", "PCA", "Apriori"],
+            ["Model performs well on training but poorly on new data", "Model is too simple", "Data is corrupted", "Algorithm is slow"],
+            ["Accuracy", "Mean", "Median", "Standard deviation"],
+            ["Training data is used to build model, testing data evaluates it", "No difference", "Testing data is larger", "Training data is newer"],
+            ["Linear Regression", "Decision Tree", "K-means", "Random Forest"],
+            ["Creating new features from existing data", "Deleting features", "Renaming features", "Copying features"],
+            ["Clustering", "Classification", "Regression", "Prediction"],
+            ["To validate model performance", "To clean data", "To visualize data", "To store data"],
+            ["ReLU", "Linear", "Step", "Constant"]
+        ]
+        explanations = [
+            "Machine learning aims to learn patterns from data to make accurate predictions on new, unseen data.",
+            "Linear regression is a supervised learning algorithm that learns from labeled training examples.",
+            "Overfitting occurs when a model memorizes training data but fails to generalize to new data.",
+            "Accuracy measures the percentage of correct predictions in classification tasks.",
+            "Training data teaches the model patterns, while testing data provides unbiased evaluation.",
+            "Linear regression is specifically designed to model linear relationships between variables.",
+            "Feature engineering involves transforming raw data into meaningful features for better model performance.",
+            "Clustering groups similar data points without using labeled examples (unsupervised).",
+            "Cross-validation provides robust performance estimates by testing on multiple data splits.",
+            "ReLU (Rectified Linear Unit) is widely used due to its simplicity and effectiveness in neural networks."
+        ]
+    else:
+        # Generic fallback
+        base_questions = [f"Sample question {i+1} on {topic} ({difficulty})" for i in range(10)]
+        base_answers = [[f"Option {chr(65+j)}" for j in range(choices)] for _ in range(10)]
+        explanations = [f"This is a fallback explanation for question {i+1}." for i in range(10)]
+    
+    for i in range(min(questions, len(base_questions))):
+        fallback.append({
+            "question": base_questions[i],
+            "choices": base_answers[i] if i < len(base_answers) else [f"Option {chr(65+j)}" for j in range(choices)],
+            "answer": base_answers[i] if i < len(base_answers) else "Option A",
+            "explanation": explanations[i] if i < len(explanations) else f"This is a fallback explanation for question {i+1}."
+        })
+    
+    # Fill remaining questions if needed
+    while len(fallback) < questions:
+        idx = len(fallback)
+        fallback.append({
+            "question": f"Additional question {idx+1} on {topic} ({difficulty})",
+            "choices": [f"Option {chr(65+j)}" for j in range(choices)],
+            "answer": "Option A",
+            "explanation": f"This is a fallback explanation for question {idx+1}."
+        })
+    
+    return fallback
+
+@app.route("/api/quiz/generate", methods=["POST"])
+@auth_required  
+def quiz_generate():
+    body = request.get_json(force=True)
+    
+    # Validation
+    errors = validate_quiz_params(body)
+    if errors:
+        logger.debug("❌ Quiz request rejected: %s", errors)
+        return {"error": errors}, 400
+
+    # Extract parameters
+    main_topic = body.get("mainTopic", "General Knowledge")
+    sub_topic = body.get("subTopic", "")
+    custom_topic = body.get("customTopic", "")
+    category = body.get("category", "Education")
+    
+    # Construct final topic
+    if custom_topic:
+        topic = custom_topic
+    elif sub_topic and main_topic:
+        topic = f"{main_topic} - {sub_topic}"
+    else:
+        topic = main_topic
+
+    questions = int(body.get("questions", 5))
+    choices = int(body.get("choices", 4))
+    language = body.get("language", "English")
+
+    # ✅ ALWAYS use profile skill level (ignore request difficulty)
+    user_id = request.user["uid"]
+    try:
+        profile = profiles_col.find_one({"studentId": user_id})
+        if profile:
+            difficulty = profile.get('profile', {}).get('skillLevel', 'beginner')
+        else:
+            difficulty = 'beginner'
     except Exception as e:
-        print(f"❌ ERROR: AI generation failed!")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Error message: {str(e)}")
-        
-        if 'response' in locals() and response:
-            print(f"🔍 Raw AI response: {response.text}")
-        
-        # ✅ FIXED: Enhanced fallback questions
-        def generate_enhanced_fallback_questions(topic, category, questions, choices, difficulty):
-            fallback = []
-            
-            # Topic-specific templates
-            if "machine learning" in topic.lower():
-                base_questions = [
-                    f"What is the primary goal of machine learning?",
-                    f"Which of the following is a supervised learning algorithm?",
-                    f"What is overfitting in machine learning?",
-                    f"Which metric is commonly used for classification problems?",
-                    f"What is the difference between training and testing data?",
-                    f"Which algorithm is best for linear relationships?",
-                    f"What is feature engineering?",
-                    f"Which of these is an unsupervised learning technique?",
-                    f"What is cross-validation used for?",
-                    f"Which activation function is commonly used in neural networks?"
-                ]
-                base_answers = [
-                    ["To make predictions from data", "To store data", "To delete data", "To compress data"],
-                    ["Linear Regression", "K-means", "PCA", "Apriori"],
-                    ["Model performs well on training but poorly on new data", "Model is too simple", "Data is corrupted", "Algorithm is slow"],
-                    ["Accuracy", "Mean", "Median", "Standard deviation"],
-                    ["Training data is used to build model, testing data evaluates it", "No difference", "Testing data is larger", "Training data is newer"],
-                    ["Linear Regression", "Decision Tree", "K-means", "Random Forest"],
-                    ["Creating new features from existing data", "Deleting features", "Renaming features", "Copying features"],
-                    ["Clustering", "Classification", "Regression", "Prediction"],
-                    ["To validate model performance", "To clean data", "To visualize data", "To store data"],
-                    ["ReLU", "Linear", "Step", "Constant"]
-                ]
-                explanations = [
-                    "Machine learning aims to learn patterns from data to make accurate predictions on new, unseen data.",
-                    "Linear regression is a supervised learning algorithm that learns from labeled training examples.",
-                    "Overfitting occurs when a model memorizes training data but fails to generalize to new data.",
-                    "Accuracy measures the percentage of correct predictions in classification tasks.",
-                    "Training data teaches the model patterns, while testing data provides unbiased evaluation.",
-                    "Linear regression is specifically designed to model linear relationships between variables.",
-                    "Feature engineering involves transforming raw data into meaningful features for better model performance.",
-                    "Clustering groups similar data points without using labeled examples (unsupervised).",
-                    "Cross-validation provides robust performance estimates by testing on multiple data splits.",
-                    "ReLU (Rectified Linear Unit) is widely used due to its simplicity and effectiveness in neural networks."
-                ]
-            else:
-                # Generic fallback
-                base_questions = [f"Sample question {i+1} on {topic} ({difficulty})" for i in range(10)]
-                base_answers = [[f"Option {chr(65+j)}" for j in range(choices)] for _ in range(10)]
-                explanations = [f"This is a fallback explanation for question {i+1}." for i in range(10)]
-            
-            for i in range(min(questions, len(base_questions))):
-                fallback.append({
-                    "question": base_questions[i],
-                    "choices": base_answers[i] if i < len(base_answers) else [f"Option {chr(65+j)}" for j in range(choices)],
-                    "answer": base_answers[i] if i < len(base_answers) else "Option A",
-                    "explanation": explanations[i] if i < len(explanations) else f"This is a fallback explanation for question {i+1}."
-                })
-            
-            # Fill remaining questions if needed
-            while len(fallback) < questions:
-                idx = len(fallback)
-                fallback.append({
-                    "question": f"Additional question {idx+1} on {topic} ({difficulty})",
-                    "choices": [f"Option {chr(65+j)}" for j in range(choices)],
-                    "answer": "Option A",
-                    "explanation": f"This is a fallback explanation for question {idx+1}."
-                })
+        logger.warning(f"⚠️ Profile error: {e}")
+        difficulty = 'beginner'
+    
+    topic_id = canonical_topic(topic)
+    bucket = bucket_key(topic_id, difficulty, choices, language)
+    quiz_questions = None
+    question_ids = []
+    source = "bank"
+    seen_ids = []
+    
+    # ✅ Assemble from the question bank, skipping questions this student already answered
+    try:
+        seen_ids = attempts_col.distinct("question_ids", {"user_id": user_id})
+        banked = question_bank.assemble(topic_id, difficulty, choices, questions, language, exclude_ids=seen_ids)
+        if banked is not None:
+            quiz_questions, question_ids, remaining = banked
+        if can_bank_questions() and (banked is None or question_bank.needs_top_up(remaining, questions)):
+            job_queue.enqueue(
+                "question_bank_topup",
+                {"topic": topic, "topic_key": topic_id, "category": category, "language": language,
+                 "difficulty": difficulty, "choices": choices},
+                dedupe_key=f"question_bank_topup:{bucket}"
+            )
+    except Exception as e:
+        logger.warning(f"Question bank unavailable: {e}")
+    
+    # ✅ Serve repeat requests from the prompt-hash cache before calling Gemini
+    cache_key = ResponseCache.make_key(
+        # Stand-in backends get their own keys so fake quizzes never reach real users
+        model=quiz_model_label(),
+        prompt_version=QUIZ_PROMPT_VERSION,
+        topic=topic_id,
+        category=category,
+        language=language,
+        difficulty=difficulty,
+        questions=questions,
+        choices=choices
+    )
+    if quiz_questions is None:
+        cached = quiz_cache.get(cache_key)
+        if cached is not None:
+            cached_ids = [question_id(bucket, q) for q in cached]
+            # A student who exhausted the bank would otherwise get back the quiz they already took
+            if not set(cached_ids) & set(seen_ids):
+                source = "cache"
+                quiz_questions, question_ids = cached, cached_ids
+
+    if quiz_questions is None:
+        # Generate with AI
+        try:
+            source = "llm"
+            quiz_questions = generate_ai_quiz_questions(topic, category, language, difficulty, questions, choices)
+            quiz_cache.set(cache_key, quiz_questions)
+            question_ids = [question_id(bucket, q) for q in quiz_questions]
+            if can_bank_questions():
+                try:
+                    question_bank.add(quiz_questions, topic, category, difficulty, choices, language,
+                                      source=quiz_model_label(), key=topic_id)
+                except Exception as e:
+                    logger.warning(f"Could not bank generated questions: {e}")
             
-            return fallback
+        except Exception as e:
+            logger.warning(f"❌ AI quiz generation failed, using fallback questions: {type(e).__name__}: {e}")
+            source = "fallback"
+            quiz_questions = generate_enhanced_fallback_questions(topic, category, questions, choices, difficulty)
 
-        fallback_questions = generate_enhanced_fallback_questions(topic, category, questions, choices, difficulty)
-        quiz = {
-            "topic": topic,
-            "category": category,
-            "difficulty": difficulty,
-            "questions": fallback_questions
-        }
-        print("🔄 Using enhanced fallback questions")
+    quiz = {
+        "topic": topic,
+        "category": category,
+        "difficulty": difficulty,
+        "questions": quiz_questions
+    }
 
     # Save quiz
     doc = {
@@ -1897,11 +2274,14 @@ IMPORTANT: Return ONLY valid JSON with no additional text, markdown, or formatti
         "category": category,
         "difficulty": difficulty,
         "questions": quiz["questions"],
+        "question_ids": question_ids,
         "created_at": datetime.now(timezone.utc),
     }
-    print(f"🔍 About to insert quiz doc: {doc}")
     res = quizzes_col.insert_one(doc)
-    print(f"🔍 Quiz inserted with ID: {res.inserted_id}")
+    logger.info("📝 Quiz generated", extra={"fields": {
+        "quiz_id": str(res.inserted_id), "source": source, "topic": topic_id,
+        "difficulty": difficulty, "questions": len(quiz_questions)
+    }})
     
     return {"quizId": str(res.inserted_id), "quiz": quiz}
 
@@ -2007,37 +2387,34 @@ def quiz_submit():
         "topic": quiz_doc.get("topic", "Unknown"),
         "category": quiz_doc.get("category", "General"),  # ✅ ADD: Missing category
         "difficulty": quiz_doc.get("difficulty", "beginner"),
-        "type": quiz_doc.get("type", "practice")  # ✅ ADD: Quiz type
+        "type": quiz_doc.get("type", "practice"),  # ✅ ADD: Quiz type
+        "question_ids": quiz_doc.get("question_ids", [])  # Lets the question bank skip seen questions
     }
     
     res = attempts_col.insert_one(attempt_doc)
 
-    # Trigger ML prediction update in background
+    stored_attempt = dict(attempt_doc, _id=res.inserted_id)
+    try:
+        feature_store.record_attempt(request.user["uid"], stored_attempt)
+    except Exception as e:
+        logger.warning(f"Could not update feature state: {e}")
+    
+    try:
+        analytics_store.record_attempt(request.user["uid"], stored_attempt)
+    except Exception as e:
+        logger.warning(f"Could not update analytics snapshot: {e}")
+
+    try:
+        daily_stats.record_attempt(stored_attempt)
+    except Exception as e:
+        logger.warning(f"Could not update daily stats: {e}")
+
+    # Refresh the ML prediction in background; repeated submits for the same user coalesce
     try:
         user_id = request.user["uid"]
-        all_attempts = list(attempts_col.find({"user_id": user_id}))
-        profile = profiles_col.find_one({"studentId": user_id})
-        
-        if len(all_attempts) >= 3:
-            prediction_result = ml_predictor.predict_skill_level(all_attempts, profile)
-            
-            profiles_col.find_one_and_update(
-                {"studentId": user_id},
-                {
-                    "$set": {
-                        "profile.skillLevel": prediction_result['predicted_level'],
-                        "performanceMetrics.averageScore": prediction_result['performance_score'],
-                        "lastPrediction": {
-                            "predictedAt": datetime.now(timezone.utc).isoformat(),
-                            "confidence": prediction_result['confidence'],
-                            "model": "RandomForest"
-                        }
-                    }
-                }
-            )
-            
+        job_queue.enqueue("skill_refresh", {"user_id": user_id}, dedupe_key=f"skill_refresh:{user_id}")
     except Exception as e:
-        logger.warning(f"Could not update ML prediction: {e}")
+        logger.warning(f"Could not queue ML prediction update: {e}")
 
     return {
         "attemptId": str(res.inserted_id),
@@ -2046,27 +2423,81 @@ def quiz_submit():
         "detail": detail
     }
 
+# Attempt history pages: the list view never needs the per-question payloads
+ATTEMPT_LIST_PROJECTION = {"detail": 0, "answers": 0}
+ATTEMPTS_PAGE_SIZE = int(os.getenv("ATTEMPTS_PAGE_SIZE", 50))
+ATTEMPTS_MAX_PAGE_SIZE = int(os.getenv("ATTEMPTS_MAX_PAGE_SIZE", 500))
+
+def encode_attempt_cursor(attempt):
+    """Opaque keyset cursor for the (submitted_at, _id) position of an attempt.
+
+    Legacy rows that only carry a submittedAt string have no submitted_at and
+    sort after every dated row, so their cursor is positioned by _id alone.
+    """
+    attempt_id = attempt["_id"]
+    submitted_at = attempt.get("submitted_at")
+    position = {
+        "t": submitted_at.isoformat() if isinstance(submitted_at, datetime) else None,
+        "id": str(attempt_id),
+        "oid": isinstance(attempt_id, ObjectId)
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_attempt_cursor(cursor):
+    """Filter matching attempts strictly after the cursor in newest-first order"""
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    attempt_id = ObjectId(position["id"]) if position.get("oid") else position["id"]
+    if position["t"] is None:
+        return {"submitted_at": None, "_id": {"$lt": attempt_id}}
+    submitted_at = datetime.fromisoformat(position["t"])
+    return {"$or": [
+        {"submitted_at": {"$lt": submitted_at}},
+        {"submitted_at": submitted_at, "_id": {"$lt": attempt_id}},
+        {"submitted_at": None}  # Undated legacy rows come after every dated one
+    ]}
+
 @app.get("/api/quiz/attempts")
 @auth_required
 def list_attempts():
-    """List quiz attempts"""
+    """List quiz attempts, newest first.
+
+    Pass ?limit=N for keyset pagination; the response then carries nextCursor,
+    to be sent back as ?after=. Students get their full history when no limit
+    is given; admins always get pages.
+    """
     user_id = request.user.get("uid")
     role = request.user.get("role", "student")
     
     try:
-        if role == "admin":
-            all_attempts = list(attempts_col.find({}))
-        else:
-            all_attempts = list(attempts_col.find({"user_id": user_id}))
+        limit = request.args.get("limit", type=int)
+        if limit is None and role == "admin":
+            limit = ATTEMPTS_PAGE_SIZE
+        if limit is not None:
+            limit = max(1, min(limit, ATTEMPTS_MAX_PAGE_SIZE))
+        
+        query = {} if role == "admin" else {"user_id": user_id}
+        after = request.args.get("after")
+        if after:
+            try:
+                query = {"$and": [query, decode_attempt_cursor(after)]}
+            except (ValueError, KeyError, TypeError):
+                return {"error": "Invalid cursor"}, 400
         
-        sorted_attempts = sorted(
-            all_attempts,
-            key=lambda x: x.get("submitted_at", datetime.min),
-            reverse=True
+        # Sorted by the (user_id, submitted_at, _id) index instead of in Python
+        cursor = attempts_col.find(query, ATTEMPT_LIST_PROJECTION).sort(
+            [("submitted_at", -1), ("_id", -1)]
         )
+        if limit is not None:
+            cursor = cursor.limit(limit + 1)  # One extra row tells us whether another page exists
+        page = list(cursor)
+        
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_attempt_cursor(page[-1])
         
         out = []
-        for a in sorted_attempts:
+        for a in page:
             out.append({
                 "attemptId": str(a.get("_id", "")),
                 "quizId": a.get("quiz_id"),
@@ -2076,7 +2507,7 @@ def list_attempts():
                 "difficulty": a.get("difficulty", "beginner")
             })
             
-        return {"attempts": out}
+        return {"attempts": out, "nextCursor": next_cursor}
         
     except Exception as e:
         return {"error": "Failed to retrieve attempts", "message": str(e)}, 500
@@ -2097,14 +2528,7 @@ def get_quiz_result(attempt_id):
             except Exception:
                 aid = attempt_id
         
-        attempt = None
-        if hasattr(attempts_col, '_data'):
-            for a in attempts_col._data:
-                if str(a.get("_id")) == str(aid):
-                    attempt = a
-                    break
-        else:
-            attempt = attempts_col.find_one({"_id": aid})
+        attempt = attempts_col.find_one({"_id": aid})
         
         if not attempt:
             return {"error": "Quiz result not found"}, 404
@@ -2131,159 +2555,491 @@ def get_quiz_result(attempt_id):
 # ========================================
 # CONTENT GENERATION ENDPOINTS
 # ========================================
-nlp_processor = AdvancedEducationalNLP("en_core_web_md")
+# Reuse the shared pipeline instead of loading a second copy
+nlp_processor = AdvancedEducationalNLP(pipeline=spacy_pipeline)
 
-@app.post("/api/content/generate")
-@auth_required  
-@rate_limit(max_requests=5, window=60)
-def generate_nlp_enhanced_content():  
-    """Generate content with automatic skill prediction and 18 comprehensive quiz questions"""
-    try:
-        body = request.get_json(force=True)
-        user_id = request.user["uid"]
+# Bump whenever the content or content-quiz prompts change
+CONTENT_PROMPT_VERSION = 1
+content_cache = build_response_cache("content", collection=cache_col)
 
-        topic = body.get('topic', '').strip()
-        content_type = body.get('contentType', 'explanation')
-        difficulty_override = body.get('difficulty', '')
-        
-        if not topic:
-            return {"error": "Topic is required"}, 400
-        
-        # Get profile and predict skill level
-        profile = profiles_col.find_one({"studentId": user_id})
-        
-        if not profile:
-            learning_style = 'visual'
-            department = 'general'
-            predicted_skill_level = 'beginner'
-            confidence = 0.3
-        else:
-            demographics = profile.get('demographics', {})
-            cognitive_profile = profile.get('cognitiveProfile', {})
-            
-            learning_style = cognitive_profile.get('learningStyle', 'visual')
-            department = demographics.get('department', 'general')
-            
-            predicted_skill_level, confidence = predict_student_skill_level_from_profile(profile, topic)
-        
-        effective_difficulty = difficulty_override or predicted_skill_level
-        
-        logger.info(f"🤖 PREDICTED: {predicted_skill_level} (confidence: {confidence:.2f}) | USING: {effective_difficulty} | {topic} | {learning_style} | {department}")
+def cacheable_content(content_result):
+    """The parts of a content result the response uses, in JSON-safe form"""
+    analysis = content_result.get('content_analysis', {}) or {}
+    return {
+        **{field: content_result.get(field, '') for field in
+           ('explanation', 'examples', 'exercises', 'learning_tips', 'enhanced_content', 'raw_content')},
+        'content_analysis': {
+            'quality': {'overall_quality': float(analysis.get('quality', {}).get('overall_quality', 0.0))},
+            'educational': {'concept_complexity': float(analysis.get('educational', {}).get('concept_complexity', 0.5))},
+            'linguistic': {
+                'word_count': int(analysis.get('linguistic', {}).get('word_count', 0)),
+                'readability': {'flesch_reading_ease': float(
+                    analysis.get('linguistic', {}).get('readability', {}).get('flesch_reading_ease', 0.5))}
+            },
+            'overall_score': float(analysis.get('overall_score', 0.5)),
+            # Concept scores may be numpy floats
+            'key_concepts': json.loads(json.dumps(analysis.get('key_concepts', []),
+                                                  default=lambda v: v.item() if hasattr(v, 'item') else str(v)))
+        }
+    }
+
+def cached_analysis_stage(content_result):
+    """The "analysis" stage payload for a content result served from the cache"""
+    analysis = content_result.get('content_analysis', {})
+    linguistic = analysis.get('linguistic', {})
+    return {
+        'word_count': linguistic.get('word_count') or len(content_result.get('enhanced_content', '').split()),
+        'readability_score': linguistic.get('readability', {}).get('flesch_reading_ease'),
+        'quality_score': analysis.get('quality', {}).get('overall_quality'),
+        'overall_score': analysis.get('overall_score'),
+        'key_concepts': analysis.get('key_concepts', [])
+    }
+
+# How the quiz call overlaps the content call: "serial" waits for the full
+# content, "pipelined" starts once QUIZ_CONTEXT_CHARS have streamed in, and
+# "parallel" generates questions from the topic alone alongside the content
+CONTENT_QUIZ_MODE = os.getenv("CONTENT_QUIZ_MODE", "pipelined").lower()
+quiz_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QUIZ_WORKERS", 8)),
+    thread_name_prefix="quiz"
+)
+
+def generate_content_for_user(user_id, topic, content_type='explanation', difficulty_override='', on_stage=None, stream=False):
+    """Run the content pipeline (skill prediction, content, analysis, quiz) for one student.
+
+    Returns the response payload, or None if content generation failed.
+    on_stage(name, data) is called as each stage completes; stream=True also
+    streams the LLM output through it (see generate_educational_content).
+    """
+    on_stage = on_stage or (lambda name, data: None)
+    
+    # Get profile and predict skill level
+    profile = profiles_col.find_one({"studentId": user_id})
+    
+    if not profile:
+        learning_style = 'visual'
+        department = 'general'
+        predicted_skill_level = 'beginner'
+        confidence = 0.3
+    else:
+        demographics = profile.get('demographics', {})
+        cognitive_profile = profile.get('cognitiveProfile', {})
         
-        # Generate content
-        logger.info("🚀 Generating content and quiz with nlp_processor...")
+        learning_style = cognitive_profile.get('learningStyle', 'visual')
+        department = demographics.get('department', 'general')
         
+        predicted_skill_level, confidence = predict_student_skill_level_from_profile(profile, topic)
+    
+    effective_difficulty = difficulty_override or predicted_skill_level
+    
+    logger.info(f"🤖 PREDICTED: {predicted_skill_level} (confidence: {confidence:.2f}) | USING: {effective_difficulty} | {topic} | {learning_style} | {department}")
+    
+    # Generate content
+    logger.info("🚀 Generating content and quiz with nlp_processor...")
+    
+    def generate_quiz(content):
+        return nlp_processor.generate_smart_quiz_questions(
+            content, 
+            num_questions=18,
+            difficulty_level=effective_difficulty,
+            topic=topic
+        )
+    
+    # Near-duplicate topics ("React hooks", "Hooks in React") share one cache entry
+    content_key = ResponseCache.make_key(
+        backend=llm_client.backend.name,
+        prompt_version=CONTENT_PROMPT_VERSION,
+        topic=canonical_topic(topic),
+        content_type=content_type,
+        difficulty=effective_difficulty,
+        learning_style=learning_style,
+        department=department
+    )
+    cached = content_cache.get(content_key)
+    
+    if cached is not None:
+        logger.info(f"⚡ Content cache hit for: {topic} ({effective_difficulty})")
+        content_result, quiz_questions = cached["content_result"], cached["quiz_questions"]
+        on_stage("content", {"enhanced_content": content_result.get('enhanced_content', '')})
+        on_stage("sections", {
+            "explanation": content_result.get('explanation', ''),
+            "examples": content_result.get('examples', ''),
+            "exercises": content_result.get('exercises', ''),
+            "tips": content_result.get('learning_tips', '')
+        })
+        on_stage("analysis", cached_analysis_stage(content_result))
+    else:
+        quiz_mode = CONTENT_QUIZ_MODE
+        quiz_future = None
+        if quiz_mode == "parallel":
+            # Questions come from the topic alone, so both calls start together
+            quiz_future = quiz_executor.submit(generate_quiz, "")
+        elif quiz_mode == "pipelined":
+            # The quiz prompt only reads the first QUIZ_CONTEXT_CHARS of content,
+            # so it can start as soon as that much has streamed in
+            streamed = []
+        
+            def relay_stage(name, data):
+                nonlocal quiz_future
+                if name == "delta":
+                    streamed.append(data["text"])
+                    if quiz_future is None and sum(map(len, streamed)) >= QUIZ_CONTEXT_CHARS:
+                        logger.info("❓ Starting quiz generation from streamed content...")
+                        quiz_future = quiz_executor.submit(generate_quiz, "".join(streamed))
+                if stream or name not in ("delta", "section"):
+                    on_stage(name, data)
+        content_stage = relay_stage if quiz_mode == "pipelined" else on_stage
+    
         content_result = nlp_processor.generate_educational_content(
             topic=topic,
             difficulty_level=effective_difficulty,
             learning_style=learning_style,
             content_type=content_type,
-            subject=department
+            subject=department,
+            on_stage=content_stage,
+            stream=stream or quiz_mode == "pipelined"
         )
-        
+    
         if not content_result:
             logger.error("Content generation failed")
-            return {"error": "Failed to generate content"}, 500
-        
-        # Generate quiz
+            if quiz_future:
+                quiz_future.cancel()
+            return None
+    
+        # Generate quiz (or collect the one already running)
         logger.info("❓ Generating comprehensive quiz questions...")
-        quiz_questions = nlp_processor.generate_smart_quiz_questions(
-            content_result.get('enhanced_content', ''), 
-            num_questions=18,
-            difficulty_level=effective_difficulty,
-            topic=topic
-        )
+        if quiz_future is not None:
+            quiz_questions = quiz_future.result()
+        else:
+            quiz_questions = generate_quiz(content_result.get('enhanced_content', ''))
         
-        result = {
-            "status": "success",
-            "content": {
-                "topic": topic,
-                "content_type": content_type,
-                "difficulty_level": effective_difficulty,
+        if content_result.get('nlp_generated'):
+            content_cache.set(content_key, {
+                "content_result": cacheable_content(content_result),
+                "quiz_questions": quiz_questions
+            })
+    
+    on_stage("quiz", {"quiz_questions": quiz_questions})
+    
+    result = {
+        "status": "success",
+        "content": {
+            "topic": topic,
+            "content_type": content_type,
+            "difficulty_level": effective_difficulty,
+            "predicted_level": predicted_skill_level,
+            "prediction_confidence": round(confidence, 2),
+            "personalization": {
+                "learning_style": learning_style,
+                "department": department,
+                "skill_confidence": confidence,
+                "auto_predicted": not difficulty_override
+            },
+            
+            # ✅ FIXED: Content sections with fallback to enhanced_content
+            "explanation": (
+                content_result.get('explanation', '').strip() or 
+                content_result.get('enhanced_content', '').strip() or 
+                content_result.get('raw_content', '').strip() or
+                'No content available'
+            ),
+            "example": (
+                content_result.get('examples', '').strip() or 
+                content_result.get('example', '').strip() or
+                ''
+            ),
+            "exercise": (
+                content_result.get('exercises', '').strip() or 
+                content_result.get('exercise', '').strip() or
+                ''
+            ),
+            "learning_tip": (
+                content_result.get('learning_tips', '').strip() or 
+                content_result.get('learning_tip', '').strip() or
+                ''
+            ),
+            "quiz_questions": quiz_questions,
+            
+            # Analytics
+            "skill_prediction": {
                 "predicted_level": predicted_skill_level,
-                "prediction_confidence": round(confidence, 2),
-                "personalization": {
-                    "learning_style": learning_style,
-                    "department": department,
-                    "skill_confidence": confidence,
-                    "auto_predicted": not difficulty_override
-                },
-                
-                # ✅ FIXED: Content sections with fallback to enhanced_content
-                "explanation": (
-                    content_result.get('explanation', '').strip() or 
-                    content_result.get('enhanced_content', '').strip() or 
-                    content_result.get('raw_content', '').strip() or
-                    'No content available'
-                ),
-                "example": (
-                    content_result.get('examples', '').strip() or 
-                    content_result.get('example', '').strip() or
-                    ''
-                ),
-                "exercise": (
-                    content_result.get('exercises', '').strip() or 
-                    content_result.get('exercise', '').strip() or
-                    ''
-                ),
-                "learning_tip": (
-                    content_result.get('learning_tips', '').strip() or 
-                    content_result.get('learning_tip', '').strip() or
-                    ''
-                ),
-                "quiz_questions": quiz_questions,
-                
-                # Analytics
-                "skill_prediction": {
-                    "predicted_level": predicted_skill_level,
-                    "confidence_score": round(confidence, 2),
-                    "prediction_factors": get_prediction_factors_from_profile(profile),
-                    "manual_override": bool(difficulty_override),
-                    "prediction_method": "profile_analytics"
-                },
-                
-                "quiz_analytics": {
-                    "total_questions": len(quiz_questions),
-                    "skill_assessment_ready": len(quiz_questions) >= 15,
-                    "prediction_validation": True,
-                    "comprehensive_assessment": True,
-                    "difficulty_match": effective_difficulty,
-                    "nlp_enhanced": True
-                },
-                
-                # Metadata (updated to count actual content)
-                "word_count": len(
-                    (content_result.get('explanation', '') or 
-                    content_result.get('enhanced_content', '')).split()
-                ),
-                "estimated_reading_time": max(
-                    1, 
-                    len((content_result.get('explanation', '') or 
-                        content_result.get('enhanced_content', '')).split()) // 200
-                ),
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "ai_generated": True,
-                "nlp_enhanced": True,
-                "auto_predicted": True,
-                "spacy_model": "en_core_web_md"
-            }
+                "confidence_score": round(confidence, 2),
+                "prediction_factors": get_prediction_factors_from_profile(profile),
+                "manual_override": bool(difficulty_override),
+                "prediction_method": "profile_analytics"
+            },
+            
+            "quiz_analytics": {
+                "total_questions": len(quiz_questions),
+                "skill_assessment_ready": len(quiz_questions) >= 15,
+                "prediction_validation": True,
+                "comprehensive_assessment": True,
+                "difficulty_match": effective_difficulty,
+                "nlp_enhanced": True
+            },
+            
+            # Metadata (updated to count actual content)
+            "word_count": len(
+                (content_result.get('explanation', '') or 
+                content_result.get('enhanced_content', '')).split()
+            ),
+            "estimated_reading_time": max(
+                1, 
+                len((content_result.get('explanation', '') or 
+                    content_result.get('enhanced_content', '')).split()) // 200
+            ),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "ai_generated": True,
+            "nlp_enhanced": True,
+            "auto_predicted": True,
+            "spacy_model": spacy_pipeline.name
         }
-                
-        update_profile_with_prediction_insights(
-            user_id, 
-            predicted_skill_level, 
-            confidence, 
-            content_result.get('content_analysis', {}),  # ✅ FIXED
-            topic
-        )
+    }
+            
+    update_profile_with_prediction_insights(
+        user_id, 
+        predicted_skill_level, 
+        confidence, 
+        content_result.get('content_analysis', {}),  # ✅ FIXED
+        topic
+    )
+    
+    logger.info(f"✅ Generated content: {predicted_skill_level}→{effective_difficulty} | {len(quiz_questions)} questions | confidence: {confidence:.2f}")
+    return result
+
+@app.post("/api/content/generate")
+@auth_required  
+@rate_limit(max_requests=5, window=60)
+def generate_nlp_enhanced_content():  
+    """Generate content with automatic skill prediction and 18 comprehensive quiz questions"""
+    try:
+        body = request.get_json(force=True)
+        user_id = request.user["uid"]
+
+        topic = body.get('topic', '').strip()
+        content_type = body.get('contentType', 'explanation')
+        difficulty_override = body.get('difficulty', '')
         
-        logger.info(f"✅ Generated content: {predicted_skill_level}→{effective_difficulty} | {len(quiz_questions)} questions | confidence: {confidence:.2f}")
+        if not topic:
+            return {"error": "Topic is required"}, 400
+        
+        result = generate_content_for_user(user_id, topic, content_type, difficulty_override)
+        if result is None:
+            return {"error": "Failed to generate content"}, 500
         return result, 200
         
     except Exception as e:
         logger.error(f"Enhanced content generation error: {str(e)}")
         return {"error": "Failed to generate content. Please try again."}, 500
 
+def format_sse(event, data, event_id=None):
+    """Encode one server-sent event"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Streaming requests hold a connection for the whole generation; the pipeline
+# itself runs here so the response generator only relays events
+content_stream_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CONTENT_STREAM_WORKERS", 8)),
+    thread_name_prefix="content-stream"
+)
+
+@app.post("/api/content/generate/stream")
+@auth_required
+@rate_limit(max_requests=5, window=60)
+def stream_nlp_enhanced_content():
+    """Same pipeline as /api/content/generate, streamed as server-sent events.
+
+    Events: delta (LLM text as it arrives), section (each section once it is
+    complete), content/sections/analysis/quiz (pipeline stages), then done
+    with the full /api/content/generate payload, or error.
+    """
+    body = request.get_json(force=True)
+    user_id = request.user["uid"]
+    topic = body.get('topic', '').strip()
+    content_type = body.get('contentType', 'explanation')
+    difficulty_override = body.get('difficulty', '')
+    
+    if not topic:
+        return {"error": "Topic is required"}, 400
+    
+    events = queue.Queue()
+    
+    def run():
+        try:
+            result = generate_content_for_user(
+                user_id, topic, content_type, difficulty_override,
+                on_stage=lambda name, data: events.put((name, data)),
+                stream=True
+            )
+            if result is None:
+                events.put(("error", {"error": "Failed to generate content"}))
+            else:
+                events.put(("done", result))
+        except Exception as e:
+            logger.error(f"Streamed content generation error: {str(e)}")
+            events.put(("error", {"error": "Failed to generate content. Please try again."}))
+    
+    content_stream_executor.submit(run)
+    
+    def stream():
+        yield ": generating\n\n"  # Flush headers right away
+        while True:
+            try:
+                name, data = events.get(timeout=15)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(name, data)
+            if name in ("done", "error"):
+                return
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ========================================
+# ASYNCHRONOUS CONTENT JOBS
+# ========================================
+content_jobs = ContentJobStore(content_jobs_col)
+
+# Generation is slow and LLM-bound, so it gets its own pool instead of
+# sharing workers with the quick skill refresh jobs
+content_queue = BackgroundJobQueue(
+    outbox=jobs_col,
+    num_workers=int(os.getenv("CONTENT_JOB_WORKERS", 4)),
+    max_attempts=1,  # Failures are reported to the client, which decides whether to retry
+    lease_seconds=int(os.getenv("CONTENT_JOB_LEASE_SECONDS", 600)),
+    name="content"
+)
+
+def run_content_job(payload):
+    """Worker side of /api/content/jobs: run the pipeline and publish each stage"""
+    job_id = payload["job_id"]
+    if not content_jobs.start(job_id):
+        logger.info(f"Content job {job_id} is finished or already running here, not rerunning it")
+        return
+    try:
+        result = generate_content_for_user(
+            payload["user_id"],
+            payload["topic"],
+            payload.get("contentType", "explanation"),
+            payload.get("difficulty", ""),
+            on_stage=lambda name, data: content_jobs.record_stage(job_id, name, data)
+        )
+    except Exception as e:
+        logger.error(f"Content job {job_id} failed: {str(e)}")
+        content_jobs.fail(job_id, "Failed to generate content. Please try again.")
+        return
+    if result is None:
+        content_jobs.fail(job_id, "Failed to generate content")
+    else:
+        content_jobs.finish(job_id, result)
+
+content_queue.register("content_generate", run_content_job)
+
+def content_job_view(job):
+    return {
+        "jobId": job["_id"],
+        "status": job["status"],
+        "seq": job["seq"],
+        "stages": {name: job["stages"][name] for name in job["stage_order"]},
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "createdAt": job["created_at"].isoformat(),
+        "updatedAt": job["updated_at"].isoformat()
+    }
+
+def load_own_content_job(job_id):
+    """Fetch a job the current user may see, or an error response"""
+    job = content_jobs.get(job_id)
+    if not job:
+        return None, ({"error": "Job not found"}, 404)
+    if job["user_id"] != request.user["uid"] and request.user.get("role") != "admin":
+        return None, ({"error": "Access denied"}, 403)
+    return job, None
+
+@app.post("/api/content/jobs")
+@auth_required
+@rate_limit(max_requests=5, window=60)
+def submit_content_job():
+    """Queue content generation and return a job id immediately"""
+    body = request.get_json(force=True)
+    topic = body.get('topic', '').strip()
+    if not topic:
+        return {"error": "Topic is required"}, 400
+    
+    params = {
+        "topic": topic,
+        "contentType": body.get('contentType', 'explanation'),
+        "difficulty": body.get('difficulty', '')
+    }
+    try:
+        job_id = content_jobs.create(request.user["uid"], params)
+        content_queue.enqueue("content_generate", {"job_id": job_id, "user_id": request.user["uid"], **params})
+    except Exception as e:
+        logger.error(f"Content job submit error: {str(e)}")
+        return {"error": "Failed to queue content generation"}, 500
+    
+    return {
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/api/content/jobs/{job_id}",
+        "eventsUrl": f"/api/content/jobs/{job_id}/events"
+    }, 202
+
+@app.get("/api/content/jobs/<job_id>")
+@auth_required
+def get_content_job(job_id):
+    """Poll a content job; stages holds every partial result finished so far"""
+    job, error = load_own_content_job(job_id)
+    if error:
+        return error
+    return content_job_view(job)
+
+@app.get("/api/content/jobs/<job_id>/events")
+@auth_required
+def stream_content_job(job_id):
+    """Server-sent events: one event per finished stage, then done or error"""
+    job, error = load_own_content_job(job_id)
+    if error:
+        return error
+    
+    try:
+        last_seen = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_seen = 0
+    timeout = float(os.getenv("CONTENT_STREAM_TIMEOUT", 120))
+    
+    def events():
+        delivered = last_seen  # Event ids number the stages, so a reconnect resumes after the last one seen
+        deadline = time() + timeout
+        current = job
+        while current is not None:
+            stages = current["stage_order"]
+            for index in range(delivered, len(stages)):
+                yield format_sse(stages[index], current["stages"][stages[index]], index + 1)
+            delivered = max(delivered, len(stages))
+            if current["status"] == "done":
+                yield format_sse("done", current["result"], delivered + 1)
+                return
+            if current["status"] == "failed":
+                yield format_sse("error", {"error": current.get("error")}, delivered + 1)
+                return
+            if time() >= deadline:
+                yield format_sse("timeout", {"status": current["status"]}, delivered)
+                return
+            yield ": keep-alive\n\n"
+            current = content_jobs.wait(job_id, current["seq"], timeout=5)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 def predict_student_skill_level_from_profile(profile, topic):
     """Predict student's skill level using your existing profile structure"""
     
@@ -2644,6 +3400,7 @@ def create_course():
             "instructor_name": request.user.get("email", "").split("@")[0],
             "instructor_role": user_role,
             "enrolled_students": [],
+            "enrolled_count": 0,
             "max_students": int(body.get("maxStudents", 100)),
             "difficulty_level": body.get("difficultyLevel", "intermediate"),
             "duration_weeks": int(body.get("durationWeeks", 8)),
@@ -2675,24 +3432,52 @@ def create_course():
         logger.error(f"Course creation error: {str(e)}")
         return {"error": "Failed to create course"}, 500
 
+course_catalog = CourseCatalog(courses_col)
+MAX_COURSE_PAGE_SIZE = int(os.getenv("MAX_COURSE_PAGE_SIZE", 200))
+
 @app.get("/api/courses")
 @auth_required
 def list_courses():
-    """List courses with ML-based recommendations"""
+    """List courses with ML-based recommendations.
+
+    Optional ?limit= and ?offset= page through the catalog; without them
+    every matching course is returned.
+    """
     user_role = request.user.get("role", "student")
     user_id = request.user["uid"]
     
     if user_role == "admin":
-        courses = courses_col.find({})
+        query = {}
     elif user_role == "teacher":
-        courses = courses_col.find({"instructor_id": user_id})
+        query = {"instructor_id": user_id}
     else:
-        courses = courses_col.find({"is_active": True})
+        query = {"is_active": True}
+    
+    limit = request.args.get("limit", type=int)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_COURSE_PAGE_SIZE))
+    
+    # The student's level is read once and courses are ranked in the query
+    user_level = None
+    if user_role == "student":
+        try:
+            profile = profiles_col.find_one({"studentId": user_id}, {"profile.skillLevel": 1})
+            if profile:
+                user_level = profile.get('profile', {}).get('skillLevel', 'beginner')
+        except Exception as e:
+            logger.warning(f"Could not load profile for course ranking: {e}")
+    
+    try:
+        courses, total = course_catalog.page(query, user_id=user_id, user_level=user_level, offset=offset, limit=limit)
+    except Exception as e:
+        logger.error(f"Course listing error: {str(e)}")
+        return {"error": "Failed to load courses"}, 500
     
     course_list = []
     for course in courses:
-        enrolled_count = len(course.get("enrolled_students", []))
-        is_enrolled = user_id in course.get("enrolled_students", [])
+        enrolled_count = course.get("enrolled_count", 0)
+        is_enrolled = course.get("is_enrolled", False)
         
         course_data = {
             "courseId": str(course["_id"]),
@@ -2712,39 +3497,16 @@ def list_courses():
         if user_role == "student":
             course_data["isEnrolled"] = is_enrolled
             course_data["canEnroll"] = not is_enrolled and enrolled_count < course.get("max_students", 100)
-            
-            # Add ML-based course recommendation
-            try:
-                profile = profiles_col.find_one({"studentId": user_id})
-                if profile:
-                    user_level = profile.get('profile', {}).get('skillLevel', 'beginner')
-                    course_level = course.get("difficulty_level", "intermediate")
-                    course_data["recommendationScore"] = calculate_course_recommendation(user_level, course_level)
-            except:
-                course_data["recommendationScore"] = 0.5
+            if "recommendation_score" in course:
+                course_data["recommendationScore"] = course["recommendation_score"]
         
         course_list.append(course_data)
     
-    # Sort courses by recommendation score for students
-    if user_role == "student":
-        course_list.sort(key=lambda x: x.get("recommendationScore", 0), reverse=True)
-    
-    return {"courses": course_list}
+    return {"courses": course_list, "total": total}
 
 def calculate_course_recommendation(user_level, course_level):
     """Calculate ML-based course recommendation score"""
-    level_scores = {"beginner": 1, "intermediate": 2, "pro": 3}
-    
-    user_score = level_scores.get(user_level, 1)
-    course_score = level_scores.get(course_level, 2)
-    
-    diff = abs(user_score - course_score)
-    if diff == 0:
-        return 1.0  # Perfect match
-    elif diff == 1:
-        return 0.7  # Adjacent level
-    else:
-        return 0.3  # Distant level
+    return recommendation_score(user_level, course_level)
 
 @app.post("/api/courses/<course_id>/enroll")
 @auth_required
@@ -2769,20 +3531,23 @@ def enroll_student(course_id):
     if user_id in enrolled_students:
         return {"error": "Already enrolled in this course"}, 409
     
-    if len(enrolled_students) >= course.get("max_students", 100):
+    if course.get("enrolled_count", len(enrolled_students)) >= course.get("max_students", 100):
         return {"error": "Course is full"}, 400
     
-    # Update course enrollment
-    if hasattr(courses_col, '_data'):
-        for doc in courses_col._data:
-            if doc.get("_id") == cid:
-                doc["enrolled_students"].append(user_id)
-                break
+    if "enrolled_count" in course:
+        count_update = {"$inc": {"enrolled_count": 1}}
     else:
-        courses_col.update_one(
-            {"_id": cid},
-            {"$push": {"enrolled_students": user_id}}
-        )
+        # Courses created before the counter existed get it seeded from the roster
+        count_update = {"$set": {"enrolled_count": len(enrolled_students) + 1}}
+    
+    # Update course enrollment; the filter makes a double-click a no-op instead of a double count
+    result = courses_col.update_one(
+        {"_id": cid, "enrolled_students": {"$ne": user_id}},
+        {"$push": {"enrolled_students": user_id}, **count_update}
+    )
+    matched = result.get("matched_count") if isinstance(result, dict) else result.matched_count
+    if not matched:
+        return {"error": "Already enrolled in this course"}, 409
     
     return {
         "message": "Successfully enrolled in course",
@@ -2805,23 +3570,22 @@ def my_analytics():
         if not student:
             return {"error": "Student not found"}, 404
         
-        # Get profile and attempts
+        # Get profile and the precomputed analytics snapshot
         profile = profiles_col.find_one({"studentId": user_id})
-        attempts = list(attempts_col.find({"user_id": user_id}))
+        if request.args.get("recompute") in ("1", "true"):
+            snapshot = analytics_store.rebuild(user_id)
+        else:
+            snapshot = analytics_store.get(user_id)
         enrolled_courses = list(courses_col.find({"enrolledStudents": user_id}))
         
         # === CORE PERFORMANCE METRICS ===
-        total_attempts = len(attempts)
-        total_questions = sum(attempt.get("score", {}).get("total", 0) for attempt in attempts)
-        total_correct = sum(attempt.get("score", {}).get("correct", 0) for attempt in attempts)
+        total_attempts = snapshot["total_attempts"]
+        total_questions = snapshot["total_questions"]
+        total_correct = snapshot["total_correct"]
         overall_percentage = round((total_correct / total_questions) * 100, 2) if total_questions > 0 else 0
         
-        # === RECENT ATTEMPTS ===
-        recent_attempts = sorted(
-            attempts, 
-            key=lambda x: x.get("submitted_at") or datetime.min.replace(tzinfo=timezone.utc), 
-            reverse=True
-        )[:10]
+        # === RECENT ATTEMPTS (newest first, kept in the snapshot) ===
+        recent_attempts = snapshot["recent"]
         
         # === PERFORMANCE TREND ===
         performance_trend = []
@@ -2849,43 +3613,23 @@ def my_analytics():
             })
         
         # === TOPIC-WISE ANALYTICS ===
-        topic_performance = {}
-        difficulty_performance = {"beginner": [], "intermediate": [], "pro": []}
-        
-        for attempt in attempts:
-            topic = attempt.get("topic", "General")
-            difficulty = attempt.get("difficulty", "beginner")
-            
-            # ✅ FIX: Use stored percentage or calculate
-            percentage = attempt.get("percentage")
-            if percentage is None:
-                score_data = attempt.get("score", {})
-                total = score_data.get("total", 1)
-                correct = score_data.get("correct", 0)
-                percentage = (correct / total) * 100 if total > 0 else 0
-            
-            # Topic analysis
-            if topic not in topic_performance:
-                topic_performance[topic] = {"attempts": 0, "total_score": 0, "avg_score": 0}
-            topic_performance[topic]["attempts"] += 1
-            topic_performance[topic]["total_score"] += percentage
-            topic_performance[topic]["avg_score"] = round(
-                topic_performance[topic]["total_score"] / topic_performance[topic]["attempts"], 
-                2
-            )
-            
-            # Difficulty analysis
-            if difficulty in difficulty_performance:
-                difficulty_performance[difficulty].append(percentage)
+        topic_performance = {
+            row["topic"]: {
+                "attempts": row["attempts"],
+                "total_score": row["total_score"],
+                "avg_score": round(row["total_score"] / row["attempts"], 2)
+            }
+            for row in snapshot["topics"]
+        }
         
         # Calculate difficulty averages
         difficulty_analytics = {}
-        for diff, scores in difficulty_performance.items():
-            if scores:
+        for diff, level in snapshot["difficulty"].items():
+            if level["count"]:
                 difficulty_analytics[diff] = {
-                    "avg_score": round(sum(scores) / len(scores), 2),
-                    "attempts": len(scores),
-                    "improvement": round((scores[-1] - scores[0]) if len(scores) > 1 else 0, 2)
+                    "avg_score": round(level["sum"] / level["count"], 2),
+                    "attempts": level["count"],
+                    "improvement": round((level["last"] - level["first"]) if level["count"] > 1 else 0, 2)
                 }
             else:
                 difficulty_analytics[diff] = {"avg_score": 0, "attempts": 0, "improvement": 0}
@@ -2899,15 +3643,7 @@ def my_analytics():
             current_skill_level = profile.get("profile", {}).get("skillLevel", "beginner")
         
         if len(recent_attempts) >= 3:
-            recent_scores = []
-            for att in recent_attempts[:5]:
-                perc = att.get("percentage")
-                if perc is None:
-                    score = att.get("score", {})
-                    total = score.get("total", 1)
-                    correct = score.get("correct", 0)
-                    perc = (correct / total) * 100 if total > 0 else 0
-                recent_scores.append(perc)
+            recent_scores = [attempt_percentage(att) for att in recent_attempts[:5]]
             
             if len(recent_scores) > 1:
                 learning_velocity = round((recent_scores[0] - recent_scores[-1]) / len(recent_scores), 2)
@@ -2959,30 +3695,7 @@ def my_analytics():
             achievements.append({"badge": "Explorer", "description": "Practiced 5+ different topics"})
         
         # === LEARNING STREAKS ===
-        learning_streak = 0
-        if attempts:
-            attempt_dates = []
-            for attempt in attempts:
-                submitted = attempt.get("submitted_at")
-                if hasattr(submitted, "date"):
-                    attempt_dates.append(submitted.date())
-                elif isinstance(submitted, str):
-                    try:
-                        attempt_dates.append(
-                            datetime.fromisoformat(submitted.replace("Z", "+00:00")).date()
-                        )
-                    except:
-                        pass
-            
-            if attempt_dates:
-                unique_dates = sorted(set(attempt_dates), reverse=True)
-                current_date = datetime.now().date()
-                
-                for i, date in enumerate(unique_dates):
-                    if (current_date - date).days == i:
-                        learning_streak += 1
-                    else:
-                        break
+        streak_days = learning_streak(snapshot)
         
         # ✅ FIX: Helper function for date formatting
         def format_date(dt):
@@ -3015,7 +3728,7 @@ def my_analytics():
                     "averageScore": round(overall_percentage, 2),
                     "learningVelocity": learning_velocity,
                     "consistencyScore": consistency_score,
-                    "learningStreak": learning_streak
+                    "learningStreak": streak_days
                 },
                 
                 "charts": {
@@ -3056,7 +3769,7 @@ def my_analytics():
                 # ✅ FIXED: Recent Activity with proper date handling
                 "recentActivity": [
                     {
-                        "attemptId": str(attempt.get("_id")),
+                        "attemptId": attempt.get("_id"),
                         "topic": attempt.get("topic", "Unknown"),
                         "category": attempt.get("category", "General"),
                         "score": attempt.get("score", {}),
@@ -3073,6 +3786,8 @@ def my_analytics():
                 ],
                 
                 "lastUpdated": datetime.now(timezone.utc).isoformat(),
+                "snapshotVersion": snapshot.get("version", 0),
+                "snapshotUpdatedAt": format_date(snapshot.get("updated_at")),
                 "dataRange": f"Last {total_attempts} attempts" if total_attempts > 0 else "No quiz data available"
             }
         }, 200
@@ -3110,13 +3825,16 @@ def get_enhanced_student_analytics(student_id):
         ml_insights = {}
         if attempts:
             try:
-                prediction_result = ml_predictor.predict_skill_level(attempts, student_profile)
+                feature_state = feature_store.get(student_id)
+                prediction_result = ml_predictor.predict_skill_level_from_state(feature_state)
                 ml_insights = {
                     "predictedLevel": prediction_result['predicted_level'],
                     "confidence": prediction_result['confidence'],
                     "performanceScore": prediction_result['performance_score'],
                     "featureImportance": prediction_result['feature_importance'],
-                    "recommendations": ml_predictor.get_learning_recommendations(prediction_result, attempts)
+                    "recommendations": ml_predictor.get_learning_recommendations(
+                        prediction_result, topic_count=len(feature_state["topics"])
+                    )
                 }
             except Exception as e:
                 logger.warning(f"ML prediction failed: {e}")
@@ -3318,6 +4036,76 @@ def create_template():
         logger.error(f"Template creation error: {str(e)}")
         return {"error": "Failed to create template"}, 500
 
+@app.post("/api/analytics/predict-batch")
+@role_required(["teacher", "admin"])
+def predict_batch():
+    """Predict skill levels for a whole cohort in one pass of each model"""
+    body = request.get_json(force=True) or {}
+    student_ids = body.get("studentIds")
+    course_id = body.get("courseId")
+    
+    if course_id and not student_ids:
+        try:
+            cid = ObjectId(course_id)
+        except Exception:
+            cid = course_id
+        course = courses_col.find_one({"_id": cid})
+        if not course:
+            return {"error": "Course not found"}, 404
+        if request.user.get("role") == "teacher" and course.get("instructor_id") != request.user["uid"]:
+            return {"error": "Access denied"}, 403
+        student_ids = course.get("enrolled_students", [])
+    
+    if not isinstance(student_ids, list) or not student_ids:
+        return {"error": "studentIds (non-empty list) or courseId is required"}, 400
+    
+    max_batch = int(os.getenv("MAX_BATCH_PREDICTION", 20000))
+    if len(student_ids) > max_batch:
+        return {"error": f"At most {max_batch} students per batch"}, 400
+    
+    try:
+        started = time()
+        student_ids = [str(sid) for sid in student_ids]
+        states = feature_store.get_many(student_ids)
+        with_data = {sid: state for sid, state in states.items() if state["count"]}
+        predictions = ml_predictor.predict_skill_levels_bulk(with_data)
+        
+        results = []
+        for sid in dict.fromkeys(student_ids):
+            prediction = predictions.get(sid)
+            if prediction is None:
+                results.append({
+                    "studentId": sid,
+                    "predictedLevel": "beginner",
+                    "confidence": 0.5,
+                    "totalAttempts": 0,
+                    "message": "No quiz data available, defaulting to beginner"
+                })
+                continue
+            results.append({
+                "studentId": sid,
+                "predictedLevel": prediction['predicted_level'],
+                "confidence": prediction['confidence'],
+                "performanceScore": prediction['performance_score'],
+                "skillProbabilities": prediction['skill_probabilities'],
+                "totalAttempts": with_data[sid]["count"]
+            })
+        
+        return {
+            "status": "success",
+            "model": "RandomForest",
+            "artifactVersion": ml_predictor.artifact_version,
+            "featureImportance": dict(zip(
+                ml_predictor.feature_names, ml_predictor.skill_classifier.feature_importances_.tolist()
+            )) if ml_predictor.is_trained else {},
+            "predictions": results,
+            "total": len(results),
+            "elapsedMs": round((time() - started) * 1000, 1)
+        }
+    except Exception as e:
+        logger.error(f"Error in predict_batch: {str(e)}")
+        return {"error": str(e)}, 500
+
 # ========================================
 # ADMIN ENDPOINTS
 # ========================================
@@ -3345,6 +4133,50 @@ def list_all_users():
     except Exception as e:
         return {"error": str(e)}, 500
 
+@app.post("/api/admin/attempts/import")
+@role_required(["admin"])
+def import_attempts_endpoint():
+    """Bulk-load quiz attempts from a JSON-lines request body.
+
+    Derived data is recomputed by background jobs once the whole body has
+    been written, instead of once per attempt.
+    """
+    batch_size = max(1, min(request.args.get("batchSize", IMPORT_BATCH_SIZE, type=int), 10000))
+    cutoff = import_stats_cutoff()
+    try:
+        importer = AttemptImporter(attempts_col, batch_size, on_inserted=count_recent_imports(cutoff))
+        report = importer.import_lines(request.stream)
+    except Exception as e:
+        logger.error(f"Attempt import error: {str(e)}")
+        return {"error": "Attempt import failed"}, 500
+
+    user_ids = list(report["user_ids"])
+    jobs = 0
+    try:
+        for start in range(0, len(user_ids), IMPORT_RECOMPUTE_CHUNK):
+            job_queue.enqueue("import_recompute", {"user_ids": user_ids[start:start + IMPORT_RECOMPUTE_CHUNK]})
+            jobs += 1
+        days = import_backfill_days(report, cutoff)
+        if days:
+            job_queue.enqueue("import_daily_stats", {"days": days, "until": cutoff.isoformat()})
+            jobs += 1
+    except Exception as e:
+        logger.warning(f"Could not queue import recomputation: {e}")
+
+    first, last = report["first_submitted_at"], report["last_submitted_at"]
+    return {
+        "read": report["read"],
+        "inserted": report["inserted"],
+        "duplicates": report["duplicates"],
+        "invalid": report["invalid"],
+        "failed": report["failed"],
+        "errors": report["errors"],
+        "students": len(user_ids),
+        "firstSubmittedAt": first.isoformat() if first else None,
+        "lastSubmittedAt": last.isoformat() if last else None,
+        "recomputeJobs": jobs
+    }, 200
+
 @app.post("/api/admin/users/create")
 @role_required(["admin"])
 def create_user_by_admin():
@@ -3379,6 +4211,11 @@ def create_user_by_admin():
         
         res = users_col.insert_one(doc)
         
+        try:
+            daily_stats.record_signup(doc["created_at"])
+        except Exception as e:
+            logger.warning(f"Could not update daily stats: {e}")
+        
         logger.info(f"Admin {request.user['email']} created user: {email} with role: {role}")
         
         return {
@@ -3395,6 +4232,8 @@ def create_user_by_admin():
         logger.error(f"Admin create user error: {str(e)}")
         return {"error": "Failed to create user"}, 500
     
+platform_queries = PlatformAnalyticsQueries(users_col, courses_col, quizzes_col, attempts_col, profiles_col)
+
 @app.get("/api/analytics/overview")
 @auth_required
 def get_platform_analytics():
@@ -3420,64 +4259,39 @@ def get_platform_analytics():
         }
         
         # ═══════════════════════════════════════════════════════
-        # 1. Platform Statistics (Safe counts)
+        # 1. Platform Statistics (one aggregation per collection)
         # ═══════════════════════════════════════════════════════
         
-        try:
-            total_users = users_col.count_documents({})
-            students_count = users_col.count_documents({"role": "student"})
-            teachers_count = users_col.count_documents({"role": "teacher"})
-            admins_count = users_col.count_documents({"role": "admin"})
-        except Exception as e:
-            logger.error(f"User count error: {str(e)}")
-            total_users = students_count = teachers_count = admins_count = 0
-        
-        try:
-            total_courses = courses_col.count_documents({})
-            active_courses = courses_col.count_documents({"status": "active"})
-        except Exception as e:
-            logger.error(f"Course count error: {str(e)}")
-            total_courses = active_courses = 0
-        
-        try:
-            total_quizzes = quizzes_col.count_documents({})
-        except Exception as e:
-            logger.error(f"Quiz count error: {str(e)}")
-            total_quizzes = 0
-        
-        try:
-            total_attempts = attempts_col.count_documents({})
-        except Exception as e:
-            logger.error(f"Attempts count error: {str(e)}")
-            total_attempts = 0
+        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+        stats = platform_queries.overview(since=seven_days_ago)
         
-        try:
-            total_profiles = profiles_col.count_documents({})
-            complete_profiles = profiles_col.count_documents({
-                "demographics.name": {"$exists": True, "$ne": ""}
-            })
-        except Exception as e:
-            logger.error(f"Profile count error: {str(e)}")
-            total_profiles = complete_profiles = 0
+        users = stats["users"] or {"total": 0, "students": 0, "teachers": 0, "admins": 0, "new_since": 0}
+        courses = stats["courses"] or {"total": 0, "active": 0}
+        quizzes = stats["quizzes"] or {"total": 0}
+        attempts = stats["attempts"] or {"total": 0, "active_users": 0, "avg_score": 0, "recent": 0, "popular_topics": []}
+        profiles = stats["profiles"] or {
+            "total": 0, "complete": 0, "top_students": [],
+            "skills": {"beginner": 0, "intermediate": 0, "advanced": 0, "expert": 0}
+        }
         
         response["platform"] = {
-            "totalUsers": total_users,
-            "totalCourses": total_courses,
-            "totalQuizzes": total_quizzes,
-            "totalAttempts": total_attempts,
-            "totalProfiles": total_profiles,
+            "totalUsers": users["total"],
+            "totalCourses": courses["total"],
+            "totalQuizzes": quizzes["total"],
+            "totalAttempts": attempts["total"],
+            "totalProfiles": profiles["total"],
             "usersByRole": {
-                "students": students_count,
-                "teachers": teachers_count,
-                "admins": admins_count
+                "students": users["students"],
+                "teachers": users["teachers"],
+                "admins": users["admins"]
             },
             "courseStats": {
-                "active": active_courses,
-                "total": total_courses
+                "active": courses["active"],
+                "total": courses["total"]
             },
             "profileStats": {
-                "complete": complete_profiles,
-                "incomplete": total_profiles - complete_profiles
+                "complete": profiles["complete"],
+                "incomplete": profiles["total"] - profiles["complete"]
             }
         }
         
@@ -3485,85 +4299,19 @@ def get_platform_analytics():
         # 2. Engagement Metrics
         # ═══════════════════════════════════════════════════════
         
-        try:
-            active_users = len(attempts_col.distinct("userId"))
-        except Exception as e:
-            logger.error(f"Active users error: {str(e)}")
-            active_users = 0
-        
-        avg_quizzes_per_user = round(total_attempts / total_users, 2) if total_users > 0 else 0
-        
-        # Calculate platform average score
-        try:
-            all_attempts = list(attempts_col.find({}, {"score.percentage": 1, "_id": 0}).limit(1000))
-            if all_attempts:
-                total_score = sum(a.get("score", {}).get("percentage", 0) for a in all_attempts)
-                platform_avg_score = round(total_score / len(all_attempts), 2)
-            else:
-                platform_avg_score = 0
-        except Exception as e:
-            logger.error(f"Average score error: {str(e)}")
-            platform_avg_score = 0
-        
-        # Recent activity (last 7 days) - with flexible date field handling
-        try:
-            seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-            
-            # Try different date field names for attempts
-            recent_attempts = 0
-            for field in ["submittedAt", "created_at", "createdAt", "timestamp"]:
-                try:
-                    recent_attempts = attempts_col.count_documents({
-                        field: {"$gte": seven_days_ago}
-                    })
-                    if recent_attempts > 0:
-                        break
-                except:
-                    continue
-        except Exception as e:
-            logger.error(f"Recent attempts error: {str(e)}")
-            recent_attempts = 0
-        
-        # New users (last 7 days)
-        try:
-            new_users = 0
-            for field in ["createdAt", "created_at", "timestamp"]:
-                try:
-                    new_users = users_col.count_documents({
-                        field: {"$gte": seven_days_ago}
-                    })
-                    if new_users > 0:
-                        break
-                except:
-                    continue
-        except Exception as e:
-            logger.error(f"New users error: {str(e)}")
-            new_users = 0
-        
         response["engagement"] = {
-            "activeUsers": active_users,
-            "avgQuizzesPerUser": avg_quizzes_per_user,
-            "platformAvgScore": platform_avg_score,
-            "recentAttempts7d": recent_attempts,
-            "newUsers7d": new_users
+            "activeUsers": attempts["active_users"],
+            "avgQuizzesPerUser": round(attempts["total"] / users["total"], 2) if users["total"] > 0 else 0,
+            "platformAvgScore": attempts["avg_score"],
+            "recentAttempts7d": attempts["recent"],
+            "newUsers7d": users["new_since"]
         }
         
         # ═══════════════════════════════════════════════════════
         # 3. Skill Distribution
         # ═══════════════════════════════════════════════════════
         
-        try:
-            response["skillDistribution"] = {
-                "beginner": profiles_col.count_documents({"currentSkillLevel": "beginner"}),
-                "intermediate": profiles_col.count_documents({"currentSkillLevel": "intermediate"}),
-                "advanced": profiles_col.count_documents({"currentSkillLevel": "advanced"}),
-                "expert": profiles_col.count_documents({"currentSkillLevel": "expert"})
-            }
-        except Exception as e:
-            logger.error(f"Skill distribution error: {str(e)}")
-            response["skillDistribution"] = {
-                "beginner": 0, "intermediate": 0, "advanced": 0, "expert": 0
-            }
+        response["skillDistribution"] = profiles["skills"]
         
         # ═══════════════════════════════════════════════════════
         # 4. ML Features
@@ -3578,13 +4326,8 @@ def get_platform_analytics():
             "nlpEnhancement": True
         }
         
-        # Check NLP model
-        try:
-            import spacy
-            nlp = spacy.load("en_core_web_md")
-            response["mlFeatures"]["nlpEnhancement"] = True
-        except:
-            response["mlFeatures"]["nlpEnhancement"] = False
+        # Check NLP model (shared pipeline, never reloaded per request)
+        response["mlFeatures"]["nlpEnhancement"] = spacy_pipeline.nlp is not None
         
         # ═══════════════════════════════════════════════════════
         # 5. System Health
@@ -3612,54 +4355,11 @@ def get_platform_analytics():
         }
         
         # ═══════════════════════════════════════════════════════
-        # 6. Top Students (Optional - can fail gracefully)
-        # ═══════════════════════════════════════════════════════
-        
-        try:
-            top_students = list(profiles_col.find(
-                {"quizAnalytics.avgScore": {"$exists": True}},
-                {
-                    "demographics.name": 1,
-                    "quizAnalytics.avgScore": 1,
-                    "quizAnalytics.totalQuizzes": 1,
-                    "currentSkillLevel": 1
-                }
-            ).sort("quizAnalytics.avgScore", -1).limit(5))
-            
-            response["topStudents"] = [
-                {
-                    "name": s.get("demographics", {}).get("name", "Unknown"),
-                    "avgScore": s.get("quizAnalytics", {}).get("avgScore", 0),
-                    "totalQuizzes": s.get("quizAnalytics", {}).get("totalQuizzes", 0),
-                    "skillLevel": s.get("currentSkillLevel", "beginner")
-                }
-                for s in top_students
-            ]
-        except Exception as e:
-            logger.error(f"Top students error: {str(e)}")
-            response["topStudents"] = []
-        
-        # ═══════════════════════════════════════════════════════
-        # 7. Popular Topics (Optional)
+        # 6. Top Students & 7. Popular Topics (from the same queries)
         # ═══════════════════════════════════════════════════════
         
-        try:
-            popular = list(attempts_col.aggregate([
-                {"$group": {
-                    "_id": "$topic",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"count": -1}},
-                {"$limit": 5}
-            ]))
-            
-            response["popularTopics"] = [
-                {"topic": p["_id"], "attempts": p["count"]}
-                for p in popular if p.get("_id")
-            ]
-        except Exception as e:
-            logger.error(f"Popular topics error: {str(e)}")
-            response["popularTopics"] = []
+        response["topStudents"] = profiles["top_students"]
+        response["popularTopics"] = attempts["popular_topics"]
         
         logger.info(f"✅ Admin analytics accessed successfully")
         return response, 200
@@ -3689,71 +4389,25 @@ def get_growth_analytics():
         if user_role != "admin":
             return {"error": "Admin access required"}, 403
         
-        # Get daily user registrations for last 30 days
-        thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-        
-        daily_registrations = list(users_col.aggregate([
-            {
-                "$match": {
-                    "createdAt": {"$gte": thirty_days_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$createdAt"
-                        }
-                    },
-                    "count": {"$sum": 1}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]))
-        
-        # Get daily quiz attempts
-        daily_attempts = list(attempts_col.aggregate([
-            {
-                "$match": {
-                    "submittedAt": {"$gte": thirty_days_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$submittedAt"
-                        }
-                    },
-                    "count": {"$sum": 1},
-                    "avgScore": {"$avg": "$score.percentage"}
-                }
-            },
-            {
-                "$sort": {"_id": 1}
-            }
-        ]))
+        # Read the last 30 daily rollup documents instead of grouping raw history
+        days = daily_stats.range(30)
         
         return {
             "status": "success",
             "userGrowth": [
                 {
-                    "date": item["_id"],
-                    "newUsers": item["count"]
+                    "date": day["_id"],
+                    "newUsers": day["new_users"]
                 }
-                for item in daily_registrations
+                for day in days if day.get("new_users")
             ],
             "quizActivity": [
                 {
-                    "date": item["_id"],
-                    "attempts": item["count"],
-                    "avgScore": round(item["avgScore"], 2)
+                    "date": day["_id"],
+                    "attempts": day["attempts"],
+                    "avgScore": round(day["score_sum"] / max(day.get("score_count", 0), 1), 2)
                 }
-                for item in daily_attempts
+                for day in days if day.get("attempts")
             ]
         }, 200
         
@@ -3762,6 +4416,62 @@ def get_growth_analytics():
         return {"error": "Failed to load growth data"}, 500
 
 
+@app.cli.command("backfill-daily-stats")
+@click.option("--days", type=int, default=None, help="Only rebuild the last N days (default: all history)")
+def backfill_daily_stats(days):
+    """Rebuild daily_stats rollups from the users and attempts collections.
+
+    Today is left alone: live submits and signups keep incrementing it.
+    """
+    count = daily_stats.backfill(users_col, attempts_col, days=days)
+    print(f"✅ Rebuilt {count} daily stats documents")
+
+
+@app.cli.command("import-attempts")
+@click.argument("path", type=click.Path(allow_dash=True))
+@click.option("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Documents per insert_many batch")
+@click.option("--skip-recompute", is_flag=True, help="Only insert; leave feature state, predictions and daily stats as they are")
+def import_attempts(path, batch_size, skip_recompute):
+    """Bulk-load quiz attempts from a JSON-lines file (.gz allowed, - for stdin)"""
+    started = time()
+    cutoff = import_stats_cutoff()
+    importer = AttemptImporter(attempts_col, batch_size,
+                               on_inserted=None if skip_recompute else count_recent_imports(cutoff))
+    if path == "-":
+        report = importer.import_lines(sys.stdin)
+    else:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as lines:
+            report = importer.import_lines(lines)
+    print(f"📥 {report['inserted']} inserted, {report['duplicates']} duplicates, "
+          f"{report['invalid']} invalid, {report['failed']} failed in {time() - started:.1f}s")
+    for error in report["errors"]:
+        print(f"⚠️ line {error['line']}: {error['error']}")
+
+    if skip_recompute or not report["user_ids"]:
+        return
+    user_ids = list(report["user_ids"])
+    for start in range(0, len(user_ids), IMPORT_RECOMPUTE_CHUNK):
+        recompute_imported_students({"user_ids": user_ids[start:start + IMPORT_RECOMPUTE_CHUNK]})
+    backfill_days = import_backfill_days(report, cutoff)
+    days = backfill_imported_days({"days": backfill_days, "until": cutoff.isoformat()}) if backfill_days else 0
+    print(f"✅ Recomputed {len(user_ids)} students and {days} daily stats documents in {time() - started:.1f}s")
+
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    """Explain every registered query shape and fail if one scans a whole collection"""
+    if hasattr(users_col, '_data'):
+        raise click.ClickException("check-indexes needs a MongoDB server (MONGO_MODE=mongo)")
+    ensure_indexes()
+    problems = check_query_patterns(COLLECTIONS)
+    for name, problem in problems:
+        print(f"❌ {name}: {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("✅ Every registered query shape uses an index")
+
+
 # ========================================
 # UTILITY FUNCTIONS FOR SAMPLE DATA
 # ========================================
@@ -3810,6 +4520,7 @@ def create_sample_data():
             "instructor_id": "68aae935f54d893617540f5c",
             "instructor_name": "teacher",
             "enrolled_students": [],
+            "enrolled_count": 0,
             "max_students": 50,
             "difficulty_level": "beginner",
             "duration_weeks": 8,
@@ -3870,9 +4581,12 @@ def debug_ml_status():
     """Check ML model status"""
     return {
         "ml_predictor_trained": ml_predictor.is_trained,
-        "spacy_model": spacy_model,
-        "spacy_available": nlp is not None,
-        "nlp_processor_ready": nlp_processor.nlp is not None if nlp_processor else False,
+        "ml_artifact_version": ml_predictor.artifact_version,
+        "ml_artifact_dir": ml_predictor.artifact_store.directory,
+        "spacy_model": spacy_pipeline.name,
+        "spacy_available": spacy_pipeline.ready,
+        "nlp_processor_ready": nlp_processor.pipeline.ready if nlp_processor else False,
+        "spacy_models": spacy_registry.stats(),
         "feature_names": ml_predictor.feature_names,
         "model_info": {
             "skill_classifier": type(ml_predictor.skill_classifier).__name__,
@@ -3893,6 +4607,20 @@ def debug_train_ml():
     except Exception as e:
         return {"error": str(e)}, 500
 
+@app.get("/api/debug/cache-stats")
+def debug_cache_stats():
+    """Hit/miss counters for the LLM response caches"""
+    return {
+        "quiz": quiz_cache.stats(),
+        "content": content_cache.stats(),
+        "topics": topic_normalizer.stats()
+    }
+
+@app.get("/api/debug/jobs")
+def debug_jobs():
+    """Background job queue depth, lag and counters"""
+    return {**job_queue.metrics(), "content": content_queue.metrics()}
+
 @app.get("/api/debug/users")
 def debug_users():
     """Debug endpoint to see users"""
@@ -3947,7 +4675,16 @@ def health():
         return {
             "ok": True, 
             "ml_ready": ml_predictor.is_trained,
-            "spacy_ready": nlp is not None,
+            "spacy_ready": spacy_pipeline.ready,
+            "spacy_models": spacy_registry.stats(),
+            "caches": {
+                "quiz": quiz_cache.stats()
+            },
+            "jobs": job_queue.metrics(),
+            "contentJobs": content_queue.metrics(),
+            "llm": llm_client.metrics(),
+            "database": pool_stats(),
+            "logging": logging_stats(),
             "features": [
                 "RANDOM_FOREST_PREDICTION", 
                 "SPACY_NLP_PROCESSING", 
@@ -3972,8 +4709,39 @@ def internal_error(error):
     return {"error": "Internal server error"}, 500
 
 @app.before_request
-def log_request():
-    logger.info(f"{request.method} {request.url}")
+def start_request_timer():
+    g.request_started = time()
+
+# ========================================
+# BACKGROUND WORKERS
+# ========================================
+def start_background_workers():
+    """Start job workers and outbox sweepers once per process (no-op when already running)"""
+    job_queue.start()
+    content_queue.start()
+
+JOB_WORKERS_AUTOSTART = os.getenv("JOB_WORKERS_AUTOSTART", "1").lower() in ("1", "true", "yes")
+if JOB_WORKERS_AUTOSTART:
+    # Start now so outbox jobs left by a crash are replayed without waiting for new work
+    start_background_workers()
+
+@app.before_request
+def ensure_background_workers():
+    # Workers forked from a preloaded app do not inherit the threads; start them on first request
+    if JOB_WORKERS_AUTOSTART:
+        start_background_workers()
+
+@app.after_request
+def log_request(response):
+    started = getattr(g, "request_started", None)
+    # Server errors are never sampled away
+    level = logging.WARNING if response.status_code >= 500 else logging.INFO
+    if request_logger.isEnabledFor(level):
+        request_logger.log(level, "%s %s %s", request.method, request.path, response.status_code, extra={"fields": {
+            "status": response.status_code,
+            "duration_ms": round((time() - started) * 1000, 1) if started else None
+        }})
+    return response
 
 # ========================================
 # MAIN ENTRY POINT
@@ -3984,17 +4752,17 @@ if __name__ == "__main__":
         create_sample_data()
         ensure_indexes()
         
-        # Train ML models with sample data
+        # Load the persisted ML models (trains and publishes them on first boot)
         try:
-            ml_predictor.train_model()
-            print("✅ ML models trained successfully")
+            ml_predictor.load_or_train()
+            print(f"✅ ML models ready (artifact {ml_predictor.artifact_version})")
         except Exception as e:
             print(f"⚠️ ML model training failed: {e}")
         
         print("🚀 Starting Advanced AI-Powered Education Backend...")
         print("🤖 Features: Random Forest ML, spaCy NLP, Personalized Content")
         print(f"📊 ML Models: {'Trained' if ml_predictor.is_trained else 'Not Trained'}")
-        print(f"🧠 spaCy Model: {spacy_model or 'Not Available'}")
+        print(f"🧠 spaCy Model: {spacy_pipeline.name or 'loaded on first use'}")
         
         # Railway-compatible port configuration
         port = int(os.environ.get("PORT", 5000))
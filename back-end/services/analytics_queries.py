@@ -0,0 +1,234 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Date fields checked (in order) for "recent" counts; the first one with any
+# matches wins, as different importers stored timestamps under different names
+RECENT_ATTEMPT_FIELDS = ["submittedAt", "created_at", "createdAt", "timestamp"]
+RECENT_USER_FIELDS = ["createdAt", "created_at", "timestamp"]
+SKILL_LEVELS = ["beginner", "intermediate", "advanced", "expert"]
+
+
+def _is_mock(collection):
+    return hasattr(collection, '_data')
+
+
+def _first_nonzero(counts, fields):
+    for field in fields:
+        if counts.get(field):
+            return counts[field]
+    return 0
+
+
+def _is_recent(value, since):
+    if not isinstance(value, datetime):
+        return False  # MongoDB never matches a date range against other types
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value >= since
+
+
+def _count(facet_result):
+    return facet_result[0]["n"] if facet_result else 0
+
+
+def _recent_facets(fields, since):
+    return {
+        f"recent_{field}": [{"$match": {field: {"$gte": since}}}, {"$count": "n"}]
+        for field in fields
+    }
+
+
+class PlatformAnalyticsQueries:
+    """Admin overview statistics with one aggregation per collection.
+
+    Each collection is read with a single $facet pipeline and the pipelines
+    run concurrently, so the overview costs one round trip of wall time
+    instead of a count_documents call per statistic. The mock database is
+    served by an equivalent single pass over each collection.
+    """
+
+    def __init__(self, users_col, courses_col, quizzes_col, attempts_col, profiles_col, max_workers=5):
+        self.users_col = users_col
+        self.courses_col = courses_col
+        self.quizzes_col = quizzes_col
+        self.attempts_col = attempts_col
+        self.profiles_col = profiles_col
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analytics")
+
+    # ------------------------------------------------------------------
+    # Per-collection queries
+    # ------------------------------------------------------------------
+    def user_stats(self, since):
+        if _is_mock(self.users_col):
+            by_role, recent = {}, dict.fromkeys(RECENT_USER_FIELDS, 0)
+            for doc in self.users_col._data:
+                by_role[doc.get("role")] = by_role.get(doc.get("role"), 0) + 1
+                for field in RECENT_USER_FIELDS:
+                    if _is_recent(doc.get(field), since):
+                        recent[field] += 1
+            total = len(self.users_col._data)
+        else:
+            facets = {
+                "total": [{"$count": "n"}],
+                "byRole": [{"$group": {"_id": "$role", "n": {"$sum": 1}}}],
+                **_recent_facets(RECENT_USER_FIELDS, since)
+            }
+            result = next(self.users_col.aggregate([{"$facet": facets}]))
+            total = _count(result["total"])
+            by_role = {row["_id"]: row["n"] for row in result["byRole"]}
+            recent = {field: _count(result[f"recent_{field}"]) for field in RECENT_USER_FIELDS}
+
+        return {
+            "total": total,
+            "students": by_role.get("student", 0),
+            "teachers": by_role.get("teacher", 0),
+            "admins": by_role.get("admin", 0),
+            "new_since": _first_nonzero(recent, RECENT_USER_FIELDS)
+        }
+
+    def attempt_stats(self, since, top_topics=5):
+        if _is_mock(self.attempts_col):
+            user_ids, topics = set(), {}
+            recent = dict.fromkeys(RECENT_ATTEMPT_FIELDS, 0)
+            score_sum = 0
+            for doc in self.attempts_col._data:
+                if "userId" in doc:
+                    user_ids.add(doc["userId"])
+                score_sum += (doc.get("score") or {}).get("percentage", 0) or 0
+                topics[doc.get("topic")] = topics.get(doc.get("topic"), 0) + 1
+                for field in RECENT_ATTEMPT_FIELDS:
+                    if _is_recent(doc.get(field), since):
+                        recent[field] += 1
+            total = len(self.attempts_col._data)
+            avg_score = score_sum / total if total else 0
+            popular = sorted(topics.items(), key=lambda item: -item[1])[:top_topics]
+            active_users = len(user_ids)
+        else:
+            facets = {
+                "total": [{"$count": "n"}],
+                "activeUsers": [
+                    {"$match": {"userId": {"$exists": True}}},
+                    {"$group": {"_id": "$userId"}},
+                    {"$count": "n"}
+                ],
+                "avgScore": [{"$group": {"_id": None, "avg": {"$avg": {"$ifNull": ["$score.percentage", 0]}}}}],
+                "popularTopics": [
+                    {"$group": {"_id": "$topic", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": top_topics}
+                ],
+                **_recent_facets(RECENT_ATTEMPT_FIELDS, since)
+            }
+            result = next(self.attempts_col.aggregate([{"$facet": facets}], allowDiskUse=True))
+            total = _count(result["total"])
+            active_users = _count(result["activeUsers"])
+            avg_score = result["avgScore"][0]["avg"] if result["avgScore"] else 0
+            popular = [(row["_id"], row["count"]) for row in result["popularTopics"]]
+            recent = {field: _count(result[f"recent_{field}"]) for field in RECENT_ATTEMPT_FIELDS}
+
+        return {
+            "total": total,
+            "active_users": active_users,
+            "avg_score": round(avg_score or 0, 2),
+            "recent": _first_nonzero(recent, RECENT_ATTEMPT_FIELDS),
+            "popular_topics": [{"topic": topic, "attempts": count} for topic, count in popular if topic]
+        }
+
+    def course_stats(self):
+        if _is_mock(self.courses_col):
+            docs = self.courses_col._data
+            return {"total": len(docs), "active": sum(1 for d in docs if d.get("status") == "active")}
+        result = next(self.courses_col.aggregate([{"$facet": {
+            "total": [{"$count": "n"}],
+            "active": [{"$match": {"status": "active"}}, {"$count": "n"}]
+        }}]))
+        return {"total": _count(result["total"]), "active": _count(result["active"])}
+
+    def quiz_stats(self):
+        # A plain total needs no filter, so collection metadata is enough
+        return {"total": self.quizzes_col.estimated_document_count()}
+
+    def profile_stats(self, top_students=5):
+        if _is_mock(self.profiles_col):
+            docs = self.profiles_col._data
+            skills = dict.fromkeys(SKILL_LEVELS, 0)
+            complete = 0
+            for doc in docs:
+                demographics = doc.get("demographics") or {}
+                if "name" in demographics and demographics["name"] != "":
+                    complete += 1
+                if doc.get("currentSkillLevel") in skills:
+                    skills[doc["currentSkillLevel"]] += 1
+            scored = [d for d in docs if "avgScore" in (d.get("quizAnalytics") or {})]
+            top = sorted(scored, key=lambda d: d["quizAnalytics"]["avgScore"], reverse=True)[:top_students]
+            total = len(docs)
+        else:
+            result = next(self.profiles_col.aggregate([{"$facet": {
+                "total": [{"$count": "n"}],
+                "complete": [{"$match": {"demographics.name": {"$exists": True, "$ne": ""}}}, {"$count": "n"}],
+                "skills": [
+                    {"$match": {"currentSkillLevel": {"$in": SKILL_LEVELS}}},
+                    {"$group": {"_id": "$currentSkillLevel", "n": {"$sum": 1}}}
+                ],
+                "top": [
+                    {"$match": {"quizAnalytics.avgScore": {"$exists": True}}},
+                    {"$sort": {"quizAnalytics.avgScore": -1}},
+                    {"$limit": top_students},
+                    {"$project": {
+                        "demographics.name": 1,
+                        "quizAnalytics.avgScore": 1,
+                        "quizAnalytics.totalQuizzes": 1,
+                        "currentSkillLevel": 1
+                    }}
+                ]
+            }}]))
+            total = _count(result["total"])
+            complete = _count(result["complete"])
+            skills = dict.fromkeys(SKILL_LEVELS, 0)
+            skills.update({row["_id"]: row["n"] for row in result["skills"]})
+            top = result["top"]
+
+        return {
+            "total": total,
+            "complete": complete,
+            "skills": skills,
+            "top_students": [
+                {
+                    "name": s.get("demographics", {}).get("name", "Unknown"),
+                    "avgScore": s.get("quizAnalytics", {}).get("avgScore", 0),
+                    "totalQuizzes": s.get("quizAnalytics", {}).get("totalQuizzes", 0),
+                    "skillLevel": s.get("currentSkillLevel", "beginner")
+                }
+                for s in top
+            ]
+        }
+
+    # ------------------------------------------------------------------
+    # Combined overview
+    # ------------------------------------------------------------------
+    def overview(self, since):
+        """Run every collection query concurrently; a failed one yields None"""
+        queries = {
+            "users": (self.user_stats, (since,)),
+            "attempts": (self.attempt_stats, (since,)),
+            "courses": (self.course_stats, ()),
+            "quizzes": (self.quiz_stats, ()),
+            "profiles": (self.profile_stats, ())
+        }
+        if _is_mock(self.users_col):
+            # In-memory scans gain nothing from threads
+            futures = None
+        else:
+            futures = {name: self._executor.submit(fn, *args) for name, (fn, args) in queries.items()}
+
+        results = {}
+        for name, (fn, args) in queries.items():
+            try:
+                results[name] = futures[name].result() if futures else fn(*args)
+            except Exception as e:
+                logger.error(f"{name.capitalize()} analytics query error: {str(e)}")
+                results[name] = None
+        return results
@@ -0,0 +1,186 @@
+import json
+import logging
+import math
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+MAX_REPORTED_ERRORS = 50
+
+
+def _parse_time(value):
+    if value in (None, ""):
+        raise ValueError("submitted_at is required")
+    if isinstance(value, dict) and "$date" in value:
+        value = value["$date"]  # mongoexport extended JSON: ISO string or epoch millis
+        if isinstance(value, dict) and "$numberLong" in value:
+            value = value["$numberLong"]
+    try:
+        if isinstance(value, datetime):
+            when = value
+        elif isinstance(value, str) and value.lstrip("-").isdigit():
+            when = datetime.fromtimestamp(int(value) / 1000, timezone.utc)
+        elif isinstance(value, str):
+            when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            when = datetime.fromtimestamp(value / 1000, timezone.utc)
+        else:
+            raise ValueError
+    except (ValueError, OverflowError, OSError):
+        raise ValueError(f"invalid submitted_at: {value!r}") from None
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def _int(value, field):
+    if (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)
+            or value < 0 or int(value) != value):
+        raise ValueError(f"{field} must be a non-negative integer")
+    return int(value)
+
+
+def attempt_from_record(record):
+    """Validate one imported record and return it shaped like quiz_submit's attempt_doc.
+
+    Raises ValueError describing the first problem found. Fields the
+    submit path does not store are dropped; an explicit _id is kept so
+    re-running an import skips attempts that are already there.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+
+    user_id = record.get("user_id")
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError("user_id must be a non-empty string")
+    if record.get("quiz_id") in (None, ""):
+        raise ValueError("quiz_id is required")
+
+    submitted_at = _parse_time(record.get("submitted_at") or record.get("submittedAt"))
+
+    score = record.get("score")
+    if not isinstance(score, dict):
+        raise ValueError("score must be an object with total and correct")
+    total = _int(score.get("total"), "score.total")
+    correct = _int(score.get("correct"), "score.correct")
+    if correct > total:
+        raise ValueError("score.correct cannot exceed score.total")
+
+    percentage = record.get("percentage")
+    if percentage is None:
+        percentage = round((correct / total) * 100, 2) if total > 0 else 0
+    elif (isinstance(percentage, bool) or not isinstance(percentage, (int, float)) or not math.isfinite(percentage)
+            or not 0 <= percentage <= 100):
+        raise ValueError("percentage must be a number between 0 and 100")
+
+    for field in ("answers", "detail", "question_ids"):
+        if not isinstance(record.get(field, []), list):
+            raise ValueError(f"{field} must be a list")
+
+    attempt = {
+        "user_id": user_id,
+        "quiz_id": str(record["quiz_id"]),
+        "submitted_at": submitted_at,
+        "submittedAt": submitted_at.isoformat(),
+        "answers": record.get("answers", []),
+        "score": {"total": total, "correct": correct},
+        "percentage": percentage,
+        "detail": record.get("detail", []),
+        "topic": str(record.get("topic") or "Unknown"),
+        "category": str(record.get("category") or "General"),
+        "difficulty": str(record.get("difficulty") or "beginner"),
+        "type": str(record.get("type") or "practice"),
+        "question_ids": record.get("question_ids", [])
+    }
+    if record.get("_id") is not None:
+        legacy_id = record["_id"]
+        if isinstance(legacy_id, dict) and "$oid" in legacy_id:
+            legacy_id = legacy_id["$oid"]  # mongoexport extended JSON
+        attempt["_id"] = ObjectId(legacy_id) if ObjectId.is_valid(legacy_id) else str(legacy_id)
+    return attempt
+
+
+class AttemptImporter:
+    """Stream JSON-lines attempt records into the attempts collection.
+
+    Records are validated one by one and written in unordered insert_many
+    batches, so one bad or duplicate row never stops the rest of its batch.
+    Nothing derived from attempts (feature state, snapshots, predictions,
+    daily stats) is touched here; the report lists the affected students
+    and date range so the caller can recompute them once at the end.
+    on_inserted, if given, is called with each batch's newly inserted
+    attempts (duplicates and failed writes left out).
+    """
+
+    def __init__(self, collection, batch_size=1000, progress_every=100000, on_inserted=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.on_inserted = on_inserted
+
+    def _flush(self, batch, line_numbers, report):
+        rejected = set()
+        try:
+            result = self.collection.insert_many(batch, ordered=False)
+            report["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            report["inserted"] += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                rejected.add(error["index"])
+                if error.get("code") == DUPLICATE_KEY:
+                    report["duplicates"] += 1
+                    continue
+                report["failed"] += 1
+                self._error(report, line_numbers[error["index"]], error.get("errmsg", "write failed"))
+        if self.on_inserted:
+            self.on_inserted([attempt for index, attempt in enumerate(batch) if index not in rejected])
+
+    @staticmethod
+    def _error(report, line, message):
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line, "error": message})
+
+    def import_lines(self, lines):
+        """Import an iterable of JSON lines; returns a report dict"""
+        report = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "failed": 0,
+                  "errors": [], "user_ids": set(), "first_submitted_at": None, "last_submitted_at": None}
+        batch, line_numbers = [], []
+
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            report["read"] += 1
+            try:
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8")
+                attempt = attempt_from_record(json.loads(line))
+            except Exception as e:
+                # A bad record must never abort an import whose earlier batches are already written
+                report["invalid"] += 1
+                self._error(report, line_number, str(e) or type(e).__name__)
+                continue
+
+            batch.append(attempt)
+            line_numbers.append(line_number)
+            report["user_ids"].add(attempt["user_id"])
+            when = attempt["submitted_at"]
+            if report["first_submitted_at"] is None or when < report["first_submitted_at"]:
+                report["first_submitted_at"] = when
+            if report["last_submitted_at"] is None or when > report["last_submitted_at"]:
+                report["last_submitted_at"] = when
+
+            if len(batch) >= self.batch_size:
+                self._flush(batch, line_numbers, report)
+                batch, line_numbers = [], []
+            if report["read"] % self.progress_every == 0:
+                logger.info(f"📥 Attempt import: {report['read']} read, {report['inserted']} inserted")
+
+        if batch:
+            self._flush(batch, line_numbers, report)
+        logger.info(
+            f"✅ Attempt import finished: {report['inserted']} inserted, {report['duplicates']} duplicates, "
+            f"{report['invalid']} invalid, {report['failed']} failed"
+        )
+        return report
@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+JOB_TTL = timedelta(days=1)
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class ContentJobStore:
+    """Status and partial results of asynchronous content generation jobs.
+
+    Each job is one document; every finished stage is written under
+    stages.<name> together with an increasing seq, so pollers and event
+    streams can pick up where they left off. Waiters in this process are
+    woken immediately; waiters elsewhere see the change on their next read.
+    """
+
+    def __init__(self, collection, ttl=JOB_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self._changed = threading.Condition()
+
+    def create(self, user_id, params):
+        now = datetime.now(timezone.utc)
+        job_id = uuid.uuid4().hex
+        self.collection.insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "params": params,
+            "status": "queued",
+            "seq": 0,
+            "stage_order": [],
+            "stages": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.ttl
+        })
+        return job_id
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+    def _update(self, job_id, update, seq=None):
+        """Apply an update; with seq, only if the job has not changed since it was read"""
+        update.setdefault("$set", {})["updated_at"] = datetime.now(timezone.utc)
+        update["$inc"] = {"seq": 1}
+        query = {"_id": job_id} if seq is None else {"_id": job_id, "seq": seq}
+        result = self.collection.update_one(query, update)
+        with self._changed:
+            self._changed.notify_all()
+        return (result.get("matched_count", 0) if isinstance(result, dict) else result.matched_count) > 0
+
+    def start(self, job_id):
+        """Mark the job running in this process; False if it must not be (re)run here"""
+        job = self.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return False
+        if job["status"] == "running" and job.get("owner_pid") == os.getpid():
+            return False  # Already running in this process
+        # A job replayed from a dead process starts over, so results from the interrupted run are dropped
+        return self._update(job_id, {"$set": {
+            "status": "running", "owner_pid": os.getpid(), "stage_order": [], "stages": {}, "error": None
+        }}, seq=job["seq"])
+
+    def record_stage(self, job_id, stage, data):
+        self._update(job_id, {"$set": {f"stages.{stage}": data}, "$push": {"stage_order": stage}})
+
+    def finish(self, job_id, result):
+        self._update(job_id, {"$set": {"status": "done", "result": result}})
+
+    def fail(self, job_id, error):
+        self._update(job_id, {"$set": {"status": "failed", "error": error}})
+
+    def wait(self, job_id, seq, timeout=1.0):
+        """Block until the job moves past seq (or timeout), then return the latest document"""
+        job = self.get(job_id)
+        if job is None or job["seq"] > seq or job["status"] in TERMINAL_STATUSES:
+            return job
+        with self._changed:
+            self._changed.wait(timeout)
+        return self.get(job_id)
@@ -0,0 +1,116 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEVEL_SCORES = {"beginner": 1, "intermediate": 2, "pro": 3}
+
+# Everything the catalog cards show; the enrolled_students array is never shipped
+CATALOG_FIELDS = [
+    "title", "description", "category", "instructor_name", "max_students",
+    "difficulty_level", "duration_weeks", "tags", "is_active", "created_at"
+]
+
+
+def _is_mock(collection):
+    return hasattr(collection, '_data')
+
+
+def recommendation_score(user_level, course_level):
+    """How well a course level suits a student level (1.0 exact, 0.7 adjacent, 0.3 distant)"""
+    user_score = LEVEL_SCORES.get(user_level, 1)
+    course_score = LEVEL_SCORES.get(course_level, 2)
+
+    diff = abs(user_score - course_score)
+    if diff == 0:
+        return 1.0  # Perfect match
+    elif diff == 1:
+        return 0.7  # Adjacent level
+    else:
+        return 0.3  # Distant level
+
+
+def enrolled_count(course):
+    """Maintained counter, falling back to the array for courses created before it existed"""
+    count = course.get("enrolled_count")
+    return count if count is not None else len(course.get("enrolled_students", []))
+
+
+def recommendation_stage(user_level):
+    """$addFields stage computing recommendation_score server-side; mirrors recommendation_score()"""
+    user_score = LEVEL_SCORES.get(user_level, 1)
+    course_score = {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$difficulty_level", level]}, "then": score}
+            for level, score in LEVEL_SCORES.items()
+        ],
+        "default": 2
+    }}
+    diff = {"$abs": {"$subtract": [course_score, user_score]}}
+    return {"$addFields": {"recommendation_score": {"$switch": {
+        "branches": [
+            {"case": {"$eq": [diff, 0]}, "then": 1.0},
+            {"case": {"$eq": [diff, 1]}, "then": 0.7}
+        ],
+        "default": 0.3
+    }}}}
+
+
+class CourseCatalog:
+    """Projected, paginated course listing in a single round trip.
+
+    Enrollment counts come from the enrolled_count counter and a student's
+    enrollment is checked server-side, so the roster arrays never leave the
+    database. When a student level is given, courses are ranked by
+    recommendation score inside the same aggregation pipeline.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def page(self, query, user_id=None, user_level=None, offset=0, limit=None):
+        """Return (courses, total) for one catalog page"""
+        if _is_mock(self.collection):
+            return self._page_in_memory(query, user_id, user_level, offset, limit)
+
+        stages = [
+            {"$match": query},
+            {"$addFields": {
+                "enrolled_count": {"$ifNull": ["$enrolled_count", {"$size": {"$ifNull": ["$enrolled_students", []]}}]},
+                "is_enrolled": {"$in": [user_id, {"$ifNull": ["$enrolled_students", []]}]}
+            }}
+        ]
+        if user_level:
+            stages.append(recommendation_stage(user_level))
+            stages.append({"$sort": {"recommendation_score": -1, "_id": 1}})
+        else:
+            stages.append({"$sort": {"_id": 1}})
+
+        page = [{"$skip": offset}] if offset else []
+        if limit is not None:
+            page.append({"$limit": limit})
+        page.append({"$project": {
+            **{field: 1 for field in CATALOG_FIELDS},
+            "enrolled_count": 1, "is_enrolled": 1, "recommendation_score": 1
+        }})
+
+        stages.append({"$facet": {"total": [{"$count": "n"}], "courses": page}})
+        result = next(self.collection.aggregate(stages))
+        total = result["total"][0]["n"] if result["total"] else 0
+        return result["courses"], total
+
+    def _page_in_memory(self, query, user_id, user_level, offset, limit):
+        courses = []
+        for course in self.collection.find(query):
+            row = {field: course[field] for field in CATALOG_FIELDS if field in course}
+            row["_id"] = course["_id"]
+            row["enrolled_count"] = enrolled_count(course)
+            row["is_enrolled"] = user_id in course.get("enrolled_students", [])
+            if user_level:
+                row["recommendation_score"] = recommendation_score(user_level, course.get("difficulty_level", "intermediate"))
+            courses.append(row)
+
+        if user_level:
+            # Stable sort keeps insertion order within equal scores, like the _id tiebreak
+            courses.sort(key=lambda c: c["recommendation_score"], reverse=True)
+        end = offset + limit if limit is not None else None
+        return courses[offset:end], len(courses)
@@ -0,0 +1,141 @@
+import logging
+from datetime import datetime, timezone, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+USER_DATE_FIELDS = ["created_at", "createdAt"]
+
+
+def day_key(when):
+    """UTC calendar day (YYYY-MM-DD) used as the rollup document _id"""
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _field_key(name):
+    """Make a topic or difficulty usable as a field name ('.' and '$' are reserved)"""
+    return str(name or "Unknown").replace(".", "．").replace("$", "＄")
+
+
+def _attempt_score(attempt):
+    if "percentage" in attempt:
+        return float(attempt["percentage"] or 0)
+    score = attempt.get("score", {})
+    return round(score.get("correct", 0) / max(score.get("total", 1), 1) * 100, 2)
+
+
+def _attempt_increments(attempt):
+    score = _attempt_score(attempt)
+    topic = _field_key(attempt.get("topic", "Unknown"))
+    difficulty = _field_key(attempt.get("difficulty", "beginner"))
+    return {
+        "attempts": 1,
+        "score_sum": score,
+        "score_count": 1,
+        f"topics.{topic}.attempts": 1,
+        f"topics.{topic}.score_sum": score,
+        f"difficulty.{difficulty}.attempts": 1,
+        f"difficulty.{difficulty}.score_sum": score
+    }
+
+
+class DailyStatsRollup:
+    """One small document per UTC day, maintained with $inc on every event.
+
+    Growth charts read N day documents instead of grouping raw users and
+    attempts; backfill() rebuilds the counters from history when needed.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _increment(self, when, increments):
+        key = day_key(when)
+        update = {
+            "$inc": increments,
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+            "$setOnInsert": {"date": key}
+        }
+        try:
+            self.collection.update_one({"_id": key}, update, upsert=True)
+        except DuplicateKeyError:
+            # Two first-of-the-day upserts raced; the document exists now
+            self.collection.update_one({"_id": key}, update)
+
+    def record_signup(self, when=None):
+        self._increment(when or datetime.now(timezone.utc), {"new_users": 1})
+
+    def record_attempt(self, attempt):
+        when = attempt.get("submitted_at") or datetime.now(timezone.utc)
+        self._increment(when, _attempt_increments(attempt))
+
+    def record_attempts(self, attempts):
+        """Fold many attempts in with one $inc per day they fall on"""
+        per_day = {}
+        for attempt in attempts:
+            when = attempt.get("submitted_at") or datetime.now(timezone.utc)
+            increments = per_day.setdefault(day_key(when), (when, {}))[1]
+            for path, value in _attempt_increments(attempt).items():
+                increments[path] = increments.get(path, 0) + value
+        for when, increments in per_day.values():
+            self._increment(when, increments)
+
+    def range(self, days, now=None):
+        """Day documents for the last `days` days, oldest first"""
+        now = now or datetime.now(timezone.utc)
+        start = day_key(now - timedelta(days=days))
+        return list(self.collection.find({"_id": {"$gte": start}}).sort("_id", 1))
+
+    def backfill(self, users_col, attempts_col, days=None, until=None):
+        """Recompute day documents from raw history (all of it, or the last `days` days).
+
+        Only whole days before `until` (default: today's UTC midnight) are
+        rewritten. Live submits and signups $inc the current day, and a $set of
+        totals scanned earlier would overwrite those increments, so the day
+        in progress is left to the incremental path.
+        """
+        until = until or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since = None
+        if days:
+            # Start at midnight so the oldest day is rebuilt whole, not partially
+            since = until - timedelta(days=days)
+        totals = {}
+
+        def bucket(when):
+            key = day_key(when)
+            return totals.setdefault(key, {"date": key, "new_users": 0, "attempts": 0,
+                                           "score_sum": 0.0, "score_count": 0,
+                                           "topics": {}, "difficulty": {}})
+
+        for field in USER_DATE_FIELDS:
+            query = {field: {"$gte": since, "$lt": until}} if since else {field: {"$lt": until}}
+            for user in users_col.find(query, {name: 1 for name in USER_DATE_FIELDS}):
+                # Count each user once even if both date fields are present
+                if field != USER_DATE_FIELDS[0] and isinstance(user.get(USER_DATE_FIELDS[0]), datetime):
+                    continue
+                if isinstance(user.get(field), datetime):
+                    bucket(user[field])["new_users"] += 1
+
+        query = {"submitted_at": {"$gte": since, "$lt": until}} if since else {"submitted_at": {"$lt": until}}
+        # Excluding _id lets the attempts daily_rollup_covering index answer this without fetching documents
+        projection = {"_id": 0, "submitted_at": 1, "percentage": 1, "score": 1, "topic": 1, "difficulty": 1}
+        for attempt in attempts_col.find(query, projection):
+            if not isinstance(attempt.get("submitted_at"), datetime):
+                continue
+            day = bucket(attempt["submitted_at"])
+            for path, value in _attempt_increments(attempt).items():
+                target = day
+                parts = path.split(".")
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = target.get(parts[-1], 0) + value
+
+        now = datetime.now(timezone.utc)
+        for key, doc in totals.items():
+            doc["updated_at"] = now
+            self.collection.update_one({"_id": key}, {"$set": doc}, upsert=True)
+        logger.info(f"✅ Backfilled {len(totals)} daily stats documents")
+        return len(totals)
@@ -0,0 +1,306 @@
+import logging
+from datetime import datetime, timezone, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Bump when the state layout changes; stale documents are rebuilt on read
+STATE_SCHEMA = 1
+
+DIFFICULTY_RANK = {'beginner': 1, 'intermediate': 2, 'pro': 3, 'advanced': 3}
+
+# Engagement recency saturates at 3 attempts in the last week, so the last 3
+# timestamps are all that is needed to reproduce it
+RECENT_WINDOW = 3
+RECENT_DAYS = 7
+
+
+def _epoch(value):
+    """Seconds since epoch for datetimes, None for anything else"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # pymongo returns naive UTC
+    return value.timestamp()
+
+
+def empty_state(user_id):
+    return {
+        "user_id": user_id,
+        "schema": STATE_SCHEMA,
+        "version": 0,
+        "count": 0,
+        "score_sum": 0.0,
+        "indexed_score_sum": 0.0,  # sum(i * score_i), for the least-squares trend
+        "completed": 0,            # attempts with at least one correct answer
+        "answered": 0,             # attempts with at least one question
+        "error_sum": 0.0,
+        "topics": [],
+        "last_difficulty": None,
+        "difficulty_steps_up": 0,  # consecutive pairs with non-decreasing difficulty
+        "stamp_count": 0,
+        "prev_stamp_ts": None,
+        "gap_count": 0,
+        "gap_mean_hours": 0.0,     # Welford running mean/M2 of absolute gaps
+        "gap_m2_hours": 0.0,
+        "signed_gap_seconds": 0.0,
+        "recent_ts": []
+    }
+
+
+def apply_attempt(state, attempt):
+    """Return a new state with one attempt folded in (attempts in submit order)"""
+    state = dict(state)
+    score = attempt.get('score', {})
+    correct = score.get('correct', 0)
+    total = score.get('total', 1)
+
+    index = state["count"]
+    value = correct / max(total, 1)
+    state["count"] = index + 1
+    state["score_sum"] += value
+    state["indexed_score_sum"] += index * value
+    state["completed"] += 1 if correct > 0 else 0
+    state["answered"] += 1 if score.get('total', 0) > 0 else 0
+    state["error_sum"] += (total - correct) / max(total, 1)
+
+    topic = attempt.get('topic', 'unknown')
+    if topic not in state["topics"]:
+        state["topics"] = state["topics"] + [topic]
+
+    difficulty = DIFFICULTY_RANK.get(attempt.get('difficulty', 'beginner'), 1)
+    if state["last_difficulty"] is not None and difficulty >= state["last_difficulty"]:
+        state["difficulty_steps_up"] += 1
+    state["last_difficulty"] = difficulty
+
+    submitted_at = attempt.get('submitted_at')
+    if submitted_at:
+        ts = _epoch(submitted_at)
+        prev_ts = state["prev_stamp_ts"]
+        state["stamp_count"] += 1
+        if ts is not None and prev_ts is not None:
+            gap_hours = abs(ts - prev_ts) / 3600
+            state["gap_count"] += 1
+            delta = gap_hours - state["gap_mean_hours"]
+            state["gap_mean_hours"] += delta / state["gap_count"]
+            state["gap_m2_hours"] += delta * (gap_hours - state["gap_mean_hours"])
+            state["signed_gap_seconds"] += ts - prev_ts
+        state["prev_stamp_ts"] = ts
+        if ts is not None:
+            state["recent_ts"] = (state["recent_ts"] + [ts])[-RECENT_WINDOW:]
+
+    return state
+
+
+def build_state(user_id, attempts):
+    """Fold a full attempt history into a fresh state"""
+    state = empty_state(user_id)
+    for attempt in attempts:
+        state = apply_attempt(state, attempt)
+    return state
+
+
+def state_features(state, now=None):
+    """Feature values matching AdvancedMLPredictor.extract_advanced_features"""
+    n = state["count"]
+    if not n:
+        return None
+
+    # Time consistency: population variance of gaps relative to their mean
+    if n < 2 or state["stamp_count"] < 2 or not state["gap_count"]:
+        time_consistency = 0.5
+    else:
+        variance = state["gap_m2_hours"] / state["gap_count"] if state["gap_count"] > 1 else 0
+        time_consistency = max(0, 1 - (variance / max(state["gap_mean_hours"], 1)))
+
+    # Improvement trend: least-squares slope of score against attempt index
+    if n < 3:
+        improvement_trend = 0
+    else:
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * state["indexed_score_sum"] - sum_x * state["score_sum"]) / (n * sum_xx - sum_x ** 2)
+        improvement_trend = max(-1, min(1, slope))
+
+    difficulty_progression = state["difficulty_steps_up"] / (n - 1) if n >= 2 else 0.5
+
+    # Study frequency: average gap between sessions, bucketed
+    if n < 2 or state["stamp_count"] < 2 or state["signed_gap_seconds"] <= 0:
+        study_frequency = 0.5
+    else:
+        avg_gap_days = (state["signed_gap_seconds"] / (state["stamp_count"] - 1)) / 86400
+        if 1 <= avg_gap_days <= 3:
+            study_frequency = 1.0
+        elif avg_gap_days < 1:
+            study_frequency = 0.8
+        elif avg_gap_days <= 7:
+            study_frequency = 0.6
+        else:
+            study_frequency = 0.3
+
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=RECENT_DAYS)).timestamp()
+    recent_attempts = sum(1 for ts in state["recent_ts"] if ts > cutoff)
+    engagement_score = (
+        state["answered"] / n
+        + min(1.0, len(state["topics"]) / 5)
+        + min(1.0, recent_attempts / 3)
+    ) / 3
+
+    return {
+        'avg_score': state["score_sum"] / n,
+        'completion_rate': state["completed"] / n,
+        'total_attempts': n,
+        'time_consistency': time_consistency,
+        'improvement_trend': improvement_trend,
+        'topic_diversity': len(state["topics"]),
+        'difficulty_progression': difficulty_progression,
+        'error_patterns': 1 - state["error_sum"] / n,
+        'study_frequency': study_frequency,
+        'engagement_score': engagement_score
+    }
+
+
+def _write_applied(result):
+    """Whether an update matched or upserted, for pymongo results and the mock's dicts"""
+    if isinstance(result, dict):
+        return bool(result.get("matched_count") or result.get("upserted_id"))
+    return bool(result.matched_count or result.upserted_id)
+
+
+class FeatureStore:
+    """Per-student feature state maintained in O(1) per attempt.
+
+    Each document carries a version that is bumped on every write; updates
+    are compare-and-set on it so concurrent submits from several workers
+    never lose an attempt. Missing or outdated documents are rebuilt from
+    the attempts collection once and then kept up to date incrementally.
+    """
+
+    MAX_RETRIES = 5
+    BULK_CHUNK = 1000
+
+    # Subclasses keep other per-student state by swapping these three
+    schema = STATE_SCHEMA
+    build_state = staticmethod(build_state)
+    apply_attempt = staticmethod(apply_attempt)
+
+    def __init__(self, collection, attempts_collection):
+        self.collection = collection
+        self.attempts_collection = attempts_collection
+
+    def _load(self, user_id):
+        state = self.collection.find_one({"user_id": user_id})
+        if state and state.get("schema") == self.schema:
+            state = dict(state)
+            state.pop("_id", None)
+            return state
+        return None
+
+    def _save(self, state, expected_version):
+        """Compare-and-set write; returns False if another writer got there first"""
+        new_state = dict(state, version=expected_version + 1, updated_at=datetime.now(timezone.utc))
+        try:
+            result = self.collection.update_one(
+                {"user_id": state["user_id"], "version": expected_version},
+                {"$set": new_state},
+                upsert=(expected_version == 0)
+            )
+        except DuplicateKeyError:
+            return False
+        return _write_applied(result)
+
+    def rebuild(self, user_id):
+        """Recompute the state from the full attempt history"""
+        attempts = self.attempts_collection.find({"user_id": user_id}).sort("submitted_at", 1)
+        state = self.build_state(user_id, attempts)
+        current = self.collection.find_one({"user_id": user_id})
+        expected_version = current.get("version", 0) if current else 0
+        state["version"] = expected_version
+        if self._save(state, expected_version):
+            state["version"] = expected_version + 1
+        return state
+
+    def get(self, user_id):
+        """Current state for a student, rebuilding it if missing or outdated"""
+        return self._load(user_id) or self.rebuild(user_id)
+
+    def record_attempt(self, user_id, attempt):
+        """Fold one newly inserted attempt into the student's state"""
+        for _ in range(self.MAX_RETRIES):
+            state = self._load(user_id)
+            if state is None:
+                # First attempt or schema change: the rebuild already includes this attempt
+                return self.rebuild(user_id)
+            expected_version = state["version"]
+            new_state = self.apply_attempt(state, attempt)
+            if self._save(new_state, expected_version):
+                new_state["version"] = expected_version + 1
+                return new_state
+        logger.warning(f"⚠️ {type(self).__name__} state for {user_id} kept changing, rebuilding")
+        return self.rebuild(user_id)
+
+    def rebuild_many(self, user_ids):
+        """Recompute many states from history, one attempts query per chunk of ids.
+
+        Used after bulk imports, where incremental updates were skipped.
+        """
+        states = {}
+        user_ids = list(dict.fromkeys(user_ids))
+        for start in range(0, len(user_ids), self.BULK_CHUNK):
+            chunk = user_ids[start:start + self.BULK_CHUNK]
+            versions = {
+                doc["user_id"]: doc.get("version", 0)
+                for doc in self.collection.find({"user_id": {"$in": chunk}}, {"user_id": 1, "version": 1})
+            }
+            attempts_by_user = {user_id: [] for user_id in chunk}
+            for attempt in self.attempts_collection.find({"user_id": {"$in": chunk}}):
+                attempts_by_user[attempt["user_id"]].append(attempt)
+            for user_id, attempts in attempts_by_user.items():
+                attempts.sort(key=lambda a: _epoch(a.get("submitted_at")) or 0)
+                state = self.build_state(user_id, attempts)
+                expected_version = versions.get(user_id, 0)
+                if self._save(state, expected_version):
+                    state["version"] = expected_version + 1
+                else:
+                    # A submit landed mid-import; rebuild from a fresh read
+                    state = self.rebuild(user_id)
+                states[user_id] = state
+        return states
+
+    def get_many(self, user_ids):
+        """States for many students using one query per chunk of ids.
+
+        Students without a current state are rebuilt from a single attempts
+        query for the whole chunk rather than one query per student.
+        """
+        states = {}
+        user_ids = list(dict.fromkeys(user_ids))
+        for start in range(0, len(user_ids), self.BULK_CHUNK):
+            chunk = user_ids[start:start + self.BULK_CHUNK]
+            versions = {}
+            for doc in self.collection.find({"user_id": {"$in": chunk}}):
+                if doc.get("schema") == self.schema:
+                    state = dict(doc)
+                    state.pop("_id", None)
+                    states[state["user_id"]] = state
+                else:
+                    # Outdated schema: replace it with a compare-and-set on its version
+                    versions[doc["user_id"]] = doc.get("version", 0)
+
+            missing = [user_id for user_id in chunk if user_id not in states]
+            if not missing:
+                continue
+            attempts_by_user = {user_id: [] for user_id in missing}
+            for attempt in self.attempts_collection.find({"user_id": {"$in": missing}}):
+                attempts_by_user[attempt["user_id"]].append(attempt)
+            for user_id, attempts in attempts_by_user.items():
+                attempts.sort(key=lambda a: _epoch(a.get("submitted_at")) or 0)
+                state = self.build_state(user_id, attempts)
+                expected_version = versions.get(user_id, 0)
+                state["version"] = expected_version
+                if (attempts or expected_version) and self._save(state, expected_version):
+                    state["version"] = expected_version + 1
+                states[user_id] = state
+        return states
@@ -0,0 +1,182 @@
+import logging
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+# ========================================
+# INDEXES
+# ========================================
+# collection -> indexes; each entry is create_index arguments plus the query shape it serves
+INDEX_SPECS = {
+    "users": [
+        {"keys": [("email", 1)], "name": "email_unique", "unique": True},
+        # Daily stats backfill ranges over signup dates (legacy documents use createdAt)
+        {"keys": [("created_at", 1)], "name": "created_at"},
+        {"keys": [("createdAt", 1)], "name": "createdAt", "sparse": True},
+    ],
+    "profiles": [
+        {"keys": [("studentId", 1)], "name": "studentId_unique", "unique": True},
+    ],
+    "templates": [
+        # Each $or branch of the template listing needs its own index
+        {"keys": [("user_id", 1)], "name": "user_id"},
+        {"keys": [("is_public", 1)], "name": "is_public_true", "partialFilterExpression": {"is_public": True}},
+        {"keys": [("created_by_role", 1)], "name": "created_by_role"},
+    ],
+    "quizzes": [
+        # quiz_submit's {_id, user_id} lookup is served by _id; this one serves per-user counts
+        {"keys": [("user_id", 1)], "name": "user_id"},
+    ],
+    "attempts": [
+        # History pages, per-user counts and the question bank's seen-question lookup
+        {"keys": [("user_id", 1), ("submitted_at", -1), ("_id", -1)], "name": "user_history"},
+        {"keys": [("submitted_at", -1), ("_id", -1)], "name": "admin_history"},
+        # Covers the daily stats scan, which only reads these fields
+        {"keys": [("submitted_at", 1), ("topic", 1), ("difficulty", 1), ("percentage", 1), ("score", 1)],
+         "name": "daily_rollup_covering"},
+    ],
+    "courses": [
+        {"keys": [("instructor_id", 1)], "name": "instructor_id"},
+        {"keys": [("is_active", 1), ("_id", 1)], "name": "active_catalog"},
+        {"keys": [("enrolled_students", 1)], "name": "enrolled_students"},
+    ],
+    "response_cache": [
+        {"keys": [("expires_at", 1)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "job_outbox": [
+        {"keys": [("queue", 1), ("status", 1), ("lease_expires_ts", 1)], "name": "queue_status_lease"},
+        {"keys": [("completed_at", 1)], "name": "completed_at_ttl", "expireAfterSeconds": 7 * 24 * 3600},  # Keep finished jobs a week
+    ],
+    "feature_state": [
+        {"keys": [("user_id", 1)], "name": "user_id_unique", "unique": True},
+    ],
+    "analytics_snapshots": [
+        {"keys": [("user_id", 1)], "name": "user_id_unique", "unique": True},
+    ],
+    "content_jobs": [
+        {"keys": [("expires_at", 1)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "question_bank": [
+        {"keys": [("bucket", 1), ("served_count", 1)], "name": "bucket_served"},
+    ],
+    "topic_keys": [
+        # Workers pick up keys registered elsewhere since their last read
+        {"keys": [("created_at", 1)], "name": "created_at"},
+    ],
+}
+
+
+def _create_args(spec):
+    options = {key: value for key, value in spec.items() if key != "keys"}
+    return spec["keys"], options
+
+
+def reconcile_indexes(collections, specs=INDEX_SPECS):
+    """Create every declared index that is missing; returns the names created.
+
+    An index counts as present when an existing index has the same keys,
+    whatever it is called, so indexes created under older default names are
+    not built twice. The mock database has no index catalog and simply gets
+    every index (its create_index is idempotent).
+    """
+    created = []
+    for name, indexes in specs.items():
+        collection = collections.get(name)
+        if collection is None:
+            continue
+        existing = None
+        if not hasattr(collection, "_data"):
+            try:
+                existing = [list(info["key"]) for info in collection.index_information().values()]
+            except Exception as e:
+                logger.warning(f"⚠️ Could not list indexes on {name}: {e}")
+                continue
+        for spec in indexes:
+            keys, options = _create_args(spec)
+            if existing is not None and [tuple(key) for key in keys] in [[tuple(key) for key in index] for index in existing]:
+                continue
+            try:
+                collection.create_index(keys, **options)
+                created.append(f"{name}.{spec['name']}")
+            except Exception as e:
+                # e.g. an index with the same name but different options: leave it for an operator
+                logger.warning(f"⚠️ Could not create index {name}.{spec['name']}: {e}")
+    return created
+
+
+# ========================================
+# QUERY SHAPES
+# ========================================
+# Representative hot queries; placeholder values only need the right types
+_SAMPLE_USER = "000000000000000000000000"
+_SAMPLE_SINCE = datetime.now(timezone.utc) - timedelta(days=30)
+
+QUERY_PATTERNS = [
+    {"name": "login", "collection": "users", "filter": {"email": "someone@example.com"}},
+    {"name": "signups_since", "collection": "users", "filter": {"created_at": {"$gte": _SAMPLE_SINCE}}},
+    {"name": "profile", "collection": "profiles", "filter": {"studentId": _SAMPLE_USER}},
+    {"name": "quiz_submit", "collection": "quizzes", "filter": {"_id": _SAMPLE_USER, "user_id": _SAMPLE_USER}},
+    {"name": "quiz_count", "collection": "quizzes", "filter": {"user_id": _SAMPLE_USER}},
+    {"name": "attempt_history", "collection": "attempts", "filter": {"user_id": _SAMPLE_USER},
+     "sort": [("submitted_at", -1), ("_id", -1)]},
+    {"name": "admin_attempt_history", "collection": "attempts", "filter": {},
+     "sort": [("submitted_at", -1), ("_id", -1)]},
+    {"name": "attempts_by_date", "collection": "attempts", "filter": {"submitted_at": {"$gte": _SAMPLE_SINCE}},
+     "projection": {"_id": 0, "submitted_at": 1, "percentage": 1, "score": 1, "topic": 1, "difficulty": 1},
+     "covered": True},
+    {"name": "course_catalog", "collection": "courses", "filter": {"is_active": True}, "sort": [("_id", 1)]},
+    {"name": "instructor_courses", "collection": "courses", "filter": {"instructor_id": _SAMPLE_USER}},
+    {"name": "enrolled_courses", "collection": "courses", "filter": {"enrolled_students": _SAMPLE_USER}},
+    {"name": "student_templates", "collection": "templates",
+     "filter": {"$or": [{"user_id": _SAMPLE_USER}, {"is_public": True}]}},
+    {"name": "teacher_templates", "collection": "templates",
+     "filter": {"$or": [{"user_id": _SAMPLE_USER}, {"is_public": True}, {"created_by_role": "teacher"}]}},
+    {"name": "pending_jobs", "collection": "job_outbox", "filter": {"queue": "default", "status": "pending"}},
+    {"name": "question_bank_bucket", "collection": "question_bank", "filter": {"bucket": "python|beginner|4|english"},
+     "sort": [("served_count", 1)]},
+    {"name": "topic_keys_since", "collection": "topic_keys", "filter": {"created_at": {"$gte": _SAMPLE_SINCE}}},
+]
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            if isinstance(value, (dict, list)):
+                stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def explain_pattern(collection, pattern):
+    """Stage names of the winning plan for one query pattern"""
+    cursor = collection.find(pattern["filter"], pattern.get("projection"))
+    if pattern.get("sort"):
+        cursor = cursor.sort(pattern["sort"])
+    explain = cursor.explain()
+    return _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+def check_query_patterns(collections, patterns=QUERY_PATTERNS):
+    """Explain each registered query; returns (pattern name, problem) for every violation.
+
+    A pattern fails if its plan contains a COLLSCAN, or if it is marked
+    covered and still has to FETCH documents.
+    """
+    problems = []
+    for pattern in patterns:
+        collection = collections.get(pattern["collection"])
+        if collection is None:
+            problems.append((pattern["name"], f"unknown collection {pattern['collection']}"))
+            continue
+        stages = explain_pattern(collection, pattern)
+        if "COLLSCAN" in stages:
+            problems.append((pattern["name"], f"COLLSCAN ({' > '.join(stages)})"))
+        elif pattern.get("covered") and "FETCH" in stages:
+            problems.append((pattern["name"], f"not covered ({' > '.join(stages)})"))
+    return problems
@@ -0,0 +1,292 @@
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+def _modified(result):
+    """modified_count for both pymongo UpdateResult and the mock's dict result"""
+    if isinstance(result, dict):
+        return result.get("modified_count", 0)
+    return getattr(result, "modified_count", 0)
+
+
+class BackgroundJobQueue:
+    """In-process job queue with a worker pool and a durable outbox.
+
+    Every job is written to the outbox collection before it is queued, so a
+    restart (or another worker process, once the job's lease expires) can
+    replay anything that never completed. A job's outbox lease is renewed
+    for as long as this process holds it (queued or running), so only jobs
+    of a process that died are ever replayed. Jobs that share a dedupe
+    key while still waiting are coalesced into one run.
+    """
+
+    def __init__(self, outbox=None, num_workers=2, max_attempts=3, lease_seconds=300, name="jobs"):
+        self.outbox = outbox
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.name = name
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._pending = {}  # dedupe_key -> queued job not yet picked up
+        self._held = {}  # outbox_id -> job queued or running in this process
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._stop = threading.Event()
+        self._running = 0
+        self._stats = {
+            "enqueued": 0, "coalesced": 0, "processed": 0, "failed": 0,
+            "retried": 0, "replayed": 0, "outbox_errors": 0
+        }
+        self._last_lag = 0.0
+        self._avg_lag = 0.0
+
+    def register(self, job_type, handler):
+        """Register handler(payload) for a job type"""
+        self._handlers[job_type] = handler
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def enqueue(self, job_type, payload, dedupe_key=None):
+        """Queue a job; returns False if it was coalesced into a waiting job"""
+        if job_type not in self._handlers:
+            raise ValueError(f"No handler registered for job type '{job_type}'")
+        self.start()
+
+        with self._lock:
+            if dedupe_key and dedupe_key in self._pending:
+                # Same work is already waiting; it will read the latest data when it runs
+                self._pending[dedupe_key]["payload"] = payload
+                self._stats["coalesced"] += 1
+                return False
+
+            job = {
+                "type": job_type,
+                "payload": payload,
+                "dedupe_key": dedupe_key,
+                "attempts": 0,
+                "enqueued_ts": time(),
+                "outbox_id": None
+            }
+            if dedupe_key:
+                self._pending[dedupe_key] = job
+            self._stats["enqueued"] += 1
+
+        job["outbox_id"] = self._write_outbox(job)
+        self._hold(job)
+        self._queue.put(job)
+        return True
+
+    def _hold(self, job):
+        if job["outbox_id"] is not None:
+            with self._lock:
+                self._held[job["outbox_id"]] = job
+
+    def _release(self, job):
+        if job["outbox_id"] is not None:
+            with self._lock:
+                self._held.pop(job["outbox_id"], None)
+
+    def _write_outbox(self, job):
+        if self.outbox is None:
+            return None
+        try:
+            res = self.outbox.insert_one({
+                "queue": self.name,
+                "type": job["type"],
+                "payload": job["payload"],
+                "dedupe_key": job["dedupe_key"],
+                "status": "pending",
+                "attempts": 0,
+                "owner_pid": os.getpid(),
+                "lease_expires_ts": job["enqueued_ts"] + self.lease_seconds,
+                "enqueued_at": datetime.now(timezone.utc)
+            })
+            return res.inserted_id
+        except Exception as e:
+            logger.warning(f"⚠️ Job outbox write failed: {e}")
+            with self._lock:
+                self._stats["outbox_errors"] += 1
+            return None
+
+    def _mark_outbox(self, job, status, error=None, lease=False):
+        if self.outbox is None or job.get("outbox_id") is None:
+            return
+        update = {"status": status, "attempts": job["attempts"], "updated_at": datetime.now(timezone.utc)}
+        if lease:
+            update.update({"owner_pid": os.getpid(), "lease_expires_ts": time() + self.lease_seconds})
+        if status in ("done", "failed"):
+            update["completed_at"] = datetime.now(timezone.utc)
+        if error:
+            update["last_error"] = error
+        try:
+            self.outbox.update_one({"_id": job["outbox_id"]}, {"$set": update})
+        except Exception as e:
+            logger.warning(f"⚠️ Job outbox update failed: {e}")
+            with self._lock:
+                self._stats["outbox_errors"] += 1
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+    def start(self):
+        """Start workers once per process (threads do not survive a fork)"""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._queue = queue.Queue()
+            self._pending = {}
+            self._held = {}
+            self._stop.clear()
+
+        for i in range(self.num_workers):
+            threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True).start()
+        if self.outbox is not None:
+            threading.Thread(target=self._sweeper, name=f"{self.name}-sweeper", daemon=True).start()
+            threading.Thread(target=self._lease_keeper, name=f"{self.name}-leases", daemon=True).start()
+        logger.info(f"✅ Started {self.num_workers} '{self.name}' workers")
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                if job["dedupe_key"] and self._pending.get(job["dedupe_key"]) is job:
+                    del self._pending[job["dedupe_key"]]
+                self._running += 1
+                self._last_lag = time() - job["enqueued_ts"]
+                self._avg_lag = 0.9 * self._avg_lag + 0.1 * self._last_lag
+
+            job["attempts"] += 1
+            self._mark_outbox(job, "running", lease=True)
+            try:
+                self._handlers[job["type"]](job["payload"])
+                self._release(job)
+                self._mark_outbox(job, "done")
+                with self._lock:
+                    self._stats["processed"] += 1
+            except Exception as e:
+                if job["attempts"] < self.max_attempts:
+                    logger.warning(f"⚠️ Job {job['type']} failed (attempt {job['attempts']}), retrying: {e}")
+                    with self._lock:
+                        self._stats["retried"] += 1
+                    self._queue.put(job)
+                else:
+                    logger.error(f"❌ Job {job['type']} failed permanently: {e}")
+                    self._release(job)
+                    self._mark_outbox(job, "failed", error=str(e))
+                    with self._lock:
+                        self._stats["failed"] += 1
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def _sweeper(self):
+        """Replay outbox jobs whose lease expired (crashed or restarted workers)"""
+        while not self._stop.is_set():
+            try:
+                self.replay_outbox()
+            except Exception as e:
+                logger.warning(f"⚠️ Job outbox replay failed: {e}")
+            self._stop.wait(max(self.lease_seconds / 2, 5))
+
+    def _lease_keeper(self):
+        """Extend the outbox lease of every job this process holds"""
+        interval = max(self.lease_seconds / 3, 0.5)
+        while not self._stop.wait(interval):
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                self.outbox.update_many(
+                    {"_id": {"$in": held}},
+                    {"$set": {"owner_pid": os.getpid(), "lease_expires_ts": time() + self.lease_seconds}}
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Job lease renewal failed: {e}")
+                with self._lock:
+                    self._stats["outbox_errors"] += 1
+
+    def replay_outbox(self):
+        """Claim and requeue unfinished outbox jobs whose lease expired"""
+        if self.outbox is None:
+            return 0
+        now = time()
+        replayed = 0
+        stale = self.outbox.find({
+            "queue": self.name,
+            "status": {"$in": ["pending", "running"]},
+            "lease_expires_ts": {"$lt": now}
+        })
+        for doc in stale:
+            with self._lock:
+                if doc["_id"] in self._held:
+                    continue  # Still queued or running here; its lease renewal is just late
+            # Compare-and-set on the old lease so only one process claims the job
+            claimed = self.outbox.update_one(
+                {"_id": doc["_id"], "status": doc["status"], "lease_expires_ts": doc.get("lease_expires_ts", 0)},
+                {"$set": {"status": "pending", "owner_pid": os.getpid(), "lease_expires_ts": now + self.lease_seconds}}
+            )
+            if not _modified(claimed) or doc.get("type") not in self._handlers:
+                continue
+            job = {
+                "type": doc["type"],
+                "payload": doc.get("payload", {}),
+                "dedupe_key": doc.get("dedupe_key"),
+                "attempts": doc.get("attempts", 0),
+                "enqueued_ts": now,
+                "outbox_id": doc["_id"]
+            }
+            with self._lock:
+                coalesced = bool(job["dedupe_key"] and job["dedupe_key"] in self._pending)
+                if coalesced:
+                    self._stats["coalesced"] += 1
+                else:
+                    if job["dedupe_key"]:
+                        self._pending[job["dedupe_key"]] = job
+                    self._held[job["outbox_id"]] = job
+                    self._stats["replayed"] += 1
+            if coalesced:
+                # Outside the lock: _mark_outbox takes it to count write errors
+                self._mark_outbox(job, "done")
+                continue
+            self._queue.put(job)
+            replayed += 1
+        if replayed:
+            logger.info(f"🔄 Replayed {replayed} '{self.name}' jobs from the outbox")
+        return replayed
+
+    def shutdown(self):
+        self._stop.set()
+
+    def metrics(self):
+        """Queue depth, lag and throughput counters for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["depth"] = self._queue.qsize()
+            stats["pending_keys"] = len(self._pending)
+            stats["running"] = self._running
+            stats["held"] = len(self._held)
+            stats["oldest_pending_age_seconds"] = round(
+                time() - min(job["enqueued_ts"] for job in self._pending.values()), 3
+            ) if self._pending else 0.0
+            stats["last_lag_seconds"] = round(self._last_lag, 3)
+            stats["avg_lag_seconds"] = round(self._avg_lag, 3)
+        stats["workers"] = self.num_workers if self._started_pid == os.getpid() else 0
+        stats["durable"] = self.outbox is not None
+        return stats
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import random
+import threading
+from time import time, sleep
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    # Upstream is overloaded or slow: worth retrying, and counts against the breaker
+    TRANSIENT_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        google_exceptions.TooManyRequests,
+        TimeoutError,
+        ConnectionError
+    )
+except ImportError:
+    TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the LLM while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stop calling a degraded upstream for a while after repeated failures.
+
+    closed -> open after `failure_threshold` consecutive transient failures;
+    open -> half-open after `reset_timeout` seconds, letting one trial call
+    through; the trial's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.trips += 1
+                    logger.warning(f"⚠️ LLM circuit opened after {self._failures} failures")
+                self._opened_at = time()
+            self._trial_running = False
+
+
+class GeminiBackend:
+    """google.generativeai models, built once per (model name, generation config)"""
+
+    name = "gemini"
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, name, generation_config=None):
+        key = (name, json.dumps(generation_config or {}, sort_keys=True))
+        model = self._models.get(key)
+        if model is None:
+            import google.generativeai as genai
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(name, generation_config=generation_config)
+                    self._models[key] = model
+        return model
+
+    def generate(self, prompt, model, generation_config=None, timeout=30.0):
+        response = self.model(model, generation_config).generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+    def stream(self, prompt, model, generation_config=None, timeout=30.0):
+        response = self.model(model, generation_config).generate_content(
+            prompt, stream=True, request_options={"timeout": timeout}
+        )
+        return self._chunks(response)
+
+    @staticmethod
+    def _chunks(response):
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts (e.g. safety metadata)
+            yield text
+
+
+class LLMClient:
+    """Shared LLM access: deadlines, retries and a circuit breaker over a backend.
+
+    The backend does the actual calls (GeminiBackend, or LocalBackend for
+    offline load tests). Every call carries a timeout; transient failures are
+    retried with jittered exponential backoff within the overall deadline.
+    When the breaker is open calls fail fast with CircuitOpenError, so
+    callers drop straight into their fallback generators.
+    """
+
+    def __init__(self, backend=None, default_model=DEFAULT_MODEL, timeout=30.0, deadline=60.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None):
+        self.backend = backend or GeminiBackend()
+        self.default_model = default_model
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "timeouts": 0}
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _call(self, fn, timeout, retries):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        timeout = timeout or self.timeout
+        retries = self.max_retries if retries is None else retries
+        deadline = time() + max(self.deadline, timeout)
+        attempt = 0
+        while True:
+            self._count("calls")
+            # Never let one attempt outlive the overall deadline
+            attempt_timeout = max(min(timeout, deadline - time()), 1.0)
+            try:
+                result = fn(attempt_timeout)
+                self.breaker.record_success()
+                return result
+            except TRANSIENT_ERRORS as e:
+                if isinstance(e, TimeoutError) or type(e).__name__ == "DeadlineExceeded":
+                    self._count("timeouts")
+                delay = self._backoff(attempt)
+                if attempt >= retries or time() + delay >= deadline:
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    raise
+                attempt += 1
+                self._count("retries")
+                logger.warning(f"⚠️ LLM call failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                sleep(delay)
+            except Exception:
+                # Bad request or blocked prompt: not an upstream health problem
+                self._count("failures")
+                self.breaker.record_success()
+                raise
+
+    def generate(self, prompt, model=None, generation_config=None, timeout=None, retries=None):
+        """Generate a completion and return its text"""
+        model = model or self.default_model
+        return self._call(
+            lambda attempt_timeout: self.backend.generate(prompt, model, generation_config, timeout=attempt_timeout),
+            timeout, retries
+        )
+
+    def stream(self, prompt, model=None, generation_config=None, timeout=None, retries=None):
+        """Yield text chunks as they arrive; only opening the stream is retried"""
+        model = model or self.default_model
+        chunks = self._call(
+            lambda attempt_timeout: self.backend.stream(prompt, model, generation_config, timeout=attempt_timeout),
+            timeout, retries
+        )
+        try:
+            for text in chunks:
+                if text:
+                    yield text
+        except TRANSIENT_ERRORS:
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["backend"] = self.backend.name
+        stats["circuit"] = self.breaker.state
+        stats["circuit_trips"] = self.breaker.trips
+        return stats
+
+
+def build_llm_backend():
+    """LLM_BACKEND=gemini (default) or local, the offline stand-in for load tests"""
+    backend = os.getenv("LLM_BACKEND", "gemini").lower()
+    if backend == "local":
+        from services.local_llm import LocalBackend
+        logger.info("🧪 Using the local LLM stand-in backend")
+        return LocalBackend(
+            latency_ms=float(os.getenv("LLM_LOCAL_LATENCY_MS", 800)),
+            latency_sigma=float(os.getenv("LLM_LOCAL_LATENCY_SIGMA", 0.5)),
+            tokens_per_second=float(os.getenv("LLM_LOCAL_TOKENS_PER_SECOND", 80)),
+            failure_rate=float(os.getenv("LLM_LOCAL_FAILURE_RATE", 0)),
+            seed=os.getenv("LLM_LOCAL_SEED")
+        )
+    return GeminiBackend()
+
+
+def build_llm_client():
+    """LLMClient configured from LLM_* environment variables"""
+    return LLMClient(
+        backend=build_llm_backend(),
+        default_model=DEFAULT_MODEL,
+        timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", 30)),
+        deadline=float(os.getenv("LLM_DEADLINE_SECONDS", 60)),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+        )
+    )
+
+
+# One client per process, shared by the app and the NLP services
+llm_client = build_llm_client()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import random
+import re
+import threading
+from time import sleep, time
+
+WORD_POOL = [
+    "concept", "principle", "structure", "process", "model", "pattern", "method",
+    "system", "component", "example", "practice", "analysis", "design", "result",
+    "approach", "technique", "framework", "property", "relationship", "application"
+]
+
+
+class InjectedFailure(ConnectionError):
+    """Transient failure raised on purpose by LocalBackend"""
+
+
+def _first(patterns, text, default):
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1).strip()
+    return default
+
+
+class LocalBackend:
+    """Deterministic offline stand-in for the Gemini backend.
+
+    The same prompt always yields the same text, shaped like what each call
+    site expects (quiz JSON object, JSON array, or sectioned markdown), so
+    the generation endpoints run end to end without the network. Latency is
+    modelled as a log-normal time to first token plus a fixed token rate,
+    and a configurable fraction of calls fail with a transient error, which
+    makes worker counts, retries and the circuit breaker testable under load.
+    """
+
+    name = "local"
+
+    def __init__(self, latency_ms=800.0, latency_sigma=0.5, tokens_per_second=80.0,
+                 failure_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Timing and failures
+    # ------------------------------------------------------------------
+    def _first_token_delay(self):
+        with self._lock:
+            fail = self._rng.random() < self.failure_rate
+            delay = self.latency_ms / 1000.0 * self._rng.lognormvariate(0, self.latency_sigma)
+        return delay, fail
+
+    def _wait(self, seconds, deadline):
+        """Sleep, but raise TimeoutError instead of running past the call deadline"""
+        if time() + seconds > deadline:
+            sleep(max(deadline - time(), 0))
+            raise TimeoutError("Local LLM call exceeded its timeout")
+        sleep(seconds)
+
+    def _token_seconds(self, text):
+        return len(text.split()) / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+    def generate(self, prompt, model=None, generation_config=None, timeout=30.0):
+        deadline = time() + timeout
+        delay, fail = self._first_token_delay()
+        self._wait(delay, deadline)
+        if fail:
+            raise InjectedFailure("Injected local LLM failure")
+        text = self.complete(prompt)
+        self._wait(self._token_seconds(text), deadline)
+        return text
+
+    def stream(self, prompt, model=None, generation_config=None, timeout=30.0):
+        deadline = time() + timeout
+        delay, fail = self._first_token_delay()
+        self._wait(delay, deadline)
+        if fail:
+            raise InjectedFailure("Injected local LLM failure")
+        return self._chunks(self.complete(prompt), deadline)
+
+    def _chunks(self, text, deadline, words_per_chunk=20):
+        words = re.findall(r'\S+\s*', text)
+        for i in range(0, len(words), words_per_chunk):
+            chunk = ''.join(words[i:i + words_per_chunk])
+            self._wait(self._token_seconds(chunk), deadline)
+            yield chunk
+
+    # ------------------------------------------------------------------
+    # Deterministic completions
+    # ------------------------------------------------------------------
+    def complete(self, prompt):
+        """Response text for a prompt, without any simulated latency"""
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        topic = _first([r'(?:about|topic:)\s*"([^"]+)"', r'quiz for (.+?) field'], prompt, "General")
+        difficulty = _first([r'Difficulty Level:\s*(\w+)', r'for (\w+)[ -]level students'], prompt, "intermediate").lower()
+
+        if '"questions"' in prompt or "JSON Array" in prompt:
+            count = int(_first([r'(\d+)-question', r'Exactly (\d+) questions', r'exactly (\d+) questions'], prompt, "5"))
+            choices = int(_first([r'Exactly (\d+) choices', r'exactly (\d+) options'], prompt, "4"))
+            questions = [self._question(rng, topic, difficulty, i, choices) for i in range(count)]
+            if "JSON Array" in prompt:
+                return json.dumps(questions, indent=2)
+            return json.dumps({"topic": topic, "difficulty": difficulty, "questions": questions}, indent=2)
+        return self._content(rng, topic, difficulty)
+
+    @staticmethod
+    def _sentence(rng, topic):
+        words = rng.sample(WORD_POOL, 6)
+        return (f"The {words[0]} of {topic} links each {words[1]} to a {words[2]}, "
+                f"so every {words[3]} follows from a clear {words[4]} and {words[5]}.")
+
+    def _paragraph(self, rng, topic, sentences=5):
+        return " ".join(self._sentence(rng, topic) for _ in range(sentences))
+
+    def _content(self, rng, topic, difficulty):
+        sections = [
+            ("EXPLANATION", "\n\n".join(self._paragraph(rng, topic) for _ in range(4))),
+            ("PRACTICAL EXAMPLES", "\n\n".join(
+                f"**Example {i}:** {self._paragraph(rng, topic, 3)}" for i in range(1, 4))),
+            ("HANDS-ON EXERCISES", "\n\n".join(
+                f"**Exercise {i}: {difficulty.title()} Level**\n- Objective: {self._sentence(rng, topic)}"
+                for i in range(1, 5))),
+            ("LEARNING TIPS", "\n".join(f"- {self._sentence(rng, topic)}" for _ in range(6)))
+        ]
+        return "\n\n".join(f"## {title}\n{body}" for title, body in sections)
+
+    def _question(self, rng, topic, difficulty, index, choices):
+        words = rng.sample(WORD_POOL, choices + 1)
+        options = [f"The {word} of {topic} (option {n + 1})" for n, word in enumerate(words[1:])]
+        return {
+            "question": f"Question {index + 1}: which {words[0]} best describes {topic}?",
+            "choices": options,
+            "answer": options[0],
+            "explanation": f"{options[0]} is the {words[0]} that defines {topic}.",
+            "type": "concept",
+            "difficulty": difficulty,
+            "topic": topic
+        }
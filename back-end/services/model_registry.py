@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_bytes():
+    """Resident set size of this process, or None when it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is a high-water mark (KB on Linux, bytes on macOS) but is
+        # still a usable approximation where /proc is unavailable
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if usage > 1 << 32 else usage * 1024
+    except (ImportError, ValueError):
+        return None
+
+
+class SpacyModelRegistry:
+    """Process-wide registry that loads each spaCy pipeline at most once"""
+
+    def __init__(self):
+        self._models = {}
+        self._info = {}
+        self._missing = set()
+        self._lock = threading.Lock()
+
+    def get(self, model_name):
+        """Return the shared pipeline for model_name, loading it on first use"""
+        model = self._models.get(model_name)
+        if model is not None or model_name in self._missing:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if model_name in self._models or model_name in self._missing:
+                return self._models.get(model_name)
+
+            import spacy
+
+            rss_before = _current_rss_bytes()
+            started = time()
+            try:
+                model = spacy.load(model_name)
+            except OSError:
+                self._missing.add(model_name)
+                logger.warning(f"⚠️ spaCy model {model_name} not installed")
+                return None
+
+            rss_after = _current_rss_bytes()
+            self._models[model_name] = model
+            self._info[model_name] = {
+                "load_seconds": round(time() - started, 3),
+                "resident_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+                "has_vectors": bool(getattr(model.vocab, "vectors_length", 0)),
+                "pipeline": list(model.pipe_names)
+            }
+            logger.info(f"✅ Loaded spaCy model: {model_name}")
+            return model
+
+    def get_first_available(self, model_names):
+        """Return (pipeline, name) for the first model in model_names that loads"""
+        for model_name in model_names:
+            model = self.get(model_name)
+            if model is not None:
+                return model, model_name
+        return None, None
+
+    def is_loaded(self, model_name):
+        return model_name in self._models
+
+    def loaded_models(self):
+        return list(self._models)
+
+    def stats(self):
+        """Per-model memory and load statistics for health checks"""
+        with self._lock:
+            models = {name: dict(info) for name, info in self._info.items()}
+            missing = sorted(self._missing)
+        for info in models.values():
+            if info["resident_bytes"] is not None:
+                info["resident_mb"] = round(info["resident_bytes"] / (1024 * 1024), 1)
+        process_rss = _current_rss_bytes()
+        return {
+            "loaded": models,
+            "missing": missing,
+            "process_rss_mb": round(process_rss / (1024 * 1024), 1) if process_rss else None
+        }
+
+
+class LazyPipeline:
+    """The first loadable model from a preference list, resolved on first use.
+
+    Nothing is loaded until .nlp is read, so importing the app (or forking
+    workers from it) never pays for a model a process may not need.
+    """
+
+    def __init__(self, model_names, registry=None):
+        self.model_names = list(model_names)
+        self.registry = registry or spacy_registry
+        self._nlp = None
+        self._name = None
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        with self._lock:
+            if not self._resolved:
+                self._nlp, self._name = self.registry.get_first_available(self.model_names)
+                if self._nlp is None:
+                    logger.error(f"❌ No spaCy model found. Install with: python -m spacy download {self.model_names[-1]}")
+                self._resolved = True
+
+    @property
+    def nlp(self):
+        if not self._resolved:
+            self._resolve()
+        return self._nlp
+
+    @property
+    def name(self):
+        """Name of the loaded model (None until first use or if none is installed)"""
+        return self._name
+
+    @property
+    def ready(self):
+        """Whether a pipeline is loaded, without triggering a load"""
+        return self._nlp is not None
+
+
+spacy_registry = SpacyModelRegistry()
+# Shared by app.py, AdvancedNLPProcessor, AdvancedEducationalNLP and the topic normalizer
+spacy_pipeline = LazyPipeline(["en_core_web_lg", "en_core_web_md", "en_core_web_sm"], spacy_registry)
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import os
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+CURRENT_POINTER = "CURRENT"
+
+
+def feature_schema_hash(feature_names, model_params, library_version=""):
+    """Hash of everything that makes a stored model incompatible with this code"""
+    payload = json.dumps({
+        "features": list(feature_names),
+        "params": model_params,
+        "library": library_version
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def training_data_fingerprint(training_data):
+    """Hash of the training rows so identical data maps to the same artifact"""
+    digest = hashlib.sha256()
+    for row in training_data:
+        digest.update(json.dumps([
+            [round(float(value), 8) for value in row['features']],
+            row['skill_level'],
+            round(float(row['performance_score']), 8)
+        ]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ModelArtifactStore:
+    """Versioned joblib artifacts keyed by feature schema and training data.
+
+    A CURRENT pointer file names the live version so every worker process
+    loads the same model; writes go through a temp file and os.replace so
+    readers never observe a partial artifact.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def version_for(schema_hash, data_fingerprint):
+        return f"{schema_hash[:12]}-{data_fingerprint[:12]}"
+
+    @staticmethod
+    def schema_of(version):
+        return version.split("-", 1)[0] if version else None
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"skill_model_{version}.joblib")
+
+    def exists(self, version):
+        return os.path.exists(self._path(version))
+
+    def load(self, version):
+        return joblib.load(self._path(version))
+
+    def save(self, version, bundle):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(bundle, tmp_path)
+        os.replace(tmp_path, path)
+        self._write_pointer(version)
+        logger.info(f"💾 Saved ML artifact {version}")
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT_POINTER)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_pointer(self, version):
+        pointer = os.path.join(self.directory, CURRENT_POINTER)
+        tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(version)
+        os.replace(tmp_pointer, pointer)
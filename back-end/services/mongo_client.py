@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+
+from pymongo import MongoClient, monitoring
+
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "genai-quiz"
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def client_options():
+    """MongoClient keyword arguments from MONGO_* environment variables"""
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 60000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+        "appname": os.getenv("MONGO_APP_NAME", "genai-education-backend")
+    }
+    write_concern = os.getenv("MONGO_WRITE_CONCERN")
+    if write_concern:
+        # "majority", or a node count such as "1"
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters for this process, fed by pymongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {
+                "open": 0, "in_use": 0, "peak_in_use": 0, "created": 0, "closed": 0,
+                "checkouts": 0, "checkout_failures": 0, "pool_clears": 0
+            }
+            self._wait_seconds = 0.0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for stat, delta in deltas.items():
+                self._stats[stat] += delta
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add(checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._wait_seconds += getattr(event, "duration", 0) or 0
+        self._add(in_use=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._add(in_use=-1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            wait = self._wait_seconds
+        stats["avg_checkout_wait_ms"] = round(wait / stats["checkouts"] * 1000, 2) if stats["checkouts"] else 0.0
+        return stats
+
+
+class LazyMongo:
+    """One MongoClient per process, created on first use.
+
+    Nothing connects at import, so gunicorn can fork workers from a parent
+    that never opened a socket. The client remembers the pid it was built
+    in; a forked child (or anything after os.register_at_fork fires) gets
+    a fresh client and fresh pool counters instead of the parent's sockets.
+    """
+
+    def __init__(self, uri, database=DATABASE_NAME, options=None):
+        self.uri = uri
+        self.database = database
+        self.options = options if options is not None else client_options()
+        self.monitor = PoolMonitor()
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        # The parent's client is not closed here: its sockets belong to the parent
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.monitor = PoolMonitor()
+
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self.monitor.reset()
+                    self._client = MongoClient(self.uri, connect=False, event_listeners=[self.monitor], **self.options)
+                    self._pid = os.getpid()
+                    logger.info(f"🔌 MongoDB client created for process {self._pid}")
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    def collection(self, name):
+        return LazyCollection(self, name)
+
+    def ping(self):
+        self.client.admin.command("ping")
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def stats(self):
+        stats = self.monitor.stats()
+        stats.update({
+            "pid": os.getpid(),
+            "connected": self._client is not None and self._pid == os.getpid(),
+            "max_pool_size": self.options.get("maxPoolSize"),
+            "min_pool_size": self.options.get("minPoolSize"),
+            "read_preference": self.options.get("readPreference"),
+            "write_concern": self.options.get("w", "default")
+        })
+        max_pool = stats["max_pool_size"]
+        stats["utilization"] = round(stats["in_use"] / max_pool, 4) if max_pool else None
+        return stats
+
+
+class LazyCollection:
+    """Collection handle that resolves against the current process's client on every use"""
+
+    def __init__(self, mongo, name):
+        self._mongo = mongo
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    def __getattr__(self, attr):
+        # Private attributes (e.g. the mock's _data probe) never trigger a connection
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._mongo.db[self._name], attr)
+
+    def __getitem__(self, sub):
+        return self._mongo.db[f"{self._name}.{sub}"]
+
+    def __repr__(self):
+        return f"LazyCollection({self._mongo.database}.{self._name})"
+
+
+def probe(uri, timeout_ms):
+    """Check the server is reachable with a throwaway client that is closed before returning"""
+    client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms, connectTimeoutMS=timeout_ms)
+    try:
+        client.admin.command("ping")
+    finally:
+        client.close()
@@ -1,11 +1,14 @@
-import spacy
 import re
 from collections import Counter, defaultdict
 import numpy as np
 from datetime import datetime
+from functools import cached_property
 import logging
 import os
 
+from services.model_registry import LazyPipeline, spacy_registry
+from services.llm_client import llm_client
+
 # Fix textstat imports
 try:
     import textstat
@@ -27,29 +30,157 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+class AnalysisContext:
+    """Per-request view of one text: parses once and memoizes derived views"""
+    
+    def __init__(self, nlp, text):
+        self.nlp = nlp
+        self.text = text or ''
+    
+    @classmethod
+    def from_doc(cls, doc):
+        """Wrap an already-parsed Doc"""
+        context = cls(None, doc.text)
+        context.__dict__['doc'] = doc
+        return context
+    
+    @cached_property
+    def doc(self):
+        return self.nlp(self.text)
+    
+    @cached_property
+    def text_lower(self):
+        return self.text.lower()
+    
+    @cached_property
+    def tokens(self):
+        return [token for token in self.doc if not token.is_space and not token.is_punct]
+    
+    @cached_property
+    def words(self):
+        return [token for token in self.tokens if token.is_alpha]
+    
+    @cached_property
+    def sentences(self):
+        return list(self.doc.sents)
+    
+    @cached_property
+    def sentence_lengths(self):
+        return [len(sent.text.split()) for sent in self.sentences]
+    
+    @cached_property
+    def lemmas(self):
+        return [token.lemma_.lower() for token in self.words]
+    
+    @cached_property
+    def unique_lemmas(self):
+        return set(self.lemmas)
+    
+    @cached_property
+    def readability(self):
+        return {
+            'flesch_reading_ease': flesch_reading_ease(self.text),
+            'flesch_kincaid_grade': flesch_kincaid_grade(self.text),
+            'automated_readability_index': automated_readability_index(self.text)
+        }
+
+def _as_context(doc_or_context):
+    """Accept either a spaCy Doc or an AnalysisContext"""
+    if isinstance(doc_or_context, AnalysisContext):
+        return doc_or_context
+    return AnalysisContext.from_doc(doc_or_context)
+
+# The quiz prompt only includes this much of the generated content
+QUIZ_CONTEXT_CHARS = 2500
+
+# Section headings recognised while a response is still streaming, in the
+# same spirit as the patterns in _parse_content_sections: level-2 headings only
+_STREAM_HEADING = re.compile(r'^\s*##(?!#)\s*(.+?)\s*$')
+_STREAM_FENCE = re.compile(r'^\s*(```|~~~)')
+_STREAM_SECTIONS = [
+    ('explanation', 'explanation'),
+    ('example', 'examples'),
+    ('exercise', 'exercises'),
+    ('tip', 'tips')
+]
+
+class StreamingSectionParser:
+    """Split streamed markdown into sections as soon as each one is complete.
+
+    A section is complete when the next known section heading arrives (or
+    the stream ends), so EXPLANATION can be shown while later sections are
+    still generating. Other headings, and anything inside code fences, are
+    kept as content of the current section.
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._current = None
+        self._lines = []
+        self._in_fence = False
+
+    @staticmethod
+    def _section_for(heading):
+        heading = heading.lower()
+        for keyword, section in _STREAM_SECTIONS:
+            if re.search(rf'\b{keyword}', heading):
+                return section
+        return None
+
+    def _close(self):
+        closed = None
+        if self._current and self._lines:
+            text = '\n'.join(self._lines).strip()
+            if text:
+                closed = (self._current, text)
+        self._lines = []
+        return closed
+
+    def _consume_line(self, line):
+        if _STREAM_FENCE.match(line):
+            self._in_fence = not self._in_fence
+        elif not self._in_fence:
+            match = _STREAM_HEADING.match(line)
+            section = self._section_for(match.group(1)) if match else None
+            if section:
+                closed = self._close()
+                self._current = section
+                return closed
+        self._lines.append(line)
+        return None
+
+    def feed(self, text):
+        """Add streamed text; returns the (section, content) pairs it completed"""
+        self._pending += text
+        *lines, self._pending = self._pending.split('\n')
+        completed = [self._consume_line(line) for line in lines]
+        return [section for section in completed if section]
+
+    def finish(self):
+        """Flush the last section at the end of the stream"""
+        completed = []
+        if self._pending:
+            completed.append(self._consume_line(self._pending))
+            self._pending = ''
+        completed.append(self._close())
+        return [section for section in completed if section]
+
 class AdvancedEducationalNLP:
     """Advanced Educational NLP Processor using spaCy Large Model"""
     
-    def __init__(self, model_name='en_core_web_md'):
-        """Initialize with large spaCy model for better performance"""
-        try:
-            self.nlp = spacy.load(model_name)
-            self.setup_educational_patterns()
-            logger.info(f"✅ Loaded spaCy model: {model_name}")
-        except OSError:
-            logger.error(f"❌ spaCy model {model_name} not found. Install with: python -m spacy download {model_name}")
-            try:
-                self.nlp = spacy.load('en_core_web_sm')
-                self.setup_educational_patterns()
-                logger.info("⚠️ Loaded fallback spaCy model: en_core_web_sm")
-            except OSError:
-                self.nlp = None
-                logger.error("❌ No spaCy model available")
+    def __init__(self, model_name='en_core_web_md', pipeline=None):
+        """Initialize with a shared spaCy pipeline (loaded once per process, on first use)"""
+        self.pipeline = pipeline or LazyPipeline([model_name, 'en_core_web_sm'], spacy_registry)
+        self.setup_educational_patterns()
         
         # ✅ ADD THIS: Initialize AI quiz generator
         self.ai_quiz_generator = SimpleAIQuizGenerator()
         logger.info("✅ Initialized AI Quiz Generator")
 
+    @property
+    def nlp(self):
+        return self.pipeline.nlp
+
     def setup_educational_patterns(self):
         """Setup educational-specific patterns and rules"""
         self.skill_indicators = {
@@ -90,31 +221,32 @@ class AdvancedEducationalNLP:
             'reading': ['text', 'document', 'written', 'article', 'book', 'literature', 'study']
         }
 
-    def comprehensive_content_analysis(self, content, target_level='intermediate', learning_style='visual', subject='general'):
+    def comprehensive_content_analysis(self, content, target_level='intermediate', learning_style='visual', subject='general', context=None):
         """Comprehensive content analysis using spaCy large model"""
         if not self.nlp or not content:
             return self.basic_fallback_analysis(content)
 
         try:
-            doc = self.nlp(content)
+            # Parse once; every stage below reads the memoized views
+            context = context or AnalysisContext(self.nlp, content)
             
             # Core linguistic analysis
-            linguistic_analysis = self.analyze_linguistics(doc)
+            linguistic_analysis = self.analyze_linguistics(context)
             
             # Educational content analysis
-            educational_analysis = self.analyze_educational_content(doc, target_level, subject)
+            educational_analysis = self.analyze_educational_content(context, target_level, subject)
             
             # Learning style alignment
-            style_analysis = self.analyze_learning_style_alignment(doc, learning_style)
+            style_analysis = self.analyze_learning_style_alignment(context, learning_style)
             
             # Content quality assessment
-            quality_analysis = self.assess_content_quality(doc, target_level)
+            quality_analysis = self.assess_content_quality(context, target_level)
             
             # Key concepts extraction
-            concepts = self.extract_key_concepts_advanced(doc, subject)
+            concepts = self.extract_key_concepts_advanced(context, subject)
             
             # Generate insights
-            insights = self.generate_content_insights(doc, target_level, learning_style, subject)
+            insights = self.generate_content_insights(context, target_level, learning_style, subject)
             
             return {
                 'linguistic': linguistic_analysis,
@@ -133,9 +265,10 @@ class AdvancedEducationalNLP:
 
     def analyze_linguistics(self, doc):
         """Advanced linguistic analysis using spaCy large model"""
-        sentences = list(doc.sents)
-        tokens = [token for token in doc if not token.is_space and not token.is_punct]
-        words = [token for token in tokens if token.is_alpha]
+        context = _as_context(doc)
+        doc = context.doc
+        sentences = context.sentences
+        words = context.words
         
         total_words = len(words)
         if total_words == 0:
@@ -158,24 +291,19 @@ class AdvancedEducationalNLP:
             })
 
         # Readability metrics using corrected imports
-        text = doc.text
-        readability = {
-            'flesch_reading_ease': flesch_reading_ease(text),
-            'flesch_kincaid_grade': flesch_kincaid_grade(text),
-            'automated_readability_index': automated_readability_index(text)
-        }
+        readability = dict(context.readability)
 
         return {
             'word_count': len(words),
             'sentence_count': len(sentences),
             'avg_words_per_sentence': len(words) / max(len(sentences), 1),
-            'avg_sentence_length': np.mean([len(sent.text.split()) for sent in sentences]) if sentences else 0,
-            'lexical_diversity': len(set([token.lemma_.lower() for token in words])) / max(len(words), 1),
+            'avg_sentence_length': np.mean(context.sentence_lengths) if sentences else 0,
+            'lexical_diversity': len(context.unique_lemmas) / max(len(words), 1),
             'pos_distribution': pos_distribution,
             'dependency_distribution': dict(dep_counts.most_common(10)),
             'named_entities': dict(entities),
             'readability': readability,
-            'unique_words': len(set([token.lemma_.lower() for token in words])),
+            'unique_words': len(context.unique_lemmas),
             'complex_words': len([token for token in words if len(token.text) > 6])
         }
 
@@ -235,8 +363,9 @@ class AdvancedEducationalNLP:
 
     def analyze_educational_content(self, doc, target_level, subject):
         """Analyze content from educational perspective"""
-        words = [token for token in doc if token.is_alpha]
-        text_lower = doc.text.lower()
+        context = _as_context(doc)
+        words = context.words
+        text_lower = context.text_lower
         
         # Calculate concept complexity
         complexity_indicators = self.skill_indicators.get(target_level, self.skill_indicators['intermediate'])
@@ -266,7 +395,8 @@ class AdvancedEducationalNLP:
 
     def analyze_learning_style_alignment(self, doc, learning_style):
         """Analyze how well content aligns with learning style"""
-        text_lower = doc.text.lower()
+        context = _as_context(doc)
+        text_lower = context.text_lower
         
         # Count learning style indicators
         style_keywords = self.learning_style_keywords.get(learning_style, [])
@@ -274,7 +404,7 @@ class AdvancedEducationalNLP:
         style_indicator_count = len(style_indicators)
         
         # Calculate alignment score
-        words = [token for token in doc if token.is_alpha]
+        words = context.words
         alignment_score = min(style_indicator_count / max(len(words) * 0.1, 1), 1.0)
         
         # Boost score based on learning style specific patterns
@@ -300,21 +430,21 @@ class AdvancedEducationalNLP:
 
     def assess_content_quality(self, doc, target_level):
         """Assess overall content quality"""
-        words = [token for token in doc if token.is_alpha]
-        sentences = list(doc.sents)
+        context = _as_context(doc)
+        words = context.words
         
         # Structure quality (balanced sentence lengths)
-        sentence_lengths = [len(sent.text.split()) for sent in sentences]
+        sentence_lengths = context.sentence_lengths
         avg_sentence_length = np.mean(sentence_lengths) if sentence_lengths else 0
         length_variance = np.var(sentence_lengths) if len(sentence_lengths) > 1 else 0
         structure_score = max(0, 1 - (length_variance / 100))  # Penalize high variance
         
         # Vocabulary richness
-        unique_lemmas = set([token.lemma_.lower() for token in words])
+        unique_lemmas = context.unique_lemmas
         vocabulary_richness = len(unique_lemmas) / max(len(words), 1)
         
         # Readability appropriateness for target level
-        readability = flesch_reading_ease(doc.text)
+        readability = context.readability['flesch_reading_ease']
         readability_targets = {
             'beginner': (60, 100),    # Easy to very easy
             'intermediate': (30, 70), # Fairly difficult to standard
@@ -345,6 +475,8 @@ class AdvancedEducationalNLP:
 
     def extract_key_concepts_advanced(self, doc, subject):
         """Extract key concepts from content"""
+        context = _as_context(doc)
+        doc = context.doc
         concepts = []
         
         # Extract from named entities
@@ -374,7 +506,7 @@ class AdvancedEducationalNLP:
         
         # Extract subject-specific terms
         subject_terms = self.subject_keywords.get(subject, [])
-        text_lower = doc.text.lower()
+        text_lower = context.text_lower
         for term in subject_terms:
             if term in text_lower:
                 concepts.append({
@@ -396,17 +528,18 @@ class AdvancedEducationalNLP:
 
     def generate_content_insights(self, doc, target_level, learning_style, subject):
         """Generate insights about the content"""
+        context = _as_context(doc)
         insights = []
         
         # Content length insights
-        word_count = len([token for token in doc if token.is_alpha])
+        word_count = len(context.words)
         if word_count < 100:
             insights.append("Content is quite brief - consider expanding key concepts")
         elif word_count > 1000:
             insights.append("Comprehensive content - consider breaking into sections")
         
         # Complexity insights
-        readability = flesch_reading_ease(doc.text)
+        readability = context.readability['flesch_reading_ease']
         if readability > 70 and target_level == 'expert':
             insights.append("Content may be too simple for expert level")
         elif readability < 30 and target_level == 'beginner':
@@ -414,7 +547,7 @@ class AdvancedEducationalNLP:
         
         # Learning style insights
         style_keywords = self.learning_style_keywords.get(learning_style, [])
-        style_matches = sum(1 for keyword in style_keywords if keyword in doc.text.lower())
+        style_matches = sum(1 for keyword in style_keywords if keyword in context.text_lower)
         if style_matches == 0:
             insights.append(f"Consider adding {learning_style}-friendly elements")
         
@@ -473,24 +606,25 @@ class AdvancedEducationalNLP:
 
     # ========== CONTENT ENHANCEMENT METHODS ==========
     
-    def enhance_content_for_learning_style(self, content, learning_style, difficulty_level):
+    def enhance_content_for_learning_style(self, content, learning_style, difficulty_level, context=None):
         """Enhance content based on learning style using NLP analysis"""
         if not self.nlp or not content:
             return content
         
         try:
-            doc = self.nlp(content)
+            # Lazy context: the Doc is only parsed if an enhancer actually reads it
+            context = context or AnalysisContext(self.nlp, content)
             enhanced_content = content
             
             # Learning style specific enhancements
             if learning_style == 'visual':
-                enhanced_content = self._add_visual_structure(content, doc)
+                enhanced_content = self._add_visual_structure(content, context)
             elif learning_style == 'auditory':
-                enhanced_content = self._add_auditory_cues(content, doc)
+                enhanced_content = self._add_auditory_cues(content, context)
             elif learning_style == 'kinesthetic':
-                enhanced_content = self._add_kinesthetic_elements(content, doc)
+                enhanced_content = self._add_kinesthetic_elements(content, context)
             elif learning_style == 'reading':
-                enhanced_content = self._add_reading_structure(content, doc)
+                enhanced_content = self._add_reading_structure(content, context)
             
             # Adjust complexity based on difficulty level
             enhanced_content = self._adjust_content_complexity(enhanced_content, difficulty_level)
@@ -501,7 +635,7 @@ class AdvancedEducationalNLP:
             logger.error(f"Content enhancement error: {e}")
             return content
 
-    def _add_visual_structure(self, content, doc):
+    def _add_visual_structure(self, content, context):
         """Add visual structure markers for visual learners"""
         # Add emojis and visual markers to headers
         enhanced = re.sub(r'^##\s*([^#\n]+)', r'🎯 ## \1', content, flags=re.MULTILINE)
@@ -512,7 +646,7 @@ class AdvancedEducationalNLP:
         
         return enhanced
 
-    def _add_auditory_cues(self, content, doc):
+    def _add_auditory_cues(self, content, context):
         """Add auditory-friendly cues"""
         # Add emphasis markers for better rhythm when read aloud
         enhanced = re.sub(r'(\. )([A-Z])', r'\1\n🎵 \2', content)
@@ -520,7 +654,7 @@ class AdvancedEducationalNLP:
         
         return enhanced
 
-    def _add_kinesthetic_elements(self, content, doc):
+    def _add_kinesthetic_elements(self, content, context):
         """Add hands-on elements for kinesthetic learners"""
         # Add action-oriented language and practice prompts
         enhanced = content.replace('understand', 'practice and understand')
@@ -536,7 +670,7 @@ class AdvancedEducationalNLP:
         
         return '\n\n'.join(enhanced_sections)
 
-    def _add_reading_structure(self, content, doc):
+    def _add_reading_structure(self, content, context):
         """Enhance structure for reading learners"""
         # Add detailed structure and reading guides
         enhanced = content.replace('\n##', '\n\n📚 Reading Guide:\n##')
@@ -558,20 +692,26 @@ class AdvancedEducationalNLP:
             
         return content
     
-    def generate_educational_content(self, topic, difficulty_level='intermediate', learning_style='visual', content_type='explanation', subject='general'):
-        """Generate complete educational content using NLP and LLM integration"""
+    def generate_educational_content(self, topic, difficulty_level='intermediate', learning_style='visual', content_type='explanation', subject='general', on_stage=None, stream=False):
+        """Generate complete educational content using NLP and LLM integration.
+
+        on_stage(name, data), if given, is called as each stage finishes
+        ("content", "sections", "analysis") so callers can publish partial results.
+        With stream=True the LLM response is streamed and on_stage also gets
+        "delta" for every chunk and "section" for every section as it completes.
+        """
+        on_stage = on_stage or (lambda name, data: None)
         
         try:
-            # Import the LLM library (add this at the top of your file if not already there)
-            import google.generativeai as genai
-            
             # Create comprehensive prompt based on NLP analysis
             prompt = self._create_content_prompt(topic, difficulty_level, learning_style, content_type, subject)
             
             # Generate content using LLM
             logger.info(f"🎯 Generating {content_type} content for {topic} ({difficulty_level} level)")
-            response = genai.GenerativeModel('gemini-2.5-flash').generate_content(prompt)
-            raw_content = response.text.strip()
+            if stream:
+                raw_content = self._stream_content(prompt, on_stage).strip()
+            else:
+                raw_content = llm_client.generate(prompt).strip()
             
             if not raw_content:
                 logger.error("LLM returned empty content")
@@ -579,16 +719,19 @@ class AdvancedEducationalNLP:
             
             # Enhance content using NLP analysis
             enhanced_content = self.enhance_content_for_learning_style(raw_content, learning_style, difficulty_level)
+            on_stage("content", {"enhanced_content": enhanced_content})
             
             # Parse content into sections using NLP
             parsed_sections = self._parse_content_sections(enhanced_content)
+            on_stage("sections", parsed_sections)
             
-            # Analyze the generated content
+            # Analyze the generated content (single parse of the final text)
             content_analysis = self.comprehensive_content_analysis(
                 enhanced_content, 
                 target_level=difficulty_level,
                 learning_style=learning_style,
-                subject=subject
+                subject=subject,
+                context=AnalysisContext(self.nlp, enhanced_content)
             )
             
             # Create final content structure
@@ -611,6 +754,14 @@ class AdvancedEducationalNLP:
                 'generated_at': datetime.now().isoformat()
             }
             
+            on_stage("analysis", {
+                'word_count': content_result['word_count'],
+                'readability_score': content_result['readability_score'],
+                'quality_score': content_result['quality_score'],
+                'overall_score': content_analysis.get('overall_score'),
+                'key_concepts': content_analysis.get('key_concepts', [])
+            })
+            
             logger.info(f"✅ Generated {len(enhanced_content.split())} words of {difficulty_level} content for {topic}")
             return content_result
             
@@ -618,6 +769,19 @@ class AdvancedEducationalNLP:
             logger.error(f"Content generation failed: {e}")
             return self._generate_fallback_content(topic, difficulty_level, learning_style, subject)
     
+    def _stream_content(self, prompt, on_stage):
+        """Stream the LLM response, publishing text and finished sections as they arrive"""
+        parser = StreamingSectionParser()
+        chunks = []
+        for text in llm_client.stream(prompt):
+            chunks.append(text)
+            on_stage("delta", {"text": text})
+            for name, content in parser.feed(text):
+                on_stage("section", {"name": name, "content": content})
+        for name, content in parser.finish():
+            on_stage("section", {"name": name, "content": content})
+        return ''.join(chunks)
+    
     def _create_content_prompt(self, topic, difficulty_level, learning_style, content_type, subject):
         """Create optimized prompt for content generation"""
         
@@ -969,16 +1133,20 @@ class SimpleAIQuizGenerator:
     def generate_ai_quiz(self, generated_content, topic, difficulty_level, num_questions=18):
         """Generate quiz using only AI - Simple and effective"""
         try:
-            if not self.genai:
+            if not self.genai and llm_client.backend.name == "gemini":
                 return self._generate_simple_fallback_quiz(num_questions, difficulty_level, topic)
             
             logger.info(f"🎯 Generating {num_questions} AI questions for {topic} at {difficulty_level} level")
             
+            if generated_content:
+                source = f"GENERATED EDUCATIONAL CONTENT TO BASE QUESTIONS ON:\n{generated_content[:QUIZ_CONTEXT_CHARS]}"
+            else:
+                source = f"No content is provided; base the questions on the core concepts of {topic}."
+            
             prompt = f"""
 Create a {num_questions}-question multiple choice quiz about "{topic}" for {difficulty_level} level students.
 
-GENERATED EDUCATIONAL CONTENT TO BASE QUESTIONS ON:
-{generated_content[:2500]}
+{source}
 
 REQUIREMENTS:
 - Generate exactly {num_questions} questions based on the content above
@@ -1008,10 +1176,10 @@ OUTPUT FORMAT (JSON Array):
 Generate exactly {num_questions} questions in this JSON format.
 """
 
-            response = self.genai.GenerativeModel('gemini-2.5-flash').generate_content(prompt)
+            response_text = llm_client.generate(prompt)
             
             # Parse and process AI response
-            questions = self._parse_ai_response(response.text, topic, difficulty_level)
+            questions = self._parse_ai_response(response_text, topic, difficulty_level)
             
             if questions and len(questions) >= 5:
                 logger.info(f"✅ AI generated {len(questions)} questions for {topic}")
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import random
+import re
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "what", "which", "when", "where", "does", "following", "about", "that", "this",
+    "with", "from", "into", "there", "their", "they", "have", "would", "could",
+    "should", "most", "best", "true", "false", "your", "these", "those", "than"
+}
+QUESTION_FIELDS = ["question", "choices", "answer", "explanation"]
+
+
+def topic_key(topic):
+    """Case- and whitespace-insensitive topic name"""
+    return re.sub(r"\s+", " ", str(topic or "")).strip().lower()
+
+
+def bucket_key(topic, difficulty, choices, language="English"):
+    """Questions are interchangeable only within one topic/difficulty/choice-count/language bucket"""
+    return f"{topic_key(topic)}|{difficulty}|{int(choices)}|{str(language).lower()}"
+
+
+def question_id(bucket, question):
+    """Stable id, so the same question generated twice is stored once"""
+    text = re.sub(r"\W+", " ", question["question"].lower()).strip()
+    return hashlib.sha1(f"{bucket}|{text}".encode("utf-8")).hexdigest()
+
+
+def keywords(text, limit=8):
+    words = re.findall(r"[a-z][a-z0-9+#-]{3,}", text.lower())
+    seen = []
+    for word in words:
+        if word not in STOPWORDS and word not in seen:
+            seen.append(word)
+    return seen[:limit]
+
+
+class QuestionBank:
+    """Validated questions stored per bucket and reused across students.
+
+    A quiz request is assembled from its bucket, skipping questions the
+    student has already answered and preferring the least-served ones, so
+    the common case is one indexed read. Buckets running low are topped up
+    by a background job instead of on the request path.
+    """
+
+    def __init__(self, collection, low_water=None):
+        self.collection = collection
+        self.low_water = low_water
+
+    def add(self, questions, topic, category, difficulty, choices, language="English", source=None, key=None):
+        """Store validated questions; returns how many were new.
+
+        key is the canonical topic key used for bucketing (defaults to topic).
+        """
+        bucket = bucket_key(key or topic, difficulty, choices, language)
+        now = datetime.now(timezone.utc)
+        added = 0
+        for question in questions:
+            if not all(question.get(field) for field in QUESTION_FIELDS):
+                continue
+            doc = {field: question[field] for field in QUESTION_FIELDS}
+            doc.update({
+                "bucket": bucket,
+                "topic": topic,
+                "topic_key": key or topic_key(topic),
+                "category": category,
+                "difficulty": difficulty,
+                "choices_count": int(choices),
+                "language": language,
+                "keywords": keywords(question["question"]),
+                "source": source,
+                "served_count": 0,
+                "created_at": now
+            })
+            result = self.collection.update_one(
+                {"_id": question_id(bucket, question)},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            upserted = result.get("upserted_id") if isinstance(result, dict) else result.upserted_id
+            if upserted is not None:
+                added += 1
+        return added
+
+    def assemble(self, topic, difficulty, choices, count, language="English", exclude_ids=()):
+        """Pick `count` unseen questions from the bank, or None if it cannot fill the quiz.
+
+        Returns (questions, question_ids, remaining) where remaining is how many
+        unseen questions the bucket still holds for this student.
+        """
+        bucket = bucket_key(topic, difficulty, choices, language)
+        query = {"bucket": bucket}
+        if exclude_ids:
+            query["_id"] = {"$nin": list(exclude_ids)}
+
+        # Least-served first, with some headroom to shuffle so quizzes differ
+        candidates = list(
+            self.collection.find(query, {field: 1 for field in QUESTION_FIELDS + ["served_count"]})
+            .sort("served_count", 1)
+            .limit(count * 3)
+        )
+        if len(candidates) < count:
+            return None
+
+        picked = random.sample(candidates, count)
+        ids = [doc["_id"] for doc in picked]
+        self.collection.update_many({"_id": {"$in": ids}}, {"$inc": {"served_count": 1}})
+
+        questions = [{field: doc[field] for field in QUESTION_FIELDS} for doc in picked]
+        remaining = len(candidates) - count if len(candidates) < count * 3 else None
+        return questions, ids, remaining
+
+    def needs_top_up(self, remaining, count):
+        """remaining is None when the bucket held plenty beyond the candidate window"""
+        low_water = self.low_water or count * 2
+        return remaining is not None and remaining < low_water
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class MongoCacheBackend:
+    """Second cache tier stored in a MongoDB (or mock) collection.
+
+    get() returns (value, expires_at_ts) so the local tier never outlives it.
+    """
+
+    def __init__(self, collection, namespace):
+        self.collection = collection
+        self.namespace = namespace
+
+    def get(self, key):
+        doc = self.collection.find_one({"_id": f"{self.namespace}:{key}"})
+        if not doc:
+            return None
+        expires_at_ts = doc.get("expires_at_ts", 0)
+        if expires_at_ts < time() or doc.get("value") is None:
+            return None
+        return doc["value"], expires_at_ts
+
+    def set(self, key, value, ttl_seconds):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)
+        self.collection.update_one(
+            {"_id": f"{self.namespace}:{key}"},
+            {"$set": {
+                "namespace": self.namespace,
+                "value": value,
+                "expires_at": expires_at,  # TTL index target for real MongoDB
+                "expires_at_ts": expires_at.timestamp()
+            }},
+            upsert=True
+        )
+
+
+class DiskCacheBackend:
+    """Second cache tier stored as one JSON file per key; get() returns (value, expires_at_ts)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        expires_at_ts = entry.get("expires_at_ts", 0)
+        if expires_at_ts < time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        if entry.get("value") is None:
+            return None
+        return entry["value"], expires_at_ts
+
+    def set(self, key, value, ttl_seconds):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"value": value, "expires_at_ts": time() + ttl_seconds}, f)
+        os.replace(tmp_path, path)  # Atomic so readers never see a partial file
+
+
+class ResponseCache:
+    """Content-addressed cache for expensive LLM responses.
+
+    Entries are keyed by a hash of the request fields that determine the
+    prompt. Lookups go to an in-process LRU with TTL first and then to an
+    optional persistent tier (Mongo or disk) that is shared across workers.
+    """
+
+    def __init__(self, name, max_entries=512, ttl_seconds=86400, backend=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "backend_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(**fields):
+        """Build a stable hash from the fields that shape the prompt"""
+        canonical = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+
+        if self.backend is not None:
+            try:
+                found = self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️ {self.name} cache backend read failed: {e}")
+                found = None
+                with self._lock:
+                    self._stats["errors"] += 1
+            if found is not None:
+                value, expires_at_ts = found
+                with self._lock:
+                    self._stats["backend_hits"] += 1
+                    # Keep the backend's expiry, not a fresh TTL
+                    self._store_local(key, value, min(expires_at_ts, now + self.ttl_seconds))
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._stats["sets"] += 1
+            self._store_local(key, value, time() + self.ttl_seconds)
+
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"⚠️ {self.name} cache backend write failed: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+
+    def _store_local(self, key, value, expires_at):
+        """Insert into the LRU; caller must hold the lock"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["backend_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["backend_hits"]) / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["backend"] = type(self.backend).__name__ if self.backend else None
+        return stats
+
+
+def build_response_cache(name, collection=None):
+    """Create a cache configured from <NAME>_CACHE_* environment variables"""
+    prefix = f"{name.upper()}_CACHE"
+    max_entries = int(os.getenv(f"{prefix}_MAX_ENTRIES", 512))
+    ttl_seconds = int(os.getenv(f"{prefix}_TTL_SECONDS", 86400))
+    backend_kind = os.getenv(f"{prefix}_BACKEND", "").lower()
+
+    backend = None
+    if backend_kind == "mongo":
+        if collection is not None:
+            backend = MongoCacheBackend(collection, namespace=name)
+        else:
+            logger.warning(f"⚠️ {prefix}_BACKEND is 'mongo' but no cache collection is available, using in-process cache only")
+            backend_kind = ""
+    elif backend_kind == "disk":
+        backend = DiskCacheBackend(os.getenv(f"{prefix}_DIR", os.path.join("cache", name)))
+    elif backend_kind:
+        logger.warning(f"⚠️ Unknown {prefix}_BACKEND '{backend_kind}', using in-process cache only")
+
+    logger.info(f"✅ {name} response cache ready (max={max_entries}, ttl={ttl_seconds}s, backend={backend_kind or 'memory'})")
+    return ResponseCache(name, max_entries=max_entries, ttl_seconds=ttl_seconds, backend=backend)
@@ -0,0 +1,223 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Values under these keys never reach a log line
+SENSITIVE_KEYS = {
+    "password", "password_hash", "passwordhash", "token", "access_token", "refresh_token",
+    "authorization", "jwt", "secret", "api_key", "apikey", "cookie"
+}
+REDACTED = "[REDACTED]"
+_KEY_ALTERNATION = "|".join(sorted(SENSITIVE_KEYS, key=len, reverse=True))
+# Each pattern captures (prefix, quote, secret); only the secret is replaced
+_SENSITIVE_TEXT = [
+    # Quoted values in repr()/JSON text, e.g. {'password_hash': 'scrypt:...'}
+    re.compile(r"""(?i)(['"]?(?:%s)['"]?\s*[:=]\s*)(['"])(.*?)\2""" % _KEY_ALTERNATION),
+    # Query strings and form bodies, e.g. ?token=abc&x=1
+    re.compile(r"(?i)((?:%s)=)()([^&\s'\"]+)" % _KEY_ALTERNATION),
+    re.compile(r"(?i)(bearer\s+)()([A-Za-z0-9._~+/=-]+)"),
+    re.compile(r"()()((?:pbkdf2|scrypt):[A-Za-z0-9:$./+=]+)"),  # werkzeug password hashes
+]
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_state = {"listener": None, "handler": None, "configured": False}
+_lock = threading.Lock()
+
+
+def redact(value):
+    """Copy of a structure with sensitive keys masked; strings are scrubbed too"""
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in SENSITIVE_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def redact_text(text):
+    for pattern in _SENSITIVE_TEXT:
+        text = pattern.sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}{m.group(2)}", text)
+    return text
+
+
+def _parse_pairs(spec):
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pairs = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def _longest_prefix(name, table):
+    """Value for the most specific logger prefix in table (None if no match)"""
+    while name:
+        if name in table:
+            return table[name]
+        name = name.rpartition(".")[0]
+    return None
+
+
+class RedactingFilter(logging.Filter):
+    """Mask secrets in the rendered message and in structured fields"""
+
+    def filter(self, record):
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            record.fields = redact(fields)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of high-volume records below WARNING.
+
+    rates maps logger names (or prefixes) to the fraction kept; warnings and
+    errors always pass so sampling never hides a problem.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = _longest_prefix(record.name, self.rates)
+        if rate is None or rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields merged in"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for development; structured fields are appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread; drops them instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener(handler, output):
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    _state["listener"] = listener
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork; each worker needs its own
+    listener = _state["listener"]
+    if listener is None:
+        return
+    _state["handler"].queue = queue.Queue(maxsize=_state["handler"].queue.maxsize)
+    _start_listener(_state["handler"], listener.handlers[0])
+
+
+def _stop_listener():
+    listener = _state["listener"]
+    if listener is not None and listener._thread is not None:
+        listener.stop()  # Flushes whatever is still queued
+
+
+def configure_logging():
+    """Install the queue-backed root handler once, configured from LOG_* variables.
+
+    LOG_LEVEL            root level (default INFO)
+    LOG_LEVELS           per-logger levels, e.g. "db=WARNING,services.job_queue=DEBUG"
+    LOG_FORMAT           text (default) or json
+    LOG_SAMPLE_RATES     fraction of sub-WARNING records kept per logger, e.g. "http.requests=0.1"
+    LOG_QUEUE_SIZE       records buffered before new ones are dropped (default 10000)
+    """
+    with _lock:
+        if _state["configured"]:
+            return
+        _state["configured"] = True
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json" else TextFormatter())
+
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+        rates = {name: float(rate) for name, rate in _parse_pairs(os.getenv("LOG_SAMPLE_RATES", "http.requests=0.1")).items()}
+        handler.addFilter(SamplingFilter(rates))
+        handler.addFilter(RedactingFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        for name, level in _parse_pairs(os.getenv("LOG_LEVELS")).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _state["handler"] = handler
+        _start_listener(handler, output)
+        atexit.register(_stop_listener)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def logging_stats():
+    """Queue depth and drop counters for /api/health"""
+    handler = _state["handler"]
+    if handler is None:
+        return {"configured": False}
+    sampler = next((f for f in handler.filters if isinstance(f, SamplingFilter)), None)
+    return {
+        "configured": True,
+        "queued": handler.queue.qsize(),
+        "dropped_queue_full": handler.dropped,
+        "dropped_sampled": sampler.dropped if sampler else 0
+    }
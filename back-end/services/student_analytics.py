@@ -0,0 +1,134 @@
+import copy
+from datetime import datetime, timezone, timedelta
+
+from services.feature_store import FeatureStore
+
+# Bump when the snapshot layout changes; stale snapshots are rebuilt on read
+SNAPSHOT_SCHEMA = 1
+
+RECENT_LIMIT = 10
+DIFFICULTIES = ["beginner", "intermediate", "pro"]
+
+
+def attempt_percentage(attempt):
+    """Stored percentage, or one computed from the raw score"""
+    percentage = attempt.get("percentage")
+    if percentage is None:
+        score = attempt.get("score", {})
+        total = score.get("total", 1)
+        correct = score.get("correct", 0)
+        percentage = (correct / total) * 100 if total > 0 else 0
+    return percentage
+
+
+def _attempt_date(submitted):
+    if hasattr(submitted, "date"):
+        return submitted.date()
+    if isinstance(submitted, str):
+        try:
+            return datetime.fromisoformat(submitted.replace("Z", "+00:00")).date()
+        except ValueError:
+            return None
+    return None
+
+
+def _recency_key(entry):
+    submitted = entry.get("submitted_at")
+    if not isinstance(submitted, datetime):
+        return float("-inf")
+    if submitted.tzinfo is None:
+        submitted = submitted.replace(tzinfo=timezone.utc)
+    return submitted.timestamp()
+
+
+def empty_snapshot(user_id):
+    return {
+        "user_id": user_id,
+        "schema": SNAPSHOT_SCHEMA,
+        "version": 0,
+        "total_attempts": 0,
+        "total_questions": 0,
+        "total_correct": 0,
+        "recent": [],   # newest RECENT_LIMIT attempts, newest first
+        "topics": [],   # [{topic, attempts, total_score}] in first-seen order
+        "difficulty": {level: {"sum": 0, "count": 0, "first": None, "last": None} for level in DIFFICULTIES},
+        "streak_last_date": None,  # latest practice day and the run of consecutive days ending on it
+        "streak_days": 0
+    }
+
+
+def apply_attempt(snapshot, attempt):
+    """Return a new snapshot with one attempt folded in"""
+    snapshot = copy.deepcopy(snapshot)
+    score = attempt.get("score", {})
+    percentage = attempt_percentage(attempt)
+
+    snapshot["total_attempts"] += 1
+    snapshot["total_questions"] += score.get("total", 0)
+    snapshot["total_correct"] += score.get("correct", 0)
+
+    entry = {
+        "_id": str(attempt.get("_id")),
+        "topic": attempt.get("topic", "Unknown"),
+        "category": attempt.get("category", "General"),
+        "score": score,
+        "percentage": attempt.get("percentage"),
+        "difficulty": attempt.get("difficulty", "beginner"),
+        "submittedAt": attempt.get("submittedAt"),
+        "submitted_at": attempt.get("submitted_at")
+    }
+    recent = snapshot["recent"] + [entry]
+    recent.sort(key=_recency_key, reverse=True)
+    snapshot["recent"] = recent[:RECENT_LIMIT]
+
+    topic = attempt.get("topic", "General")
+    for row in snapshot["topics"]:
+        if row["topic"] == topic:
+            row["attempts"] += 1
+            row["total_score"] += percentage
+            break
+    else:
+        snapshot["topics"].append({"topic": topic, "attempts": 1, "total_score": percentage})
+
+    level = snapshot["difficulty"].get(attempt.get("difficulty", "beginner"))
+    if level is not None:
+        level["sum"] += percentage
+        level["count"] += 1
+        if level["first"] is None:
+            level["first"] = percentage
+        level["last"] = percentage
+
+    day = _attempt_date(attempt.get("submitted_at"))
+    if day is not None:
+        last = date_from_iso(snapshot["streak_last_date"])
+        if last is None or day > last:
+            consecutive = last is not None and day - last == timedelta(days=1)
+            snapshot["streak_days"] = snapshot["streak_days"] + 1 if consecutive else 1
+            snapshot["streak_last_date"] = day.isoformat()
+
+    return snapshot
+
+
+def build_snapshot(user_id, attempts):
+    snapshot = empty_snapshot(user_id)
+    for attempt in attempts:
+        snapshot = apply_attempt(snapshot, attempt)
+    return snapshot
+
+
+def date_from_iso(value):
+    return datetime.fromisoformat(value).date() if value else None
+
+
+def learning_streak(snapshot, today=None):
+    """Consecutive practice days ending today (0 if the student hasn't practiced today)"""
+    today = today or datetime.now().date()
+    return snapshot["streak_days"] if date_from_iso(snapshot["streak_last_date"]) == today else 0
+
+
+class StudentAnalyticsStore(FeatureStore):
+    """Per-student dashboard snapshot, kept current in O(1) per quiz submit"""
+
+    schema = SNAPSHOT_SCHEMA
+    build_state = staticmethod(build_snapshot)
+    apply_attempt = staticmethod(apply_attempt)
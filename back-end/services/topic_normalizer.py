@@ -0,0 +1,200 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Words that change how a topic is phrased, not what it is about
+FILLER_WORDS = {
+    "basic", "basics", "introduction", "intro", "fundamental", "fundamentals",
+    "overview", "tutorial", "guide", "beginner", "beginners", "concept", "concepts",
+    "learn", "learning", "understand", "understanding", "explain", "explanation"
+}
+# Used only without a spaCy pipeline, which otherwise supplies is_stop
+FALLBACK_STOPWORDS = {"a", "an", "and", "the", "in", "of", "on", "for", "to", "with", "using", "how", "what"}
+
+
+def _fallback_lemma(word):
+    """Crude plural stripping for when no spaCy pipeline is loaded"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+class TopicNormalizer:
+    """Map free-text topics onto canonical topic keys.
+
+    A topic's signature is the sorted set of its lemmatized content words,
+    so "React hooks", "react hooks basics" and "Hooks in React" all become
+    "hook react". A topic with a new signature is matched against known
+    ones by word-vector cosine similarity (when the model has vectors) and
+    must also share words with the match, so "Python lists" never collapses
+    into "Python dictionaries". Unmatched topics become new canonical keys.
+    Known keys are persisted, and before registering a new one a worker
+    picks up keys other workers created since it last looked, so a topic
+    registered elsewhere is matched instead of split into a second key.
+    """
+
+    # Overlap when reading recently created keys, for clock skew between workers
+    SYNC_MARGIN = timedelta(seconds=60)
+
+    def __init__(self, pipeline=None, collection=None, threshold=0.88, min_overlap=0.5, max_cached=4096):
+        self.pipeline = pipeline  # LazyPipeline; None falls back to regex tokens
+        self.collection = collection
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._resolved = OrderedDict()  # raw topic text -> canonical key
+        self._keys = {}  # signature -> {"tokens", "vector"}
+        self._loaded = False
+        self._synced_at = None
+        self._stats = {"lookups": 0, "exact": 0, "signature": 0, "similar": 0, "new": 0}
+
+    @property
+    def nlp(self):
+        return self.pipeline.nlp if self.pipeline is not None else None
+
+    @property
+    def has_vectors(self):
+        return bool(self.nlp is not None and self.nlp.vocab.vectors.shape[0])
+
+    # ------------------------------------------------------------------
+    # Signatures
+    # ------------------------------------------------------------------
+    def tokens(self, topic):
+        text = re.sub(r"\s+", " ", str(topic or "")).strip().lower()
+        if self.nlp is not None:
+            words = [
+                token.lemma_.lower() or token.lower_ for token in self.nlp(text)
+                if not (token.is_stop or token.is_punct or token.is_space)
+            ]
+        else:
+            words = [
+                _fallback_lemma(word) for word in re.findall(r"[a-z0-9+#.]+", text)
+                if word not in FALLBACK_STOPWORDS
+            ]
+        content = sorted({word for word in words if word and word not in FILLER_WORDS})
+        # A topic made only of filler words is still a topic
+        return content or sorted(set(words)) or [text]
+
+    def _vector(self, topic):
+        if not self.has_vectors:
+            return None
+        vector = self.nlp.make_doc(str(topic).lower()).vector
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    # ------------------------------------------------------------------
+    # Registry
+    # ------------------------------------------------------------------
+    def _read_keys(self, query):
+        started = datetime.now(timezone.utc)
+        for doc in self.collection.find(query, {"tokens": 1, "sample": 1}):
+            if doc["_id"] not in self._keys:
+                self._keys[doc["_id"]] = {"tokens": doc.get("tokens", []), "vector": self._vector(doc.get("sample", doc["_id"]))}
+        self._synced_at = started
+
+    def _load(self):
+        """Read the persisted keys once; caller holds the lock"""
+        if self._loaded or self.collection is None:
+            self._loaded = True
+            return
+        try:
+            self._read_keys({})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load topic keys: {e}")
+        self._loaded = True
+
+    def _sync(self):
+        """Pick up keys other workers created since the last read; caller holds the lock"""
+        if self.collection is None or self._synced_at is None:
+            return
+        try:
+            self._read_keys({"created_at": {"$gte": self._synced_at - self.SYNC_MARGIN}})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not refresh topic keys: {e}")
+
+    def _match(self, signature, tokens, vector):
+        if signature in self._keys:
+            return signature, "signature"
+        similar = self._most_similar(tokens, vector) if vector is not None else None
+        return (similar, "similar") if similar is not None else (None, None)
+
+    def _register(self, signature, tokens, topic, vector):
+        self._keys[signature] = {"tokens": tokens, "vector": vector}
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {"_id": signature},
+                {"$setOnInsert": {"tokens": tokens, "sample": topic, "created_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist topic key '{signature}': {e}")
+
+    def _most_similar(self, tokens, vector):
+        best, best_score = None, self.threshold
+        for signature, entry in self._keys.items():
+            if entry["vector"] is None or jaccard(tokens, entry["tokens"]) < self.min_overlap:
+                continue
+            score = float(np.dot(vector, entry["vector"]))
+            if score >= best_score:
+                best, best_score = signature, score
+        return best
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def canonical(self, topic):
+        """Canonical key for a topic, used by caches and the question bank"""
+        raw = str(topic or "")
+        with self._lock:
+            self._stats["lookups"] += 1
+            cached = self._resolved.get(raw)
+            if cached is not None:
+                self._resolved.move_to_end(raw)
+                self._stats["exact"] += 1
+                return cached
+            self._load()
+
+        tokens = self.tokens(raw)
+        signature = " ".join(tokens)
+        vector = self._vector(raw)
+
+        with self._lock:
+            key, outcome = self._match(signature, tokens, vector)
+            if key is None:
+                # Another worker may have registered this topic after our last read
+                self._sync()
+                key, outcome = self._match(signature, tokens, vector)
+            if key is None:
+                self._register(signature, tokens, raw, vector)
+                key, outcome = signature, "new"
+            self._stats[outcome] += 1
+            self._resolved[raw] = key
+            while len(self._resolved) > self.max_cached:
+                self._resolved.popitem(last=False)
+        return key
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["canonical_keys"] = len(self._keys)
+        merged = stats["exact"] + stats["signature"] + stats["similar"]
+        stats["hit_rate"] = round(merged / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["vectors"] = self.has_vectors
+        return stats